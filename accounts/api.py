@@ -0,0 +1,57 @@
+"""
+Accounts API.
+"""
+
+from typing import Optional
+from uuid import UUID
+
+from ninja import Router, Schema
+from ninja.decorators import decorate_view
+from ninja.errors import HttpError
+from ninja_jwt.settings import api_settings
+from core.etags import user_etag
+from .authentication import TokenRevocation
+from .models import UserProfile
+
+router = Router(tags=["auth"])
+
+PROFILE_FIELDS = ("display_name", "bio", "daily_study_goal_minutes", "learning_style")
+
+
+class ProfileSchema(Schema):
+    id: UUID
+    username: str
+    email: str
+    is_teacher: bool
+    is_student: bool
+    display_name: str = ""
+    bio: str = ""
+    daily_study_goal_minutes: Optional[int] = None
+    learning_style: Optional[str] = None
+
+
+@router.get("/me", response=ProfileSchema)
+@decorate_view(user_etag)
+def me(request):
+    """Profile of the authenticated user."""
+    user = request.auth.user
+    profile = UserProfile.objects.filter(user_id=user.pk, is_deleted=False).values(*PROFILE_FIELDS).first()
+    return {
+        "id": user.pk,
+        "username": user.username,
+        "email": user.email,
+        "is_teacher": user.is_teacher,
+        "is_student": user.is_student,
+        **(profile or {}),
+    }
+
+
+@router.post("/logout", response={204: None})
+def logout(request):
+    """Revoke the access token of the request until it expires."""
+    token = request.auth.token
+    jti = token.get(api_settings.JTI_CLAIM) if token is not None else None
+    if not jti:
+        raise HttpError(400, "このトークンは失効できません")
+    TokenRevocation.blacklist_token(jti, int(token["exp"]))
+    return 204, None
@@ -0,0 +1,181 @@
+"""
+JWT authentication with a cached principal.
+
+ninja_jwt.authentication.JWTAuth loads the user row on every request. CachedJWTAuth
+verifies the token signature locally and builds an AuthPrincipal from the claims
+plus a short-lived user snapshot (id, is_teacher, is_student, is_active) kept in a
+Redis hash. Revocation state lives in Redis as well, and the snapshot, the
+deactivated-user set, the token blacklist and the password-change marker are all
+read in one pipelined round trip. POST /auth/logout (accounts.api) blacklists the
+token of the request.
+
+The ORM user is loaded lazily, only when a view touches an attribute that is not
+part of the snapshot (or ``principal.user`` directly).
+"""
+
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpRequest
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from django_redis import get_redis_connection
+from ninja_jwt.authentication import JWTAuth
+from ninja_jwt.exceptions import AuthenticationFailed, InvalidToken
+from ninja_jwt.settings import api_settings
+
+User = get_user_model()
+
+KEY_PREFIX = "intellectual_partner:auth"
+SNAPSHOT_FIELDS = ("is_teacher", "is_student", "is_active")
+
+
+def get_principal_cache_timeout() -> int:
+    return settings.INTELLECTUAL_PARTNER_SETTINGS.get("AUTH_PRINCIPAL_CACHE_TIMEOUT", 60)
+
+
+class AuthKeys:
+    """Redis keys used by the cached principal."""
+
+    INACTIVE_USERS = f"{KEY_PREFIX}:inactive_users"
+    BLACKLISTED_TOKENS = f"{KEY_PREFIX}:blacklisted_jti"
+
+    @staticmethod
+    def snapshot(user_id: Any) -> str:
+        return f"{KEY_PREFIX}:user:{user_id}"
+
+    @staticmethod
+    def valid_after(user_id: Any) -> str:
+        return f"{KEY_PREFIX}:valid_after:{user_id}"
+
+
+class AuthPrincipal:
+    """
+    Lightweight authenticated user built from token claims and the cached snapshot.
+    Attributes outside the snapshot are delegated to the ORM user, loaded on first access.
+    It is not a model instance and cannot be used as a foreign key value: filter and
+    assign with ``user_id=principal.id`` (or pass ``principal.user``). ``id`` is a UUID,
+    like the primary key of the user model.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id: uuid.UUID, is_teacher: bool, is_student: bool, is_active: bool, token: Any = None):
+        self.id = user_id
+        self.is_teacher = is_teacher
+        self.is_student = is_student
+        self.is_active = is_active
+        self.token = token
+
+    @property
+    def pk(self) -> uuid.UUID:
+        return self.id
+
+    @cached_property
+    def user(self) -> Any:
+        """The full ORM user, loaded once per request."""
+        return User.objects.get(pk=self.id)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __str__(self) -> str:
+        return str(self.id)
+
+
+class TokenRevocation:
+    """Redis-backed revocation state shared by every API worker."""
+
+    @staticmethod
+    def get_client():
+        return get_redis_connection("default")
+
+    @staticmethod
+    def blacklist_token(jti: str, expires_at: int) -> None:
+        """Revoke a single access token until it would have expired anyway."""
+        client = TokenRevocation.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(AuthKeys.BLACKLISTED_TOKENS, {jti: expires_at})
+        # Expired tokens are rejected by signature checks, drop them from the set
+        pipe.zremrangebyscore(AuthKeys.BLACKLISTED_TOKENS, "-inf", int(time.time()))
+        pipe.execute()
+
+    @staticmethod
+    def sync_user(user: Any, password_changed: bool = False) -> None:
+        """Refresh revocation state after a user row changed."""
+        client = TokenRevocation.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.delete(AuthKeys.snapshot(user.pk))
+        if user.is_active:
+            pipe.srem(AuthKeys.INACTIVE_USERS, str(user.pk))
+        else:
+            pipe.sadd(AuthKeys.INACTIVE_USERS, str(user.pk))
+        if password_changed:
+            # Tokens issued up to the second of the change are rejected until they expire
+            lifetime = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+            pipe.set(AuthKeys.valid_after(user.pk), int(time.time()), ex=lifetime)
+        pipe.execute()
+
+
+class CachedJWTAuth(JWTAuth):
+    """JWTAuth that avoids a user SELECT on every authenticated request."""
+
+    def jwt_authenticate(self, request: HttpRequest, token: str) -> Any:
+        validated_token = self.get_validated_token(token)
+        principal = self.get_principal(validated_token)
+        request.user = principal
+        return principal
+
+    def get_principal(self, validated_token: Any) -> AuthPrincipal:
+        try:
+            user_id = uuid.UUID(str(validated_token[api_settings.USER_ID_CLAIM]))
+        except (KeyError, ValueError) as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        client = TokenRevocation.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.hgetall(AuthKeys.snapshot(user_id))
+        pipe.sismember(AuthKeys.INACTIVE_USERS, str(user_id))
+        pipe.get(AuthKeys.valid_after(user_id))
+        if jti:
+            pipe.zscore(AuthKeys.BLACKLISTED_TOKENS, jti)
+        snapshot, is_inactive, valid_after, *blacklisted = pipe.execute()
+
+        if is_inactive:
+            raise AuthenticationFailed(_("User is inactive"))
+        if blacklisted and blacklisted[0] is not None:
+            raise AuthenticationFailed(_("Token is blacklisted"))
+        # iat has a one-second resolution: a token from the second of the change may predate it
+        if valid_after is not None and int(validated_token.get("iat", 0)) <= int(valid_after):
+            raise AuthenticationFailed(_("Token was issued before the password was changed"))
+
+        if snapshot:
+            snapshot = {key.decode(): value == b"1" for key, value in snapshot.items()}
+        else:
+            snapshot = self.load_snapshot(client, user_id)
+
+        if not snapshot["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"))
+
+        return AuthPrincipal(user_id, token=validated_token, **snapshot)
+
+    def load_snapshot(self, client: Any, user_id: uuid.UUID) -> Dict[str, bool]:
+        """Load the snapshot from the database and cache it for a short time."""
+        snapshot: Optional[Dict[str, bool]] = (
+            self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*SNAPSHOT_FIELDS).first()
+        )
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"))
+
+        pipe = client.pipeline(transaction=False)
+        pipe.hset(AuthKeys.snapshot(user_id), mapping={key: int(value) for key, value in snapshot.items()})
+        pipe.expire(AuthKeys.snapshot(user_id), get_principal_cache_timeout())
+        pipe.execute()
+        return snapshot
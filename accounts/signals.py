@@ -0,0 +1,36 @@
+"""
+Accounts signals.
+Keeps the cached JWT principal (accounts.authentication) in sync with user changes.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from .authentication import AuthKeys, TokenRevocation
+import logging
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def sync_auth_principal(sender, instance, **kwargs):
+    """
+    Drop the cached principal snapshot and update revocation state.
+    AbstractBaseUser keeps the raw password in _password until after post_save,
+    which tells us set_password() was called.
+    """
+    password_changed = getattr(instance, "_password", None) is not None
+    TokenRevocation.sync_user(instance, password_changed=password_changed)
+    logger.debug(f"Synced auth principal for user {instance.pk}")
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user(sender, instance, **kwargs):
+    """Reject tokens of deleted users without waiting for the snapshot to expire."""
+    client = TokenRevocation.get_client()
+    pipe = client.pipeline(transaction=False)
+    pipe.delete(AuthKeys.snapshot(instance.pk))
+    pipe.sadd(AuthKeys.INACTIVE_USERS, str(instance.pk))
+    pipe.execute()
@@ -1,3 +1,92 @@
-from django.test import TestCase
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import path
+from ninja import NinjaAPI
+from ninja_jwt.exceptions import AuthenticationFailed
+from ninja_jwt.tokens import AccessToken
+
+from core.renderers import ORJSONParser, ORJSONRenderer
+
+from .api import router
+from .authentication import AuthPrincipal, CachedJWTAuth
+
+User = get_user_model()
+
+api = NinjaAPI(
+    auth=CachedJWTAuth(), renderer=ORJSONRenderer(), parser=ORJSONParser(), urls_namespace="accounts-tests"
+)
+api.add_router("/auth", router)
+urlpatterns = [path("api/", api.urls)]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class CachedJWTAuthTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com", is_student=True)
+        self.token = AccessToken.for_user(self.user)
+
+    def request(self, method, url, token=None):
+        return getattr(self.client, method)(url, headers={"Authorization": f"Bearer {token or self.token}"})
+
+    def me(self, token=None):
+        return self.request("get", "/api/auth/me", token)
+
+    def principal(self, token=None):
+        auth = CachedJWTAuth()
+        return auth.get_principal(auth.get_validated_token(str(token or self.token)))
+
+    def test_principal_id_is_a_uuid(self):
+        principal = self.principal()
+        self.assertIsInstance(principal, AuthPrincipal)
+        self.assertEqual(principal.id, self.user.pk)
+        self.assertEqual((principal.is_student, principal.is_teacher), (True, False))
+        self.assertEqual(self.me().json()["id"], str(self.user.pk))
+
+    def test_unrecognizable_user_id_is_rejected(self):
+        token = AccessToken.for_user(self.user)
+        token["user_id"] = "not-a-uuid"
+        self.assertEqual(self.me(token).status_code, 401)
+
+    def test_logout_revokes_only_that_token(self):
+        other = AccessToken.for_user(self.user)
+        self.assertEqual(self.me().status_code, 200)
+
+        self.assertEqual(self.request("post", "/api/auth/logout").status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+        self.assertEqual(self.me(other).status_code, 200)
+
+    def test_deactivated_user_is_rejected_despite_the_cached_snapshot(self):
+        self.assertEqual(self.me().status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+        with self.assertRaisesMessage(AuthenticationFailed, "inactive"):
+            self.principal()
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.me().status_code, 200)
+
+    def change_password(self, at):
+        with mock.patch("accounts.authentication.time.time", return_value=at):
+            self.user.set_password("new-password")
+            self.user.save()
+
+    def test_password_change_revokes_tokens_of_the_same_second(self):
+        issued_at = self.token["iat"]
+        self.change_password(issued_at - 0.5)
+        self.assertEqual(self.me().status_code, 200)
+
+        self.change_password(issued_at + 0.9)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.principal()
+        self.user.delete()
+        self.assertEqual(self.me().status_code, 401)
+        with self.assertRaises(AuthenticationFailed):
+            self.principal(AccessToken.for_user(User(pk=uuid.uuid4())))
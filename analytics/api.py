@@ -0,0 +1,58 @@
+"""
+Analytics API.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+from django.utils import timezone
+from ninja import Router, Schema
+from ninja.decorators import decorate_view
+from ninja.pagination import paginate
+from core.etags import user_etag
+from core.models import ConcentrationLevel
+from core.pagination import CursorPagination
+from core.serializers import ConcentrationLevelSchema
+from core.services import StudyEnvironmentService
+from .study_time import StudyTimePredictor
+
+router = Router(tags=["analytics"])
+
+
+class StudySlotSchema(Schema):
+    slot: int
+    weekday: str
+    hour: int
+    expected_concentration: float
+    weight: float
+
+
+class OptimalStudyTimeSchema(Schema):
+    slots: List[StudySlotSchema]
+    next_study_time: datetime
+
+
+@router.get("/study-time/optimal", response=OptimalStudyTimeSchema)
+def optimal_study_time(request, k: int = 3, interval_minutes: int = 0):
+    """Best hours of the week to study, from the user's concentration history."""
+    k = max(1, min(k, 24))
+    now = timezone.now()
+    return {
+        "slots": StudyTimePredictor.predict_optimal_study_time(request.auth.id, k, now),
+        "next_study_time": StudyTimePredictor.next_study_time(request.auth.id, now, max(interval_minutes, 0)),
+    }
+
+
+@router.get("/environment-factors", response=Dict[str, Any])
+@decorate_view(user_etag)
+def environment_factors(request):
+    """How lighting, temperature, noise, location and BGM relate to the user's rated effectiveness."""
+    return StudyEnvironmentService.analyze_factors(request.auth.id)
+
+
+@router.get("/concentrations", response=List[ConcentrationLevelSchema])
+@decorate_view(user_etag)
+@paginate(CursorPagination, ordering="-timestamp")
+def list_concentrations(request):
+    """Concentration records of the user, newest first."""
+    return ConcentrationLevel.objects.filter(user_id=request.auth.id)
@@ -0,0 +1,157 @@
+"""
+WebSocket consumers for analytics.
+"""
+
+import asyncio
+import uuid
+
+from django.conf import settings
+from core.consumers import BaseJsonConsumer, changed_fields
+from .services import RealTimeAnalyticsService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsConsumer(BaseJsonConsumer):
+    """
+    Per-user analytics socket: forwards analytics.update events as they are published.
+    """
+
+    @staticmethod
+    def group_name(user_id):
+        return f"analytics_{uuid.UUID(str(user_id)).hex}"
+
+    async def connect(self):
+        user_id = self.scope["url_route"]["kwargs"].get("user_id", "")
+        if not self.is_owner(user_id):
+            await self.close()
+            return
+
+        self.group = self.group_name(user_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group"):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def analytics_update(self, event):
+        await self.send_json({"type": "analytics", "data": event["data"]})
+
+
+class RealTimeAnalyticsConsumer(BaseJsonConsumer):
+    """
+    Live concentration stream, throttled and delta-compressed.
+
+    - Samples (analytics.sample events) are merged into a pending state, latest value wins,
+      so the layer channel of this socket is always drained immediately.
+    - At most REALTIME_ANALYTICS_MAX_HZ frames per second are sent, each carrying only the
+      fields that changed since the previous frame ({"full": true} for the first one).
+    - Every client is flow controlled: frames are acknowledged cumulatively with
+      {"type": "ack", "seq": n}, and once REALTIME_ANALYTICS_ACK_WINDOW frames are
+      unacknowledged, pushes pause with an analytics.backpressure frame and resume with the
+      merged latest state on the next ack. Clients ack every few frames, not every frame
+      (acks count against the message rate limit).
+      Memory per socket stays bounded by the size of the state, never by the sample rate.
+    - {"type": "resync"} requests a full snapshot.
+    - Clients may negotiate MessagePack framing (core.framing).
+    """
+
+    binary_framing = True
+
+    async def connect(self):
+        user_id = self.scope["url_route"]["kwargs"].get("user_id", "")
+        if not self.is_owner(user_id):
+            await self.close()
+            return
+
+        analytics_settings = settings.INTELLECTUAL_PARTNER_SETTINGS
+        self.min_interval = 1 / analytics_settings.get("REALTIME_ANALYTICS_MAX_HZ", 2)
+        self.ack_window = analytics_settings.get("REALTIME_ANALYTICS_ACK_WINDOW", 20)
+
+        self.sent_state = {}
+        self.pending = {}
+        self.coalesced = 0
+        self.seq = 0
+        self.acked_seq = 0
+        self.paused = False
+        self.last_sent_at = 0.0
+        self.flush_task = None
+
+        self.group = RealTimeAnalyticsService.group_name(user_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if getattr(self, "flush_task", None) is not None:
+            self.flush_task.cancel()
+        if hasattr(self, "group"):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        message_type = content.get("type")
+
+        if message_type == "ack":
+            try:
+                seq = int(content.get("seq"))
+            except (TypeError, ValueError):
+                return
+            self.acked_seq = max(min(seq, self.seq), self.acked_seq)
+            if self.paused and self.seq - self.acked_seq < self.ack_window:
+                self.paused = False
+                self.schedule_flush()
+
+        elif message_type == "resync":
+            self.pending = {**self.sent_state, **self.pending}
+            self.sent_state = {}
+            self.schedule_flush()
+
+    async def analytics_sample(self, event):
+        self.pending.update(event["state"])
+        self.coalesced += 1
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        if self.paused or not self.pending:
+            return
+        if self.flush_task is not None and not self.flush_task.done():
+            return
+        self.flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        delay = self.last_sent_at + self.min_interval - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.seq - self.acked_seq >= self.ack_window:
+            self.paused = True
+            await self.send_json(
+                {
+                    "type": "analytics.backpressure",
+                    "seq": self.seq,
+                    "unacked": self.seq - self.acked_seq,
+                    "coalesced": self.coalesced,
+                }
+            )
+            return
+
+        changed = changed_fields(self.sent_state, self.pending)
+        self.pending = {}
+        if changed:
+            self.seq += 1
+            frame = {
+                "type": "analytics.delta",
+                "seq": self.seq,
+                "full": not self.sent_state,
+                "changed": changed,
+                "coalesced": self.coalesced,
+            }
+            self.sent_state.update(changed)
+            self.coalesced = 0
+            self.last_sent_at = asyncio.get_running_loop().time()
+            await self.send_json(frame)
+
+        # Samples received while sleeping or sending go out in the next window
+        self.flush_task = None
+        self.schedule_flush()
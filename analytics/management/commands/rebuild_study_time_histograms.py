@@ -0,0 +1,45 @@
+"""
+Rebuild the hour-of-week concentration histograms (analytics.study_time) from history.
+
+Needed once after deploying the predictor, after changing STUDY_TIME_HALF_LIFE_DAYS,
+or when the Redis data was lost. Samples recorded while a chunk is rebuilt may be
+missed; run it off-peak.
+
+Usage:
+    python manage.py rebuild_study_time_histograms --chunk-size 500
+"""
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from analytics.study_time import StudyTimePredictor
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-user hour-of-week concentration histograms from stored samples"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Users per extract")
+        parser.add_argument("--user", action="append", default=[], help="Only these user ids")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        users = get_user_model().objects.order_by("id")
+        if options["user"]:
+            users = users.filter(id__in=options["user"])
+
+        started = time.monotonic()
+        written = 0
+        last_id = None
+        while True:
+            page = users.filter(id__gt=last_id) if last_id is not None else users
+            user_ids = list(page.values_list("id", flat=True)[:chunk_size])
+            if not user_ids:
+                break
+            written += StudyTimePredictor.rebuild(user_ids)
+            last_id = user_ids[-1]
+            self.stdout.write(f"{written} users written ({time.monotonic() - started:.1f}s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt study time histograms of {written} users"))
@@ -1,3 +1,82 @@
+"""
+Analytics models for the intellectual partner application.
+"""
+
+from django.contrib.auth import get_user_model
 from django.db import models
+from core.models import TimeStampedModel, UserRelatedModel
+
+User = get_user_model()
+
+
+class DailyUserAnalytics(UserRelatedModel):
+    """
+    Per-user daily aggregates, written by analytics.tasks.daily_analytics_processing.
+    """
+
+    date = models.DateField(verbose_name="日付")
+    study_minutes = models.PositiveIntegerField(default=0, verbose_name="学習時間(分)")
+    session_count = models.PositiveIntegerField(default=0, verbose_name="セッション数")
+    concentration_average = models.FloatField(null=True, blank=True, verbose_name="平均集中度")
+    concentration_samples = models.PositiveIntegerField(default=0, verbose_name="集中度記録数")
+
+    class Meta:
+        verbose_name = "日次ユーザー分析"
+        verbose_name_plural = "日次ユーザー分析"
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "date"], name="daily_user_analytics_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="daily_user_analytics_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.date}"
+
+
+class DailyAnalyticsSummary(TimeStampedModel):
+    """
+    School-level daily aggregates, produced by the reduce step of the daily processing.
+    """
+
+    date = models.DateField(unique=True, verbose_name="日付")
+    total_users = models.PositiveIntegerField(default=0, verbose_name="対象ユーザー数")
+    active_users = models.PositiveIntegerField(default=0, verbose_name="学習ユーザー数")
+    total_study_minutes = models.PositiveIntegerField(default=0, verbose_name="総学習時間(分)")
+    total_sessions = models.PositiveIntegerField(default=0, verbose_name="総セッション数")
+    concentration_average = models.FloatField(null=True, blank=True, verbose_name="平均集中度")
+    shard_count = models.PositiveIntegerField(default=0, verbose_name="シャード数")
+
+    class Meta:
+        verbose_name = "日次分析サマリー"
+        verbose_name_plural = "日次分析サマリー"
+        ordering = ["-date"]
+
+    def __str__(self):
+        return f"{self.date} ({self.active_users}/{self.total_users})"
+
+
+class EmotionPatternStatistics(TimeStampedModel):
+    """
+    Running statistics of a user's (valence, concentration, completions) observations,
+    maintained by analytics.patterns.EmotionPatternService.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="emotion_patterns")
+    sample_count = models.PositiveIntegerField(default=0, verbose_name="観測数")
+    means = models.JSONField(default=list, blank=True, verbose_name="平均")
+    comoments = models.JSONField(default=list, blank=True, verbose_name="共積率")
+    # {emotion: [samples, concentration sum, completions sum]}
+    emotion_stats = models.JSONField(default=dict, blank=True, verbose_name="感情別集計")
+    # last_sample_id 以下の集中度記録は全て反映済み. それより大きく反映済みのIDは recent_sample_ids に
+    # [ID, 記録時刻(エポック秒)] で保持し, EMOTION_PATTERN_SETTLE_MINUTES 経過後に last_sample_id へ繰り入れる
+    last_sample_id = models.BigIntegerField(default=0, verbose_name="最終反映集中度記録ID")
+    recent_sample_ids = models.JSONField(default=list, blank=True, verbose_name="直近反映集中度記録ID")
+
+    class Meta:
+        verbose_name = "感情パターン統計"
+        verbose_name_plural = "感情パターン統計"
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.user_id} ({self.sample_count})"
@@ -0,0 +1,361 @@
+"""
+Emotion pattern analysis: how emotion, concentration and achievement move together.
+"""
+
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from core.constants import EMOTION_VALENCE
+from core.models import ConcentrationLevel, StatusChoices
+from emotions.models import EmotionLog
+from tickets.models import Ticket
+from .models import EmotionPatternStatistics
+import logging
+
+logger = logging.getLogger(__name__)
+
+VARIABLES = ("valence", "concentration", "completions")
+EMOTIONS = tuple(EMOTION_VALENCE)
+
+
+class RunningMoments:
+    """
+    Count, means and co-moment matrix of a vector stream, updated with Welford's algorithm.
+
+    comoments[i][j] is the sum of (x_i - mean_i)(x_j - mean_j) over all observations, so
+    covariances and correlations are read in constant time whatever the number of observations.
+    """
+
+    def __init__(
+        self,
+        count: int = 0,
+        means: Optional[Sequence[float]] = None,
+        comoments: Optional[Sequence[Sequence[float]]] = None,
+    ):
+        size = len(VARIABLES)
+        self.count = count
+        self.means = list(means) if means else [0.0] * size
+        self.comoments = [list(row) for row in comoments] if comoments else [[0.0] * size for _ in range(size)]
+
+    def update(self, values: Sequence[float]) -> None:
+        self.count += 1
+        deltas = [value - mean for value, mean in zip(values, self.means)]
+        self.means = [mean + delta / self.count for mean, delta in zip(self.means, deltas)]
+        residuals = [value - mean for value, mean in zip(values, self.means)]
+        for i, delta in enumerate(deltas):
+            row = self.comoments[i]
+            for j, residual in enumerate(residuals):
+                row[j] += delta * residual
+
+    def correlation(self, i: int, j: int) -> Optional[float]:
+        """Pearson correlation; None when either variable is constant."""
+        denominator = math.sqrt(self.comoments[i][i] * self.comoments[j][j])
+        if denominator <= 1e-12:
+            return None
+        return max(-1.0, min(1.0, self.comoments[i][j] / denominator))
+
+
+class EmotionPatternService:
+    """
+    Per-user emotion × concentration × completion statistics.
+
+    Every concentration sample is one observation (valence, concentration, completions):
+    the valence (core.constants.EMOTION_VALENCE) of the latest emotion logged within
+    EMOTION_PATTERN_CONTEXT_MINUTES before the sample, the level, and the tickets completed in
+    that window. Samples without a recent emotion are not observations. record_sample() folds
+    each new sample into EmotionPatternStatistics in O(1), so correlations and emotion-conditioned
+    averages never scan history, and keep covering data removed by retention.
+    backfill() rebuilds the same statistics from columnar extracts with NumPy.
+
+    Samples of a user may commit out of id order, so record_sample() does not skip on the highest
+    id seen. last_sample_id is a watermark below which every sample is folded; folded ids above it
+    are kept in recent_sample_ids and merged into the watermark once their sample is
+    EMOTION_PATTERN_SETTLE_MINUTES old. Ids are allocated in insertion order, so any lower id
+    was inserted earlier and has committed by then.
+
+    Ticket completion time is approximated by updated_at, as in the weekly reports.
+    """
+
+    @staticmethod
+    def get_setting(name: str, default: Any) -> Any:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @classmethod
+    def context_window(cls) -> timedelta:
+        return timedelta(minutes=cls.get_setting("EMOTION_PATTERN_CONTEXT_MINUTES", 120))
+
+    @classmethod
+    def observation(cls, user_id: Any, level: int, at: datetime) -> Optional[Tuple[str, List[float]]]:
+        """(emotion, values) of a concentration sample, None without a recent emotion."""
+        since = at - cls.context_window()
+        emotion = (
+            EmotionLog.objects.filter(user_id=user_id, created_at__gt=since, created_at__lte=at, is_deleted=False)
+            .order_by("-created_at")
+            .values_list("emotion", flat=True)
+            .first()
+        )
+        if emotion not in EMOTION_VALENCE:
+            return None
+        completions = Ticket.objects.filter(
+            assignee_id=user_id,
+            status=StatusChoices.COMPLETED,
+            updated_at__gt=since,
+            updated_at__lte=at,
+            is_deleted=False,
+        ).count()
+        return emotion, [float(EMOTION_VALENCE[emotion]), float(level), float(completions)]
+
+    @staticmethod
+    def load(statistics: EmotionPatternStatistics) -> RunningMoments:
+        return RunningMoments(statistics.sample_count, statistics.means, statistics.comoments)
+
+    @staticmethod
+    def apply(statistics: EmotionPatternStatistics, moments: RunningMoments, emotion: str, values: List[float]) -> None:
+        moments.update(values)
+        counts = statistics.emotion_stats.setdefault(emotion, [0, 0.0, 0.0])
+        counts[0] += 1
+        counts[1] += values[1]
+        counts[2] += values[2]
+
+    @staticmethod
+    def store(statistics: EmotionPatternStatistics, moments: RunningMoments) -> None:
+        statistics.sample_count = moments.count
+        statistics.means = moments.means
+        statistics.comoments = moments.comoments
+
+    @classmethod
+    def is_recorded(cls, statistics: EmotionPatternStatistics, sample_id: int) -> bool:
+        return sample_id <= statistics.last_sample_id or any(
+            recorded_id == sample_id for recorded_id, _ in statistics.recent_sample_ids
+        )
+
+    @classmethod
+    def mark_recorded(cls, statistics: EmotionPatternStatistics, sample: ConcentrationLevel) -> None:
+        """Add the sample to the recorded ids and advance the watermark over settled ones."""
+        recent = statistics.recent_sample_ids + [[sample.id, int(sample.timestamp.timestamp())]]
+        settled_before = time.time() - cls.get_setting("EMOTION_PATTERN_SETTLE_MINUTES", 10) * 60
+        settled = [recorded_id for recorded_id, recorded_at in recent if recorded_at < settled_before]
+        if settled:
+            statistics.last_sample_id = max(statistics.last_sample_id, *settled)
+        statistics.recent_sample_ids = [entry for entry in recent if entry[0] > statistics.last_sample_id]
+
+    @classmethod
+    def record_sample(cls, sample: ConcentrationLevel) -> None:
+        """Fold a committed concentration sample into the user's statistics; idempotent per sample."""
+        observation = cls.observation(sample.user_id, sample.level, sample.timestamp)
+        with transaction.atomic():
+            statistics, _ = EmotionPatternStatistics.objects.select_for_update().get_or_create(user_id=sample.user_id)
+            if cls.is_recorded(statistics, sample.id):
+                return
+            cls.mark_recorded(statistics, sample)
+            if observation is not None:
+                moments = cls.load(statistics)
+                cls.apply(statistics, moments, *observation)
+                cls.store(statistics, moments)
+            statistics.save()
+
+    @classmethod
+    def summary(cls, statistics: Optional[EmotionPatternStatistics]) -> Dict[str, Any]:
+        """
+        Correlations and emotion-conditioned averages.
+        Correlations and per-emotion averages need EMOTION_PATTERN_MIN_SAMPLES observations.
+        """
+        min_samples = cls.get_setting("EMOTION_PATTERN_MIN_SAMPLES", 10)
+        if statistics is None or not statistics.sample_count:
+            return {"samples": 0, "correlations": {}, "emotions": {}, "best_emotion": None}
+
+        moments = cls.load(statistics)
+        correlations = {}
+        if moments.count >= min_samples:
+            for i in range(len(VARIABLES)):
+                for j in range(i + 1, len(VARIABLES)):
+                    value = moments.correlation(i, j)
+                    correlations[f"{VARIABLES[i]}_{VARIABLES[j]}"] = round(value, 3) if value is not None else None
+
+        emotions = {
+            emotion: {
+                "samples": samples,
+                "concentration_average": round(concentration / samples, 2),
+                "completions_average": round(completions / samples, 2),
+            }
+            for emotion, (samples, concentration, completions) in statistics.emotion_stats.items()
+            if samples >= min_samples
+        }
+        return {
+            "samples": moments.count,
+            "means": {name: round(mean, 2) for name, mean in zip(VARIABLES, moments.means)},
+            "correlations": correlations,
+            "emotions": emotions,
+            "best_emotion": max(emotions, key=lambda emotion: emotions[emotion]["concentration_average"])
+            if emotions
+            else None,
+        }
+
+    @classmethod
+    def get_summary(cls, user_id: Any) -> Dict[str, Any]:
+        return cls.summary(EmotionPatternStatistics.objects.filter(user_id=user_id).first())
+
+    @staticmethod
+    def epoch_seconds(values: List[datetime]) -> np.ndarray:
+        return np.fromiter((value.timestamp() for value in values), dtype=np.int64, count=len(values))
+
+    @classmethod
+    def backfill(cls, user_ids: List[Any], cutoff_id: int) -> int:
+        """
+        Rebuild the statistics of user_ids from samples up to cutoff_id, vectorized.
+
+        Each table is extracted as columns, keyed by (user index << 34 | epoch second) and
+        sorted, so the context of every sample is found with searchsorted and the per-user
+        moments with bincount, without Python loops over rows. Samples after cutoff_id
+        (recorded while the backfill ran) are folded in one by one under the row lock.
+        Only settled samples move the watermark, as in record_sample().
+        Returns the number of users written.
+        """
+        if not user_ids:
+            return 0
+        index = {user_id: position for position, user_id in enumerate(user_ids)}
+        users = len(user_ids)
+        window = int(cls.context_window().total_seconds())
+
+        def keyed(rows, *extra_dtypes):
+            columns = list(zip(*rows)) if rows else [()] * (2 + len(extra_dtypes))
+            owners = np.fromiter((index[user_id] for user_id in columns[0]), dtype=np.int64, count=len(rows))
+            keys = (owners << 34) | cls.epoch_seconds(columns[1])
+            order = np.argsort(keys, kind="stable")
+            extras = [np.asarray(column, dtype=dtype)[order] for column, dtype in zip(columns[2:], extra_dtypes)]
+            return (keys[order], *extras)
+
+        sample_keys, levels, sample_ids = keyed(
+            list(
+                ConcentrationLevel.objects.filter(user_id__in=user_ids, id__lte=cutoff_id)
+                .order_by()
+                .values_list("user_id", "timestamp", "level", "id")
+            ),
+            np.float64,
+            np.int64,
+        )
+        codes = {emotion: code for code, emotion in enumerate(EMOTIONS)}
+        emotion_keys, emotion_codes = keyed(
+            [
+                (user_id, created_at, codes[emotion])
+                for user_id, created_at, emotion in EmotionLog.objects.filter(user_id__in=user_ids, is_deleted=False)
+                .order_by()
+                .values_list("user_id", "created_at", "emotion")
+                if emotion in codes
+            ],
+            np.int64,
+        )
+        (completion_keys,) = keyed(
+            list(
+                Ticket.objects.filter(assignee_id__in=user_ids, status=StatusChoices.COMPLETED, is_deleted=False)
+                .order_by()
+                .values_list("assignee_id", "updated_at")
+            )
+        )
+
+        owners = sample_keys >> 34
+        # Watermark over settled samples only, newer ones are kept as recorded ids
+        settled_before = time.time() - cls.get_setting("EMOTION_PATTERN_SETTLE_MINUTES", 10) * 60
+        sample_seconds = sample_keys & ((1 << 34) - 1)
+        settled = sample_seconds < settled_before
+        last_ids = np.zeros(users, dtype=np.int64)
+        np.maximum.at(last_ids, owners[settled], sample_ids[settled])
+        recent: Dict[int, List[List[int]]] = {}
+        for owner, sample_id, seconds in zip(
+            owners[~settled].tolist(), sample_ids[~settled].tolist(), sample_seconds[~settled].tolist()
+        ):
+            if sample_id > last_ids[owner]:
+                recent.setdefault(owner, []).append([sample_id, seconds])
+
+        # Latest emotion at or before each sample, same user and within the window
+        latest = np.searchsorted(emotion_keys, sample_keys, side="right") - 1
+        found = latest >= 0
+        latest = np.where(found, latest, 0)
+        if len(emotion_keys):
+            found &= (emotion_keys[latest] >> 34) == owners
+            found &= sample_keys - emotion_keys[latest] < window
+        else:
+            found[:] = False
+        completions = (
+            np.searchsorted(completion_keys, sample_keys, side="right")
+            - np.searchsorted(completion_keys, sample_keys - window, side="right")
+        ).astype(np.float64)
+
+        owners = owners[found]
+        emotion_codes = emotion_codes[latest[found]] if len(emotion_keys) else np.zeros(0, dtype=np.int64)
+        valence = np.array([EMOTION_VALENCE[emotion] for emotion in EMOTIONS], dtype=np.float64)
+        values = np.column_stack([valence[emotion_codes], levels[found], completions[found]])
+
+        counts = np.bincount(owners, minlength=users)
+        safe_counts = np.maximum(counts, 1)
+        means = np.column_stack(
+            [np.bincount(owners, weights=values[:, k], minlength=users) / safe_counts for k in range(len(VARIABLES))]
+        )
+        deviations = values - means[owners]
+        comoments = np.empty((users, len(VARIABLES), len(VARIABLES)))
+        for i in range(len(VARIABLES)):
+            for j in range(i, len(VARIABLES)):
+                comoments[:, i, j] = comoments[:, j, i] = np.bincount(
+                    owners, weights=deviations[:, i] * deviations[:, j], minlength=users
+                )
+
+        groups = owners * len(EMOTIONS) + emotion_codes
+        shape = (users, len(EMOTIONS))
+        emotion_counts = np.bincount(groups, minlength=users * len(EMOTIONS)).reshape(shape)
+        concentration_sums = np.bincount(groups, weights=values[:, 1], minlength=users * len(EMOTIONS)).reshape(shape)
+        completion_sums = np.bincount(groups, weights=values[:, 2], minlength=users * len(EMOTIONS)).reshape(shape)
+
+        with transaction.atomic():
+            existing = {
+                statistics.user_id: statistics
+                for statistics in EmotionPatternStatistics.objects.select_for_update().filter(user_id__in=user_ids)
+            }
+            late: Dict[Any, List[ConcentrationLevel]] = {}
+            for sample in ConcentrationLevel.objects.filter(user_id__in=user_ids, id__gt=cutoff_id).order_by("id"):
+                late.setdefault(sample.user_id, []).append(sample)
+
+            rows = []
+            for position, user_id in enumerate(user_ids):
+                if not last_ids[position] and position not in recent and user_id not in late:
+                    continue
+                statistics = existing.get(user_id) or EmotionPatternStatistics(user_id=user_id)
+                moments = RunningMoments(int(counts[position]), means[position].tolist(), comoments[position].tolist())
+                statistics.emotion_stats = {
+                    emotion: [
+                        int(emotion_counts[position, code]),
+                        float(concentration_sums[position, code]),
+                        float(completion_sums[position, code]),
+                    ]
+                    for code, emotion in enumerate(EMOTIONS)
+                    if emotion_counts[position, code]
+                }
+                statistics.last_sample_id = int(last_ids[position])
+                statistics.recent_sample_ids = recent.get(position, [])
+                for sample in late.get(user_id, []):
+                    observation = cls.observation(user_id, sample.level, sample.timestamp)
+                    if observation is not None:
+                        cls.apply(statistics, moments, *observation)
+                    cls.mark_recorded(statistics, sample)
+                cls.store(statistics, moments)
+                rows.append(statistics)
+
+            EmotionPatternStatistics.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["user"],
+                update_fields=[
+                    "sample_count",
+                    "means",
+                    "comoments",
+                    "emotion_stats",
+                    "last_sample_id",
+                    "recent_sample_ids",
+                    "updated_at",
+                ],
+            )
+        return len(rows)
@@ -0,0 +1,339 @@
+"""
+Analytics services.
+"""
+
+import time
+import uuid
+from datetime import date as date_type, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Avg, Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from accounts.models import UserStatistics
+from core.models import ConcentrationLevel, StatusChoices, StudySession
+from core.utils import CacheManager
+from emotions.models import EmotionLog
+from tickets.models import Ticket
+from .models import DailyAnalyticsSummary, DailyUserAnalytics
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RealTimeAnalyticsService:
+    """
+    Publishes live analytics samples to ws/realtime-analytics/<user_id>/ sockets.
+
+    Producers publish as often as samples arrive; RealTimeAnalyticsConsumer coalesces
+    them and pushes only changed fields at most REALTIME_ANALYTICS_MAX_HZ times a second.
+    """
+
+    @staticmethod
+    def group_name(user_id: Any) -> str:
+        """Channel-layer group of a user's realtime analytics sockets."""
+        return f"realtime_analytics_{uuid.UUID(str(user_id)).hex}"
+
+    @staticmethod
+    def concentration_state(concentration_level) -> Dict[str, Any]:
+        """Flat analytics state for a ConcentrationLevel sample."""
+        return {
+            "concentration": concentration_level.level,
+            "session_id": str(concentration_level.session_id) if concentration_level.session_id else None,
+            "recorded_at": concentration_level.timestamp.isoformat(),
+        }
+
+    @classmethod
+    async def apublish(cls, user_id: Any, state: Dict[str, Any], channel_layer: Any = None) -> None:
+        channel_layer = channel_layer or get_channel_layer()
+        await channel_layer.group_send(cls.group_name(user_id), {"type": "analytics.sample", "state": state})
+
+    @classmethod
+    def publish(cls, user_id: Any, state: Dict[str, Any]) -> None:
+        try:
+            async_to_sync(cls.apublish)(user_id, state)
+        except Exception as e:
+            # Live updates are best effort; the sample is already persisted
+            logger.warning(f"Failed to publish realtime analytics for user {user_id}: {e}")
+
+
+class DailyAnalyticsService:
+    """
+    Sharded daily analytics.
+
+    Users are split into DAILY_ANALYTICS_SHARD_COUNT shards by primary key. Ids are random
+    UUID4s, so equal-width ranges of the 128-bit id space are evenly sized hash shards that
+    each map to one index range scan; shards share nothing and run on any number of workers.
+    A shard walks its range in keyset batches and checkpoints the last processed id and the
+    running totals after every batch, so a retried or redelivered shard resumes from there.
+    Batches are idempotent upserts: replaying the batch in flight when a worker died is harmless.
+    reduce() merges the shard totals into the school-level DailyAnalyticsSummary.
+    """
+
+    CHECKPOINT_TIMEOUT = 60 * 60 * 48
+    ID_SPACE = 1 << 128
+    TOTAL_FIELDS = (
+        "users",
+        "active_users",
+        "study_minutes",
+        "sessions",
+        "concentration_sum",
+        "concentration_samples",
+    )
+
+    @staticmethod
+    def get_setting(name: str, default: Any) -> Any:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @classmethod
+    def shard_range(cls, shard: int, shard_count: int) -> Tuple[uuid.UUID, Optional[uuid.UUID]]:
+        """[lower, upper) id range of a shard; the last shard is open-ended."""
+        lower = uuid.UUID(int=cls.ID_SPACE * shard // shard_count)
+        upper = uuid.UUID(int=cls.ID_SPACE * (shard + 1) // shard_count) if shard + 1 < shard_count else None
+        return lower, upper
+
+    @staticmethod
+    def day_bounds(day: date_type) -> Tuple[datetime, datetime]:
+        start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        return start, start + timedelta(days=1)
+
+    @staticmethod
+    def checkpoint_key(day: date_type, shard: int) -> str:
+        return CacheManager.get_cache_key("analytics_daily", day.isoformat(), "shard", shard)
+
+    @staticmethod
+    def summary_cache_key(day: date_type) -> str:
+        return CacheManager.get_cache_key("analytics_summary", day.isoformat())
+
+    @classmethod
+    def load_checkpoint(cls, day: date_type, shard: int) -> Dict[str, Any]:
+        checkpoint = cache.get(cls.checkpoint_key(day, shard))
+        if checkpoint is None:
+            checkpoint = {"last_id": None, "done": False, "totals": dict.fromkeys(cls.TOTAL_FIELDS, 0)}
+        return checkpoint
+
+    @classmethod
+    def process_shard(cls, day: date_type, shard: int, shard_count: int) -> Dict[str, Any]:
+        """
+        Process one shard, resuming from its checkpoint.
+        Stops after DAILY_ANALYTICS_SHARD_TIME_BUDGET seconds with done=False; the caller retries.
+        """
+        batch_size = cls.get_setting("DAILY_ANALYTICS_BATCH_SIZE", 500)
+        time_budget = cls.get_setting("DAILY_ANALYTICS_SHARD_TIME_BUDGET", 480)
+        checkpoint = cls.load_checkpoint(day, shard)
+        if checkpoint["done"]:
+            return checkpoint
+
+        lower, upper = cls.shard_range(shard, shard_count)
+        users = get_user_model().objects.filter(id__gte=lower, is_active=True)
+        if upper is not None:
+            users = users.filter(id__lt=upper)
+
+        started = time.monotonic()
+        while True:
+            batch = users
+            if checkpoint["last_id"]:
+                batch = batch.filter(id__gt=checkpoint["last_id"])
+            user_ids = list(batch.order_by("id").values_list("id", flat=True)[:batch_size])
+            if not user_ids:
+                checkpoint["done"] = True
+                break
+
+            for field, value in cls.process_batch(day, user_ids).items():
+                checkpoint["totals"][field] += value
+            checkpoint["last_id"] = str(user_ids[-1])
+            cache.set(cls.checkpoint_key(day, shard), checkpoint, cls.CHECKPOINT_TIMEOUT)
+
+            if time.monotonic() - started > time_budget:
+                break
+
+        cache.set(cls.checkpoint_key(day, shard), checkpoint, cls.CHECKPOINT_TIMEOUT)
+        return checkpoint
+
+    @classmethod
+    def process_batch(cls, day: date_type, user_ids: List[Any]) -> Dict[str, int]:
+        """Aggregate one batch of users with two grouped queries and upsert their daily rows."""
+        start, end = cls.day_bounds(day)
+        concentration = {
+            row["user_id"]: row
+            for row in ConcentrationLevel.objects.filter(user_id__in=user_ids, timestamp__gte=start, timestamp__lt=end)
+            .order_by()
+            .values("user_id")
+            .annotate(total=Sum("level"), samples=Count("id"))
+        }
+        sessions = {
+            row["user_id"]: row
+            for row in StudySession.objects.filter(
+                user_id__in=user_ids, started_at__gte=start, started_at__lt=end, is_deleted=False
+            )
+            .order_by()
+            .values("user_id")
+            .annotate(seconds=Sum("elapsed_seconds"), count=Count("id"))
+        }
+
+        totals = dict.fromkeys(cls.TOTAL_FIELDS, 0)
+        totals["users"] = len(user_ids)
+        rows = []
+        for user_id in concentration.keys() | sessions.keys():
+            levels = concentration.get(user_id, {})
+            session = sessions.get(user_id, {})
+            samples = levels.get("samples", 0)
+            row = DailyUserAnalytics(
+                user_id=user_id,
+                date=day,
+                study_minutes=(session.get("seconds") or 0) // 60,
+                session_count=session.get("count", 0),
+                concentration_average=round(levels["total"] / samples, 2) if samples else None,
+                concentration_samples=samples,
+            )
+            rows.append(row)
+            totals["active_users"] += 1
+            totals["study_minutes"] += row.study_minutes
+            totals["sessions"] += row.session_count
+            totals["concentration_sum"] += levels.get("total") or 0
+            totals["concentration_samples"] += samples
+
+        if rows:
+            DailyUserAnalytics.objects.bulk_create(
+                rows,
+                batch_size=len(rows),
+                update_conflicts=True,
+                unique_fields=["user", "date"],
+                update_fields=[
+                    "study_minutes",
+                    "session_count",
+                    "concentration_average",
+                    "concentration_samples",
+                    "updated_at",
+                ],
+            )
+        return totals
+
+    @classmethod
+    def reduce(cls, day: date_type, shard_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge shard totals into the school-level summary, cache it and drop the checkpoints."""
+        totals = dict.fromkeys(cls.TOTAL_FIELDS, 0)
+        for result in shard_results:
+            for field in cls.TOTAL_FIELDS:
+                totals[field] += result["totals"][field]
+
+        samples = totals["concentration_samples"]
+        summary, _ = DailyAnalyticsSummary.objects.update_or_create(
+            date=day,
+            defaults={
+                "total_users": totals["users"],
+                "active_users": totals["active_users"],
+                "total_study_minutes": totals["study_minutes"],
+                "total_sessions": totals["sessions"],
+                "concentration_average": round(totals["concentration_sum"] / samples, 2) if samples else None,
+                "shard_count": len(shard_results),
+            },
+        )
+        payload = cls.summary_payload(summary)
+        cache.set(cls.summary_cache_key(day), payload, cls.get_setting("DAILY_ANALYTICS_SUMMARY_CACHE_TIMEOUT", 86400))
+        cache.delete_many([cls.checkpoint_key(day, shard) for shard in range(len(shard_results))])
+        return payload
+
+    @staticmethod
+    def summary_payload(summary: DailyAnalyticsSummary) -> Dict[str, Any]:
+        return {
+            "date": summary.date.isoformat(),
+            "total_users": summary.total_users,
+            "active_users": summary.active_users,
+            "total_study_minutes": summary.total_study_minutes,
+            "total_sessions": summary.total_sessions,
+            "concentration_average": summary.concentration_average,
+        }
+
+    @classmethod
+    def get_summary(cls, day: date_type) -> Optional[Dict[str, Any]]:
+        """School-level aggregates of a day, from the cache when published."""
+        payload = cache.get(cls.summary_cache_key(day))
+        if payload is None:
+            summary = DailyAnalyticsSummary.objects.filter(date=day).first()
+            if summary is None:
+                return None
+            payload = cls.summary_payload(summary)
+        return payload
+
+
+class UserStatisticsService:
+    """
+    Recomputes accounts.UserStatistics from the source tables.
+
+    Sections are recomputed independently, so a debounced run triggered only by
+    ticket writes does not rescan study sessions:
+    "study" (time, sessions, streaks, concentration), "tasks", "emotions".
+    """
+
+    SECTIONS = ("study", "tasks", "emotions")
+    EMOTION_WINDOW_DAYS = 30
+
+    @classmethod
+    def recompute(cls, user_id: Any, sections: Optional[Any] = None) -> Dict[str, Any]:
+        sections = set(sections or cls.SECTIONS) & set(cls.SECTIONS)
+        fields: Dict[str, Any] = {}
+        if "study" in sections:
+            fields.update(cls.study_fields(user_id))
+        if "tasks" in sections:
+            fields.update(cls.task_fields(user_id))
+        if "emotions" in sections:
+            fields.update(cls.emotion_fields(user_id))
+
+        UserStatistics.objects.update_or_create(user_id=user_id, defaults=fields)
+        return fields
+
+    @classmethod
+    def study_fields(cls, user_id: Any) -> Dict[str, Any]:
+        sessions = StudySession.objects.filter(user_id=user_id, is_deleted=False)
+        totals = sessions.aggregate(seconds=Sum("elapsed_seconds"), average=Avg("elapsed_seconds"))
+        study_dates = list(
+            sessions.annotate(day=TruncDate("started_at")).order_by("day").values_list("day", flat=True).distinct()
+        )
+        current, longest = cls.streaks(study_dates, timezone.localdate())
+        concentration = ConcentrationLevel.objects.filter(user_id=user_id).aggregate(average=Avg("level"))["average"]
+        return {
+            "total_study_time_minutes": (totals["seconds"] or 0) // 60,
+            "average_session_duration": round((totals["average"] or 0) / 60, 2),
+            "current_streak_days": current,
+            "longest_streak_days": longest,
+            "average_concentration_level": round(concentration, 2) if concentration is not None else 5.0,
+        }
+
+    @staticmethod
+    def streaks(study_dates: List[date_type], today: date_type) -> Tuple[int, int]:
+        """(current, longest) runs of consecutive days; the current run may end yesterday."""
+        longest = run = 0
+        previous = None
+        for day in study_dates:
+            run = run + 1 if previous is not None and (day - previous).days == 1 else 1
+            longest = max(longest, run)
+            previous = day
+        current = run if previous is not None and (today - previous).days <= 1 else 0
+        return current, longest
+
+    @staticmethod
+    def task_fields(user_id: Any) -> Dict[str, Any]:
+        tickets = Ticket.objects.filter(is_deleted=False)
+        return {
+            "total_task_created": tickets.filter(creator_id=user_id).count(),
+            "total_task_completed": tickets.filter(assignee_id=user_id, status=StatusChoices.COMPLETED).count(),
+        }
+
+    @classmethod
+    def emotion_fields(cls, user_id: Any) -> Dict[str, Any]:
+        cutoff = timezone.now() - timedelta(days=cls.EMOTION_WINDOW_DAYS)
+        top = (
+            EmotionLog.objects.filter(user_id=user_id, created_at__gte=cutoff, is_deleted=False)
+            .order_by()
+            .values("emotion")
+            .annotate(total=Count("id"))
+            .order_by("-total")
+            .first()
+        )
+        return {"most_common_emotion": top["emotion"] if top else ""}
@@ -0,0 +1,99 @@
+"""
+Analytics signals for the intellectual partner application.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from core.debounce import TaskDebouncer
+from core.models import ConcentrationLevel
+from core.signals import study_sessions_flushed
+from emotions.models import EmotionLog
+from tickets.models import Ticket
+from .patterns import EmotionPatternService
+from .services import RealTimeAnalyticsService
+from .study_time import StudyTimePredictor
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=ConcentrationLevel)
+def publish_concentration_sample(sender, instance, created, **kwargs):
+    """
+    Stream new concentration samples to the realtime analytics sockets once committed.
+    """
+    if created:
+        state = RealTimeAnalyticsService.concentration_state(instance)
+        transaction.on_commit(lambda: RealTimeAnalyticsService.publish(instance.user_id, state))
+
+
+@receiver(post_save, sender=ConcentrationLevel)
+def record_emotion_pattern(sender, instance, created, **kwargs):
+    """
+    Fold new concentration samples into the emotion pattern statistics once committed.
+    """
+    if not created:
+        return
+
+    def record():
+        try:
+            EmotionPatternService.record_sample(instance)
+        except Exception as e:
+            # The sample is persisted; backfill_emotion_patterns recovers missed updates
+            logger.warning(f"Failed to update emotion patterns for user {instance.user_id}: {e}")
+
+    transaction.on_commit(record)
+
+
+@receiver(post_save, sender=ConcentrationLevel)
+def record_study_time(sender, instance, created, **kwargs):
+    """
+    Add new concentration samples to the hour-of-week histogram once committed.
+    """
+    if not created:
+        return
+
+    def record():
+        try:
+            StudyTimePredictor.record(instance.user_id, instance.level, instance.timestamp)
+        except Exception as e:
+            # rebuild_study_time_histograms recomputes the histograms from the stored samples
+            logger.warning(f"Failed to update study time histogram for user {instance.user_id}: {e}")
+
+    transaction.on_commit(record)
+
+
+def schedule_statistics(user_ids, section):
+    """Debounced UserStatistics recompute of the given section, once committed."""
+    from .tasks import recompute_user_statistics
+
+    def trigger():
+        for user_id in set(user_ids):
+            TaskDebouncer.trigger(recompute_user_statistics, user_id, items=[section])
+
+    transaction.on_commit(trigger)
+
+
+@receiver(post_save, sender=ConcentrationLevel)
+def update_statistics_concentration(sender, instance, created, **kwargs):
+    if created:
+        schedule_statistics([instance.user_id], "study")
+
+
+@receiver(study_sessions_flushed)
+def update_statistics_session(sender, user_ids, **kwargs):
+    # Live sessions reach the database only when flushed, recomputing on study_session_ended
+    # would read the StudySession table before the session is there
+    schedule_statistics(user_ids, "study")
+
+
+@receiver(post_save, sender=Ticket)
+def update_statistics_ticket(sender, instance, **kwargs):
+    schedule_statistics([instance.creator_id, instance.assignee_id], "tasks")
+
+
+@receiver(post_save, sender=EmotionLog)
+def update_statistics_emotion(sender, instance, created, **kwargs):
+    if created:
+        schedule_statistics([instance.user_id], "emotions")
@@ -0,0 +1,186 @@
+"""
+Optimal study time prediction from hour-of-week concentration histograms.
+"""
+
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from accounts.models import UserProfile
+from core.models import ConcentrationLevel
+from core.utils import calculate_next_study_time, hour_of_week
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "intellectual_partner:study_time"
+SLOTS = 168
+WEEKDAYS = ("月", "火", "水", "木", "金", "土", "日")
+# Reference time of the forward-decayed weights
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+
+
+class StudyTimePredictor:
+    """
+    Per-user concentration by hour of the week (local time), exponentially decayed.
+
+    A user's model is one Redis hash of at most 168 concentration sums ("s<slot>") and
+    sample counts ("c<slot>"). Decay uses forward weights: a sample at time t adds
+    2 ** ((t - EPOCH) / half-life) to its slot, so an update is two HINCRBYFLOAT and old
+    buckets are never rewritten; dividing by the weight of "now" on read yields the decayed
+    values (float64 covers about a thousand half-lives past EPOCH). Slots are ranked by
+    their mean concentration shrunk toward the user's overall mean with
+    STUDY_TIME_PRIOR_WEIGHT pseudo-samples, so a single good sample does not win.
+    """
+
+    @staticmethod
+    def get_setting(name: str, default: Any) -> Any:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @staticmethod
+    def get_client():
+        return get_redis_connection("default")
+
+    @staticmethod
+    def key(user_id: Any) -> str:
+        return f"{KEY_PREFIX}:{uuid.UUID(str(user_id)).hex}"
+
+    @classmethod
+    def weight(cls, at: datetime) -> float:
+        half_life = cls.get_setting("STUDY_TIME_HALF_LIFE_DAYS", 28) * 86400
+        return 2.0 ** ((at.timestamp() - EPOCH) / half_life)
+
+    @classmethod
+    def record(cls, user_id: Any, level: int, at: datetime) -> None:
+        """Add one concentration sample to the user's histogram."""
+        slot = hour_of_week(at)
+        weight = cls.weight(at)
+        key = cls.key(user_id)
+        pipe = cls.get_client().pipeline(transaction=False)
+        pipe.hincrbyfloat(key, f"s{slot}", weight * level)
+        pipe.hincrbyfloat(key, f"c{slot}", weight)
+        pipe.expire(key, cls.get_setting("STUDY_TIME_KEY_TIMEOUT", 86400 * 400))
+        pipe.execute()
+
+    @classmethod
+    def load(cls, user_id: Any, now: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Decayed (sums, counts) arrays of the user, as of now."""
+        sums = np.zeros(SLOTS)
+        counts = np.zeros(SLOTS)
+        for field, value in cls.get_client().hgetall(cls.key(user_id)).items():
+            field = field.decode()
+            (sums if field[0] == "s" else counts)[int(field[1:])] = float(value)
+        scale = cls.weight(now or timezone.now())
+        return sums / scale, counts / scale
+
+    @classmethod
+    def scores(cls, sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Shrunk mean concentration per slot, -inf for slots without samples."""
+        total = counts.sum()
+        if total <= 0:
+            return np.full(SLOTS, -np.inf)
+        prior_weight = cls.get_setting("STUDY_TIME_PRIOR_WEIGHT", 3.0)
+        scores = (sums + prior_weight * sums.sum() / total) / (counts + prior_weight)
+        scores[counts <= 0] = -np.inf
+        return scores
+
+    @staticmethod
+    def top_slots(scores: np.ndarray, k: int) -> List[int]:
+        """Best k slots, best first."""
+        available = int(np.isfinite(scores).sum())
+        k = min(k, available)
+        if k <= 0:
+            return []
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        return [int(slot) for slot in candidates[np.argsort(-scores[candidates], kind="stable")]]
+
+    @classmethod
+    def predict_optimal_study_time(
+        cls, user_id: Any, k: int = 3, now: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Top-k hour-of-week slots with their expected concentration; empty without history."""
+        sums, counts = cls.load(user_id, now)
+        scores = cls.scores(sums, counts)
+        return [
+            {
+                "slot": slot,
+                "weekday": WEEKDAYS[slot // 24],
+                "hour": slot % 24,
+                "expected_concentration": round(float(scores[slot]), 2),
+                "weight": round(float(counts[slot]), 2),
+            }
+            for slot in cls.top_slots(scores, k)
+        ]
+
+    @classmethod
+    def next_study_time(
+        cls, user_id: Any, current_time: datetime, interval_minutes: int, k: Optional[int] = None
+    ) -> datetime:
+        """
+        Next study time in one of the user's best slots.
+        Without history, the hours of UserProfile.preferred_study_time_start/end are used.
+        """
+        k = k or cls.get_setting("STUDY_TIME_TOP_SLOTS", 12)
+        sums, counts = cls.load(user_id, current_time)
+        slots = cls.top_slots(cls.scores(sums, counts), k)
+        if slots:
+            return calculate_next_study_time(current_time, interval_minutes, preferred_slots=slots)
+        return calculate_next_study_time(current_time, interval_minutes, cls.profile_preferences(user_id))
+
+    @staticmethod
+    def profile_preferences(user_id: Any) -> Optional[Dict[str, Any]]:
+        window = (
+            UserProfile.objects.filter(user_id=user_id)
+            .values_list("preferred_study_time_start", "preferred_study_time_end")
+            .first()
+        )
+        if not window or window[0] is None or window[1] is None:
+            return None
+        start, end = window[0].hour, window[1].hour
+        hours = list(range(start, end)) if start < end else list(range(start, 24)) + list(range(0, end))
+        return {"preferred_study_hours": hours or [start]}
+
+    @classmethod
+    def rebuild(cls, user_ids: List[Any]) -> int:
+        """
+        Recompute the histograms of user_ids from the stored concentration samples,
+        with one columnar extract and bincount for all of them. Returns the number of users written.
+        """
+        half_life = cls.get_setting("STUDY_TIME_HALF_LIFE_DAYS", 28) * 86400
+        index = {user_id: position for position, user_id in enumerate(user_ids)}
+        rows = list(
+            ConcentrationLevel.objects.filter(user_id__in=user_ids)
+            .order_by()
+            .values_list("user_id", "timestamp", "level")
+        )
+        owners = np.fromiter((index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        slots = np.fromiter((hour_of_week(row[1]) for row in rows), dtype=np.int64, count=len(rows))
+        seconds = np.fromiter((row[1].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+        weights = np.exp2((seconds - EPOCH) / half_life)
+        levels = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+
+        buckets = owners * SLOTS + slots
+        size = len(user_ids) * SLOTS
+        sums = np.bincount(buckets, weights=weights * levels, minlength=size).reshape(len(user_ids), SLOTS)
+        counts = np.bincount(buckets, weights=weights, minlength=size).reshape(len(user_ids), SLOTS)
+
+        timeout = cls.get_setting("STUDY_TIME_KEY_TIMEOUT", 86400 * 400)
+        pipe = cls.get_client().pipeline(transaction=False)
+        written = 0
+        for position, user_id in enumerate(user_ids):
+            key = cls.key(user_id)
+            pipe.delete(key)
+            filled = np.flatnonzero(counts[position])
+            if not len(filled):
+                continue
+            mapping = {f"s{slot}": repr(float(sums[position, slot])) for slot in filled}
+            mapping.update({f"c{slot}": repr(float(counts[position, slot])) for slot in filled})
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, timeout)
+            written += 1
+        pipe.execute()
+        return written
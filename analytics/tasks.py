@@ -0,0 +1,52 @@
+"""
+Celery tasks for analytics.
+"""
+
+from datetime import date, timedelta
+
+from celery import chord, shared_task
+from django.utils import timezone
+from core.debounce import debounced_task
+from .services import DailyAnalyticsService, UserStatisticsService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def daily_analytics_processing(day=None):
+    """
+    Coordinator of the daily analytics (daily beat job, yesterday by default).
+    Dispatches one task per user shard and a reduce step publishing the school-level summary.
+    """
+    day = day or (timezone.localdate() - timedelta(days=1)).isoformat()
+    shard_count = DailyAnalyticsService.get_setting("DAILY_ANALYTICS_SHARD_COUNT", 32)
+    chord(process_analytics_shard.s(day, shard, shard_count) for shard in range(shard_count))(
+        reduce_daily_analytics.s(day)
+    )
+    logger.info(f"Dispatched daily analytics for {day} over {shard_count} shards")
+    return {"date": day, "shards": shard_count}
+
+
+# acks_late + reject_on_worker_lost: a shard whose worker was killed is redelivered
+# and resumes from its checkpoint
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=None)
+def process_analytics_shard(self, day, shard, shard_count):
+    checkpoint = DailyAnalyticsService.process_shard(date.fromisoformat(day), shard, shard_count)
+    if not checkpoint["done"]:
+        # Time budget exhausted: continue from the checkpoint in a fresh run
+        raise self.retry(countdown=0)
+    return checkpoint
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def reduce_daily_analytics(shard_results, day):
+    summary = DailyAnalyticsService.reduce(date.fromisoformat(day), shard_results)
+    logger.info(f"Daily analytics for {day}: {summary}")
+    return summary
+
+
+@debounced_task()
+def recompute_user_statistics(user_id, sections):
+    """Recompute UserStatistics once per burst of writes (triggered from analytics.signals)."""
+    return UserStatisticsService.recompute(user_id, sections)
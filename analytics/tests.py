@@ -1,3 +1,377 @@
-from django.test import TestCase
+import random
+import uuid
+from datetime import date, datetime, time, timedelta
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from ninja import NinjaAPI
+from ninja_jwt.tokens import AccessToken
+
+from accounts.authentication import CachedJWTAuth
+from accounts.models import UserProfile
+from config.routing import websocket_urlpatterns
+
+from core.models import ConcentrationLevel, StatusChoices, StudySession
+from core.renderers import ORJSONParser, ORJSONRenderer
+from emotions.models import EmotionLog
+from tickets.models import Ticket
+
+from .api import router
+from .models import DailyAnalyticsSummary, DailyUserAnalytics, EmotionPatternStatistics
+from .patterns import EMOTIONS, EmotionPatternService
+from .services import DailyAnalyticsService, RealTimeAnalyticsService
+from .study_time import StudyTimePredictor
+
+User = get_user_model()
+
+api = NinjaAPI(
+    auth=CachedJWTAuth(), renderer=ORJSONRenderer(), parser=ORJSONParser(), urls_namespace="analytics-tests"
+)
+api.add_router("/analytics", router)
+urlpatterns = [path("api/", api.urls)]
+
+
+def with_settings(**values):
+    return override_settings(INTELLECTUAL_PARTNER_SETTINGS={**settings.INTELLECTUAL_PARTNER_SETTINGS, **values})
+
+
+class EmotionPatternServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+        self.start = timezone.now() - timedelta(days=2)
+
+    def create_history(self, samples=80):
+        rng = random.Random(0)
+        for _ in range(30):
+            log = EmotionLog.objects.create(user=self.user, emotion=rng.choice(EMOTIONS))
+            EmotionLog.objects.filter(pk=log.pk).update(created_at=self.start + timedelta(minutes=rng.randint(0, 2000)))
+        for _ in range(10):
+            ticket = Ticket.objects.create(
+                title="課題", creator=self.user, assignee=self.user, status=StatusChoices.COMPLETED
+            )
+            Ticket.objects.filter(pk=ticket.pk).update(updated_at=self.start + timedelta(minutes=rng.randint(0, 2000)))
+        for _ in range(samples):
+            self.create_sample(rng.randint(1, 10), self.start + timedelta(minutes=rng.randint(0, 2000)))
+
+    def create_sample(self, level, at=None):
+        sample = ConcentrationLevel.objects.create(user=self.user, level=level, session_id=uuid.uuid4())
+        if at is not None:
+            ConcentrationLevel.objects.filter(pk=sample.pk).update(timestamp=at)
+            sample.refresh_from_db()
+        return sample
+
+    def statistics(self):
+        return EmotionPatternStatistics.objects.get(user=self.user)
+
+    def test_online_statistics_match_exact_correlation(self):
+        self.create_history()
+        observations = []
+        for sample in ConcentrationLevel.objects.order_by("id"):
+            EmotionPatternService.record_sample(sample)
+            EmotionPatternService.record_sample(sample)
+            observation = EmotionPatternService.observation(self.user.id, sample.level, sample.timestamp)
+            if observation is not None:
+                observations.append(observation[1])
+
+        summary = EmotionPatternService.get_summary(self.user.id)
+        exact = np.corrcoef(np.array(observations).T)
+        self.assertEqual(summary["samples"], len(observations))
+        self.assertAlmostEqual(summary["correlations"]["valence_concentration"], round(exact[0, 1], 3))
+        self.assertAlmostEqual(summary["correlations"]["concentration_completions"], round(exact[1, 2], 3))
+
+    def test_out_of_order_commits_are_recorded_once(self):
+        EmotionLog.objects.create(user=self.user, emotion="happy")
+        first = self.create_sample(3)
+        second = self.create_sample(9)
+
+        EmotionPatternService.record_sample(second)
+        EmotionPatternService.record_sample(first)
+        EmotionPatternService.record_sample(second)
+        EmotionPatternService.record_sample(first)
+
+        statistics = self.statistics()
+        self.assertEqual(statistics.sample_count, 2)
+        self.assertEqual(statistics.emotion_stats["happy"], [2, 12.0, 0.0])
+        self.assertEqual(statistics.last_sample_id, 0)
+        self.assertEqual(sorted(sample_id for sample_id, _ in statistics.recent_sample_ids), [first.id, second.id])
+
+    def test_settled_samples_move_into_the_watermark(self):
+        EmotionLog.objects.create(user=self.user, emotion="happy")
+        old = self.create_sample(5, timezone.now() - timedelta(hours=1))
+        EmotionPatternService.record_sample(old)
+        statistics = self.statistics()
+        self.assertEqual(statistics.last_sample_id, old.id)
+        self.assertEqual(statistics.recent_sample_ids, [])
+
+        with with_settings(EMOTION_PATTERN_SETTLE_MINUTES=10):
+            recent = self.create_sample(6)
+            EmotionPatternService.record_sample(recent)
+        statistics = self.statistics()
+        self.assertEqual(statistics.last_sample_id, old.id)
+        self.assertEqual([sample_id for sample_id, _ in statistics.recent_sample_ids], [recent.id])
+
+    def test_backfill_matches_online_updates(self):
+        self.create_history()
+        samples = list(ConcentrationLevel.objects.order_by("id"))
+        for sample in samples:
+            EmotionPatternService.record_sample(sample)
+        online = self.statistics()
+
+        EmotionPatternStatistics.objects.all().delete()
+        # The last samples arrive while the backfill runs
+        EmotionPatternService.backfill([self.user.id], samples[-10].id)
+        rebuilt = self.statistics()
+
+        self.assertEqual(rebuilt.sample_count, online.sample_count)
+        self.assertTrue(np.allclose(rebuilt.means, online.means))
+        self.assertTrue(np.allclose(rebuilt.comoments, online.comoments))
+        self.assertEqual(rebuilt.emotion_stats.keys(), online.emotion_stats.keys())
+        self.assertEqual(rebuilt.last_sample_id, samples[-1].id)
+
+        EmotionPatternService.record_sample(samples[-1])
+        self.assertEqual(self.statistics().sample_count, online.sample_count)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ConcentrationFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+        self.now = timezone.now().replace(microsecond=123456)
+        # Four samples share the newest timestamp, two share an older one
+        for offset in (0, 0, 0, 0, 90, 90, 200):
+            self.create_sample(self.now - timedelta(seconds=offset))
+
+    def create_sample(self, at):
+        sample = ConcentrationLevel.objects.create(user=self.user, level=5, session_id=uuid.uuid4())
+        ConcentrationLevel.objects.filter(pk=sample.pk).update(timestamp=at)
+        return sample
+
+    def get(self, **params):
+        return self.client.get(
+            "/api/analytics/concentrations",
+            params,
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+        ).json()
+
+    def expected(self):
+        samples = ConcentrationLevel.objects.filter(user=self.user).order_by("-timestamp", "-id")
+        return list(samples.values_list("id", flat=True))
+
+    def walk(self, limit):
+        ids, cursor = [], None
+        while True:
+            page = self.get(limit=limit, **({"cursor": cursor} if cursor else {}))
+            self.assertLessEqual(len(page["items"]), limit)
+            ids.extend(item["id"] for item in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_every_page_size_walks_ties_once(self):
+        for limit in range(1, 9):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), self.expected())
+
+    def test_last_full_page_has_no_next_cursor(self):
+        page = self.get(limit=7)
+        self.assertEqual(len(page["items"]), 7)
+        self.assertIsNone(page["next_cursor"])
+
+    def test_new_samples_do_not_shift_later_pages(self):
+        first = self.get(limit=3)
+        self.create_sample(self.now + timedelta(seconds=1))
+        second = self.get(limit=3, cursor=first["next_cursor"])
+        self.assertEqual([item["id"] for item in first["items"] + second["items"]], self.expected()[1:7])
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+@with_settings(REALTIME_ANALYTICS_MAX_HZ=1000, REALTIME_ANALYTICS_ACK_WINDOW=3)
+class RealTimeAnalyticsConsumerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/realtime-analytics/{self.user.pk.hex}/"
+        )
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def publish(self, level):
+        await RealTimeAnalyticsService.apublish(self.user.id, {"concentration": level})
+
+    async def test_clients_without_acks_are_paused(self):
+        communicator = await self.connect()
+        for level in (1, 2, 3):
+            await self.publish(level)
+            frame = await communicator.receive_json_from()
+            self.assertEqual((frame["type"], frame["changed"]), ("analytics.delta", {"concentration": level}))
+
+        await self.publish(4)
+        backpressure = await communicator.receive_json_from()
+        self.assertEqual((backpressure["type"], backpressure["unacked"]), ("analytics.backpressure", 3))
+        await self.publish(5)
+        self.assertTrue(await communicator.receive_nothing())
+
+        # Resumes with the latest state only
+        await communicator.send_json_to({"type": "ack", "seq": backpressure["seq"]})
+        frame = await communicator.receive_json_from()
+        self.assertEqual((frame["seq"], frame["changed"], frame["coalesced"]), (4, {"concentration": 5}, 2))
+        await communicator.disconnect()
+
+    async def test_acks_cannot_run_ahead_of_sent_frames(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({"type": "ack", "seq": 1000})
+        for level in (1, 2, 3, 4):
+            await self.publish(level)
+            frame = await communicator.receive_json_from()
+        self.assertEqual(frame["type"], "analytics.backpressure")
+        await communicator.disconnect()
+
+    async def test_missing_session_id_is_sent_as_null(self):
+        sample = ConcentrationLevel(user=self.user, level=6, session_id=None, timestamp=timezone.now())
+        communicator = await self.connect()
+        await RealTimeAnalyticsService.apublish(self.user.id, RealTimeAnalyticsService.concentration_state(sample))
+        frame = await communicator.receive_json_from()
+        self.assertIsNone(frame["changed"]["session_id"])
+        self.assertEqual(frame["changed"]["concentration"], 6)
+        await communicator.disconnect()
+
+
+class DailyAnalyticsServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = date(2024, 5, 1)
+        start, _ = DailyAnalyticsService.day_bounds(self.day)
+        for index in range(12):
+            user = User.objects.create(username=f"user{index}", email=f"user{index}@example.com")
+            if index % 3 == 0:
+                continue
+            StudySession.objects.create(user=user, started_at=start + timedelta(hours=10), elapsed_seconds=1800)
+            sample = ConcentrationLevel.objects.create(user=user, level=index % 10 + 1, session_id=uuid.uuid4())
+            ConcentrationLevel.objects.filter(pk=sample.pk).update(timestamp=start + timedelta(hours=10))
+        # Outside the day, or inactive: not counted
+        StudySession.objects.create(user=user, started_at=start - timedelta(minutes=1), elapsed_seconds=600)
+        User.objects.create(username="inactive", email="inactive@example.com", is_active=False)
+
+    def run_shards(self, shard_count):
+        results = []
+        for shard in range(shard_count):
+            checkpoint = DailyAnalyticsService.process_shard(self.day, shard, shard_count)
+            self.assertTrue(checkpoint["done"])
+            results.append(checkpoint)
+        return results
+
+    def test_shards_cover_the_id_space_once(self):
+        ranges = [DailyAnalyticsService.shard_range(shard, 4) for shard in range(4)]
+        self.assertEqual(ranges[0][0].int, 0)
+        self.assertIsNone(ranges[-1][1])
+        for (_, upper), (lower, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(upper, lower)
+
+        results = self.run_shards(4)
+        self.assertEqual(sum(result["totals"]["users"] for result in results), 12)
+        self.assertEqual(sum(result["totals"]["active_users"] for result in results), 8)
+
+    def test_exhausted_budget_resumes_from_the_checkpoint(self):
+        runs = 0
+        with with_settings(DAILY_ANALYTICS_BATCH_SIZE=5, DAILY_ANALYTICS_SHARD_TIME_BUDGET=-1):
+            while not DailyAnalyticsService.process_shard(self.day, 0, 1)["done"]:
+                runs += 1
+        self.assertEqual(runs, 3)
+
+        totals = DailyAnalyticsService.load_checkpoint(self.day, 0)["totals"]
+        self.assertEqual((totals["users"], totals["active_users"]), (12, 8))
+        self.assertEqual((totals["study_minutes"], totals["sessions"]), (240, 8))
+        self.assertEqual(DailyUserAnalytics.objects.filter(date=self.day).count(), 8)
+
+    def test_replayed_batches_are_upserted(self):
+        self.run_shards(1)
+        cache.clear()
+        self.run_shards(1)
+        self.assertEqual(DailyUserAnalytics.objects.filter(date=self.day).count(), 8)
+        self.assertEqual({row.study_minutes for row in DailyUserAnalytics.objects.all()}, {30})
+
+    def test_reduce_publishes_the_summary(self):
+        expected = ConcentrationLevel.objects.values_list("level", flat=True)
+        summary = DailyAnalyticsService.reduce(self.day, self.run_shards(3))
+
+        self.assertEqual(summary["total_users"], 12)
+        self.assertEqual(summary["active_users"], 8)
+        self.assertEqual(summary["total_study_minutes"], 240)
+        self.assertEqual(summary["total_sessions"], 8)
+        self.assertEqual(summary["concentration_average"], round(sum(expected) / len(expected), 2))
+        self.assertEqual(DailyAnalyticsSummary.objects.get(date=self.day).shard_count, 3)
+        self.assertEqual(DailyAnalyticsService.get_summary(self.day), summary)
+        # Checkpoints are dropped: a rerun of the day starts over
+        self.assertIsNone(cache.get(DailyAnalyticsService.checkpoint_key(self.day, 0)))
+
+
+class StudyTimePredictorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+        # Monday 2024-06-03 09:00 local time: slot 9
+        self.monday = timezone.make_aware(datetime(2024, 6, 3, 9))
+        self.redis = StudyTimePredictor.get_client()
+        self.addCleanup(self.redis.delete, StudyTimePredictor.key(self.user.id))
+
+    def record(self, level, at, times=1):
+        for _ in range(times):
+            StudyTimePredictor.record(self.user.id, level, at)
+
+    def test_slots_are_ranked_by_shrunk_mean(self):
+        self.record(8, self.monday, times=10)
+        # A single excellent sample does not beat a consistently good slot
+        self.record(10, self.monday + timedelta(days=1, hours=11))
+        self.record(3, self.monday + timedelta(days=4), times=5)
+
+        slots = StudyTimePredictor.predict_optimal_study_time(self.user.id, k=3, now=self.monday)
+        self.assertEqual([slot["slot"] for slot in slots], [9, 44, 105])
+        self.assertEqual((slots[0]["weekday"], slots[0]["hour"]), ("月", 9))
+        self.assertEqual(slots[0]["weight"], 10)
+        self.assertGreater(slots[0]["expected_concentration"], slots[1]["expected_concentration"])
+        self.assertEqual(StudyTimePredictor.predict_optimal_study_time(self.user.id, k=10, now=self.monday), slots)
+
+    def test_samples_decay_with_the_half_life(self):
+        with with_settings(STUDY_TIME_HALF_LIFE_DAYS=28):
+            self.record(8, self.monday - timedelta(days=28))
+            slots = StudyTimePredictor.predict_optimal_study_time(self.user.id, now=self.monday)
+        self.assertAlmostEqual(slots[0]["weight"], 0.5)
+
+    def test_no_history_predicts_nothing(self):
+        self.assertEqual(StudyTimePredictor.predict_optimal_study_time(self.user.id, now=self.monday), [])
+
+    def test_rebuild_matches_online_records(self):
+        for offset, level in ((0, 7), (1, 9), (30, 4), (200, 6), (200, 8)):
+            at = self.monday - timedelta(hours=offset)
+            sample = ConcentrationLevel.objects.create(user=self.user, level=level, session_id=uuid.uuid4())
+            ConcentrationLevel.objects.filter(pk=sample.pk).update(timestamp=at)
+            self.record(level, at)
+        online = StudyTimePredictor.load(self.user.id, self.monday)
+
+        self.redis.delete(StudyTimePredictor.key(self.user.id))
+        self.assertEqual(StudyTimePredictor.rebuild([self.user.id]), 1)
+        rebuilt = StudyTimePredictor.load(self.user.id, self.monday)
+        self.assertTrue(np.allclose(rebuilt[0], online[0]))
+        self.assertTrue(np.allclose(rebuilt[1], online[1]))
+
+    def test_next_study_time_moves_to_the_best_slot(self):
+        self.record(8, self.monday)
+        next_time = StudyTimePredictor.next_study_time(self.user.id, self.monday + timedelta(hours=3), 60)
+        self.assertEqual(next_time, self.monday + timedelta(days=7))
+
+    def test_next_study_time_without_history_uses_the_profile(self):
+        UserProfile.objects.update_or_create(
+            user=self.user, defaults={"preferred_study_time_start": time(18), "preferred_study_time_end": time(20)}
+        )
+        next_time = StudyTimePredictor.next_study_time(self.user.id, self.monday, 60)
+        self.assertEqual(next_time, self.monday.replace(hour=18))
@@ -7,7 +7,6 @@ WebSocket (Django Channels) 対応のASGI設定
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 
 # Django設定を読み込み
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
@@ -16,15 +15,15 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 django_asgi_app = get_asgi_application()
 
 # WebSocketルーティングをインポート
-from .routing import websocket_urlpatterns
+from .routing import WebSocketMiddlewareStack, websocket_urlpatterns
 
 # ASGI アプリケーション設定
 application = ProtocolTypeRouter(
     {
         # HTTP リクエスト (通常のDjango)
         "http": django_asgi_app,
-        # WebSocket リクエスト
-        "websocket": AuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
+        # WebSocket リクエスト (接続数は認証より前, メッセージレートは認証後に判定)
+        "websocket": WebSocketMiddlewareStack(URLRouter(websocket_urlpatterns)),
     }
 )
 
@@ -4,13 +4,16 @@ Celery configuration for Intellectual Partner application
 
 import os
 from celery import Celery
-from django.conf import settings
+from celery.schedules import crontab
+from celery.signals import celeryd_init
+from core.task_metrics import InstrumentedTask
 
 # Django設定モジュールを設定
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 # Celeryアプリケーションのインスタンス作成
-app = Celery("intellectual_partner")
+# 全タスクの基底クラスで待ち時間・実行時間・リトライ・結果サイズを計測する (core.task_metrics)
+app = Celery("intellectual_partner", task_cls=InstrumentedTask)
 
 # Django設定からCelery設定を読み込み
 app.config_from_object("django.conf:settings", namespace="CELERY")
@@ -18,6 +21,61 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 # タスクの自動検出
 app.autodiscover_tasks()
 
+
+def periodic(task, schedule, lock_ttl, jitter=300, **options):
+    """
+    core.tasks.run_periodic 経由で実行するBeatエントリ (core.scheduling 参照)
+    複数のBeatが動いていても lock_ttl 秒に1回だけ実行し, タスクごとに固定のずらし (jitter 秒以内) を入れる
+    """
+    return {
+        "task": "core.tasks.run_periodic",
+        "schedule": schedule,
+        "args": (task, lock_ttl, jitter, options),
+    }
+
+
+# ワーカープロファイル (キューごと)
+# 対話レーン (interactive): ユーザー操作に応じる短いタスク. 同時実行数を多く, 先読みあり
+# バッチレーン (analytics, notifications, teacher_support): 長時間の定期処理. 先読みは1つだけにして
+# 未処理のバックログを1つのワーカーが抱え込まないようにし, メモリが増えたプロセスは早めに入れ替える
+# 起動例: celery -A config worker -Q analytics (プロファイルは -Q の最初のキューから選ぶ. コマンドラインの指定が優先)
+WORKER_PROFILES = {
+    "interactive": {
+        "worker_concurrency": 8,
+        "worker_prefetch_multiplier": 4,
+        "worker_max_tasks_per_child": 5000,
+        "worker_max_memory_per_child": 200_000,  # KB
+    },
+    "notifications": {
+        "worker_concurrency": 4,
+        "worker_prefetch_multiplier": 2,
+        "worker_max_tasks_per_child": 1000,
+        "worker_max_memory_per_child": 300_000,  # KB
+    },
+    "analytics": {
+        "worker_concurrency": 4,
+        "worker_prefetch_multiplier": 1,
+        "worker_max_tasks_per_child": 100,
+        "worker_max_memory_per_child": 500_000,  # KB
+    },
+    "teacher_support": {
+        "worker_concurrency": 2,
+        "worker_prefetch_multiplier": 1,
+        "worker_max_tasks_per_child": 100,
+        "worker_max_memory_per_child": 500_000,  # KB
+    },
+}
+
+
+@celeryd_init.connect
+def apply_worker_profile(sender=None, conf=None, options=None, **kwargs):
+    """-Q で指定された最初のキューのプロファイルをワーカー設定に反映する"""
+    queues = (options or {}).get("queues") or [conf.task_default_queue]
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    conf.update(WORKER_PROFILES.get(queues[0], {}))
+
+
 # タスクの設定
 app.conf.update(
     task_serializer="json",
@@ -26,51 +84,101 @@ app.conf.update(
     timezone="Asia/Tokyo",
     enable_utc=True,
     # タスクのルーティング
+    # 個別指定のないタスクは対話レーンで実行し, 夜間のバッチ処理の滞留に巻き込まれないようにする
+    # レーン (キュー) 間の分離はワーカーを分けて行い, レーン内の順序は優先度で決める
+    # Redisブローカーの優先度は 0 が最優先で, priority_steps の段階に丸められる
+    # 0: ユーザーが結果を待っている処理, 6: 通常のバッチ処理 (既定), 9: 削除などの後回しにできる処理
+    # 先読みした分は優先度に関係なく先に実行されるため, バッチレーンは先読みを1にしている (WORKER_PROFILES)
+    task_default_queue="interactive",
+    task_default_priority=6,
+    task_queue_max_priority=9,  # RabbitMQ用 (Redisでは priority_steps を使う)
+    broker_transport_options={"priority_steps": [0, 3, 6, 9], "queue_order_strategy": "priority"},
     task_routes={
+        "notifications.tasks.fan_out_notification": {"queue": "interactive", "priority": 0},
+        "notifications.tasks.flush_pending_notifications": {"queue": "interactive", "priority": 0},
+        "analytics.tasks.recompute_user_statistics": {"queue": "analytics", "priority": 0},
+        "core.tasks.purge_expired_data": {"queue": "analytics", "priority": 9},
+        "notifications.tasks.cleanup_old_notifications": {"queue": "notifications", "priority": 9},
         "analytics.tasks.*": {"queue": "analytics"},
+        "emotions.tasks.*": {"queue": "analytics"},
         "notifications.tasks.*": {"queue": "notifications"},
+        "tickets.tasks.*": {"queue": "notifications"},
         "teacher_support.tasks.*": {"queue": "teacher_support"},
     },
-    # ワーカー設定
+    # ワーカー設定 (キューごとの値は WORKER_PROFILES)
     worker_prefetch_multiplier=4,
     worker_max_tasks_per_child=1000,
     # タスクの実行時間制限
-    task_sort_time_limit=300,  # 5分
+    # 長時間のタスクは処理予算 (480秒) で区切って続きを再投入するので, ソフトリミットはそれより長くする
+    task_soft_time_limit=540,  # 9分
     task_time_limit=600,  # 10分
     # 結果の保存期間
     result_expires=3600,  # 1時間
     # 定期タスクのスケジュール (Celery Beat)
     beat_schedule={
         # 放置チケット検出 (毎日午前9時)
-        "defeat-abandoned-tickets": {
-            "task": "tickets.tasks.detect_abandoned_tickets",
-            "schedule": 60.0 * 60.0 * 24.0,  # 24時間ごと
-            "options": {"queue": "notifications"},
-        },
+        "defeat-abandoned-tickets": periodic(
+            "tickets.tasks.detect_abandoned_tickets",
+            crontab(hour=9, minute=0),
+            lock_ttl=60 * 60 * 23,
+            queue="notifications",
+        ),
         # 学習データ分析 (毎日午前2時)
-        "daily_analytics": {
-            "task": "analytics.tasks.daily_analytics_processing",
-            "schedule": 60.0 * 60.0 * 24.0,  # 24時間ごと
-            "options": {"queue": "analytics"},
-        },
-        # 週次レポート生成 (毎週月曜日午前8時)
-        "weekly-reports": {
-            "task": "teacher_support.tasks.generate_weekly_reports",
-            "schedule": 60.0 * 60.0 * 24.0 * 7.0,  # 週1回
-            "options": {"queue": "teacher_support"},
-        },
-        # 通知クリーンアップ(毎日午前3時)
-        "cleanup-old-notifications": {
-            "task": "notifications.tasks.cleanup_old_notifications",
-            "schedule": 60.0 * 60.0 * 24.0,  # 24時間ごと
-            "options": {"queue": "notifications"},
-        },
-        # 感情データ集計 (毎時)
-        "hourly-emotion-aggregation": {
-            "task": "emotions.tasks.aggregation_emotion_data",
-            "schedule": 60.0 * 60.0,  # 1時間ごと
-            "options": {"queue": "analytics"},
-        },
+        "daily_analytics": periodic(
+            "analytics.tasks.daily_analytics_processing",
+            crontab(hour=2, minute=0),
+            lock_ttl=60 * 60 * 23,
+            queue="analytics",
+        ),
+        # 週次レポート生成 (毎週月曜日午前8時, 日曜分の日次分析の後)
+        "weekly-reports": periodic(
+            "teacher_support.tasks.generate_weekly_reports",
+            crontab(hour=8, minute=0, day_of_week="mon"),
+            lock_ttl=60 * 60 * 24 * 6,
+            queue="teacher_support",
+        ),
+        # クラス別の学習時間・完了率の分布 (毎日午前4時, 日次分析の後)
+        "class-percentile-sketches": periodic(
+            "teacher_support.tasks.build_class_percentile_sketches",
+            crontab(hour=4, minute=0),
+            lock_ttl=60 * 60 * 23,
+            queue="teacher_support",
+        ),
+        # 通知クリーンアップ (毎日午前3時)
+        "cleanup-old-notifications": periodic(
+            "notifications.tasks.cleanup_old_notifications",
+            crontab(hour=3, minute=0),
+            lock_ttl=60 * 60 * 23,
+            queue="notifications",
+        ),
+        # 保持期間切れの感情ログ・集中度記録の削除 (毎日午前3時30分)
+        "purge-expired-data": periodic(
+            "core.tasks.purge_expired_data",
+            crontab(hour=3, minute=30),
+            lock_ttl=60 * 60 * 23,
+        ),
+        # 学習セッションの一括書き込み (毎分)
+        "flush-study-sessions": periodic(
+            "core.tasks.flush_study_sessions",
+            crontab(),
+            lock_ttl=50,
+            jitter=0,
+        ),
+        # 未配信通知の再送 (毎分). 送信に失敗した通知は予約期限切れの後にここで再送される
+        "flush-pending-notifications": periodic(
+            "notifications.tasks.flush_pending_notifications",
+            crontab(),
+            lock_ttl=50,
+            jitter=0,
+        ),
+        # 感情データ集計 (毎時5分)
+        "hourly-emotion-aggregation": periodic(
+            "emotions.tasks.aggregation_emotion_data",
+            crontab(minute=5),
+            lock_ttl=60 * 50,
+            jitter=120,
+            queue="analytics",
+        ),
     },
 )
 
@@ -81,39 +189,5 @@ def debug_task(self):
     print(f"Request: {self.request!r}")
 
 
-# エラーハンドリング設定
-@app.task(bind=True)
-def handle_task_failure(self, exc, task_id, args, kwargs, traceback):
-    """タスク失敗時の処理"""
-    print(f"Task {task_id} failed: {exc}")
-
-    # Sentryなどの監視システムに送信
-    if hasattr(settings, "SENTRY_DSN") and settings.SENTRY_DSN:
-        import sentry_sdk
-
-        sentry_sdk.capture_exception(exc)
-
-
-# カスタムタスククラス
-class CallbackTask(app.Task):
-    """コールバック付きタスク基底クラス"""
-
-    def on_success(self, retval, task_id, args, kwargs):
-        """タスク成功時のコールバック"""
-        print(f"Task {task_id} succeeded with result: {retval}")
-
-    def on_failure(self, exc, task_id, args, kwargs, einfo):
-        """タスク失敗時のコールバック"""
-        print(f"Task {task_id} failed: {exc}")
-        handle_task_failure.delay(exc, task_id, args, kwargs, str(einfo))
-
-    def on_retry(self, exc, task_id, args, kwargs, einfo):
-        """ "タスクリトライ時のコールバック"""
-        print(f"Task {task_id} is being retried: {exc}")
-
-
-# デフォルトタスククラスを設定
-app.Task = CallbackTask
-
 if __name__ == "__main__":
     app.start()
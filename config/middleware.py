@@ -2,9 +2,16 @@
 カスタムミドルウェア
 """
 
+import asyncio
+import math
 import time
+import uuid
 import logging
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from core.utils import hash_sensitive_data
 
 logger = logging.getLogger(__name__)
 
@@ -32,3 +39,271 @@ class IntellectualPartnerHeaderMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         response["X-Intellectual-Partner-Version"] = "1.0.0"
         return response
+
+
+class TokenBucket:
+    """メッセージレート制限用のトークンバケット (プロセス内)"""
+
+    __slots__ = ("capacity", "refill_rate", "tokens", "updated_at")
+
+    def __init__(self, limit, period):
+        self.capacity = limit
+        self.refill_rate = limit / period
+        self.tokens = float(limit)
+        self.updated_at = time.monotonic()
+
+    def consume(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ConnectionTracker:
+    """
+    同時接続数カウンタ
+
+    カウントはプロセス内で即時に増減し, sync_interval ごとにRedisへ同期する.
+    Redisにはキーごとのハッシュに「ワーカーID -> 接続数:更新時刻」を保存し,
+    他ワーカーの接続数を合算して全体の接続数とする. Redisに接続できない場合はプロセス内のカウントのみで判定する.
+    接続を保持している間はバックグラウンドで同期を続けるため, 新規接続のないワーカーのカウントも
+    stale_after で失効せず, 切断後の減少も sync_interval 以内に反映される.
+    """
+
+    def __init__(self, redis_url=None, sync_interval=5.0, stale_after=30):
+        self.redis_url = redis_url or settings.REDIS_URL
+        self.sync_interval = sync_interval
+        self.stale_after = stale_after
+        self.worker_id = uuid.uuid4().hex
+        self.local = defaultdict(int)
+        self.remote = {}
+        self.last_synced_at = 0.0
+        self._client = None
+        self._refresher = None
+        # Redisに自ワーカーのカウントを書き込んであるキー (切断後に削除するため)
+        self.synced_keys = set()
+
+    def count(self, key):
+        return self.local.get(key, 0) + self.remote.get(key, 0)
+
+    def acquire(self, limits):
+        """全てのキーが上限未満の場合のみ接続数を確保する"""
+        if any(self.count(key) >= limit for key, limit in limits.items()):
+            return False
+        for key in limits:
+            self.local[key] += 1
+        return True
+
+    def release(self, keys):
+        for key in keys:
+            self.local[key] -= 1
+            if self.local[key] <= 0:
+                del self.local[key]
+
+    def get_client(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+
+            self._client = aioredis.from_url(self.redis_url)
+        return self._client
+
+    async def maybe_sync(self):
+        """一定間隔でプロセス内カウントをRedisへ書き込み, 他ワーカーの接続数を取得する"""
+        if time.monotonic() - self.last_synced_at < self.sync_interval:
+            return
+        await self.sync()
+
+    def ensure_refresh(self):
+        """接続を保持している間, sync_interval ごとに同期するタスクを起動する"""
+        if not math.isfinite(self.sync_interval):
+            return
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self.refresh())
+
+    async def refresh(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+            # 全接続の切断後も一度同期してRedis上のカウントを消してから終了する
+            if not self.local:
+                return
+
+    async def sync(self):
+        self.last_synced_at = time.monotonic()
+
+        keys = list(self.local.keys() | self.remote.keys() | self.synced_keys)
+        if not keys:
+            return
+
+        wall_clock = int(time.time())
+        written = {key for key in keys if key in self.local}
+        try:
+            pipe = self.get_client().pipeline(transaction=False)
+            for key in keys:
+                redis_key = f"intellectual_partner:ws_conn:{key}"
+                if key in self.local:
+                    pipe.hset(redis_key, self.worker_id, f"{self.local[key]}:{wall_clock}")
+                else:
+                    pipe.hdel(redis_key, self.worker_id)
+                pipe.expire(redis_key, self.stale_after)
+                pipe.hgetall(redis_key)
+            results = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"WebSocket connection counter sync failed: {e}")
+            return
+
+        self.synced_keys = written
+        remote = {}
+        for key, workers in zip(keys, results[2::3]):
+            total = 0
+            for worker_id, value in workers.items():
+                connections, updated_at = value.decode().split(":")
+                # 停止したワーカーの古いカウントは無視する
+                if worker_id.decode() != self.worker_id and wall_clock - int(updated_at) < self.stale_after:
+                    total += int(connections)
+            if total:
+                remote[key] = total
+        self.remote = remote
+
+
+def parse_rate(rate):
+    """django-ratelimit形式のレート ("60/m", "100/h", "10/5m") を (回数, 秒数) に変換"""
+    count, period = rate.split("/")
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return int(count), int(period[:-1] or 1) * units[period[-1]]
+
+
+def get_client_ip(scope, trusted_proxy_count=0):
+    """
+    接続元IPを返す
+
+    X-Forwarded-For はクライアントが自由に付けられるため, trusted_proxy_count 台の
+    リバースプロキシの背後にある場合のみ, それらのプロキシが追加した右端から数えた値を使う.
+    """
+    if trusted_proxy_count > 0:
+        forwarded_for = dict(scope.get("headers", [])).get(b"x-forwarded-for", b"").decode()
+        forwarded_for = [address.strip() for address in forwarded_for.split(",") if address.strip()]
+        if forwarded_for:
+            return forwarded_for[-min(trusted_proxy_count, len(forwarded_for))]
+    return (scope.get("client") or ["unknown"])[0]
+
+
+class WebSocketRateLimitMiddleware:
+    """
+    WebSocketの同時接続数制限ミドルウェア
+
+    - ユーザー (セッションCookie) 単位とIP単位の同時接続数上限
+
+    認証・ルーティングより外側に配置し, 上限を超えた接続は
+    AuthMiddlewareStack や URLRouter を通さずに閉じる.
+    受信メッセージのレート制限は認証後の WebSocketMessageRateLimitMiddleware で行う.
+    """
+
+    # 接続上限超過時のクローズコード
+    CLOSE_CODE_TOO_MANY_CONNECTIONS = 4029
+
+    def __init__(self, inner, tracker=None):
+        self.inner = inner
+        app_settings = settings.INTELLECTUAL_PARTNER_SETTINGS
+        self.max_connections_per_user = app_settings.get("WEBSOCKET_MAX_CONNECTIONS_PER_USER", 5)
+        self.max_connections_per_ip = app_settings.get("WEBSOCKET_MAX_CONNECTIONS_PER_IP", 20)
+        self.trusted_proxy_count = app_settings.get("WEBSOCKET_TRUSTED_PROXY_COUNT", 0)
+        self.tracker = tracker or ConnectionTracker()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            return await self.inner(scope, receive, send)
+
+        limits = self.get_connection_limits(scope)
+        await self.tracker.maybe_sync()
+
+        if not self.tracker.acquire(limits):
+            # websocket.connect を受け取ってから accept せずに閉じる (ハンドシェイクは403になる)
+            await receive()
+            await send({"type": "websocket.close", "code": self.CLOSE_CODE_TOO_MANY_CONNECTIONS})
+            logger.info(f"WebSocket connection rejected: {', '.join(limits)}")
+            return
+        self.tracker.ensure_refresh()
+
+        try:
+            return await self.inner(scope, receive, send)
+        finally:
+            self.tracker.release(limits)
+
+    def get_connection_limits(self, scope):
+        """接続数を数えるキーと上限を返す (認証前に取得できる情報のみ使用)"""
+        client_ip = get_client_ip(scope, self.trusted_proxy_count)
+
+        limits = {f"ip:{client_ip}": self.max_connections_per_ip}
+
+        cookie = dict(scope.get("headers", [])).get(b"cookie", b"").decode()
+        session_key = SimpleCookie(cookie).get(settings.SESSION_COOKIE_NAME)
+        if session_key is not None:
+            limits[f"user:{hash_sensitive_data(session_key.value)[:32]}"] = self.max_connections_per_user
+        return limits
+
+
+class WebSocketMessageRateLimitMiddleware:
+    """
+    WebSocketの受信メッセージレート制限ミドルウェア (RATELIMIT_DECORATORS["websocket"])
+
+    AuthMiddlewareStack の内側に配置し, 認証済みユーザーはユーザーID単位, 匿名接続は
+    接続元IP単位でトークンバケットを共有する (Cookieを付け替えても制限は回避できない).
+
+    バケットはプロセス内にあり, ワーカー間では共有しない. 同じユーザーの接続が
+    N個のワーカーに分散した場合, 全体の上限は最大でN倍になる. 接続数の上限
+    (WebSocketRateLimitMiddleware) があるため, 1ユーザーあたりの総量は抑えられる.
+    """
+
+    # メッセージレート超過時のクローズコード
+    CLOSE_CODE_MESSAGE_RATE_EXCEEDED = 4008
+
+    def __init__(self, inner):
+        self.inner = inner
+        app_settings = settings.INTELLECTUAL_PARTNER_SETTINGS
+        self.trusted_proxy_count = app_settings.get("WEBSOCKET_TRUSTED_PROXY_COUNT", 0)
+        self.message_limit, self.message_period = parse_rate(settings.RATELIMIT_DECORATORS.get("websocket", "60/m"))
+        self.buckets = {}
+        # バケットごとの接続数 (最後の接続が閉じたらバケットを破棄する)
+        self.connections = defaultdict(int)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            return await self.inner(scope, receive, send)
+
+        bucket_key = self.get_bucket_key(scope)
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self.buckets[bucket_key] = TokenBucket(self.message_limit, self.message_period)
+        self.connections[bucket_key] += 1
+
+        try:
+            return await self.inner(scope, self.limit_messages(receive, send, bucket), send)
+        finally:
+            self.connections[bucket_key] -= 1
+            if self.connections[bucket_key] <= 0:
+                del self.connections[bucket_key]
+                self.buckets.pop(bucket_key, None)
+
+    def get_bucket_key(self, scope):
+        """認証済みならユーザーID, 匿名なら接続元IP"""
+        user = scope.get("user")
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        return f"ip:{get_client_ip(scope, self.trusted_proxy_count)}"
+
+    def limit_messages(self, receive, send, bucket):
+        """受信メッセージにレート制限をかけた receive を返す"""
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "websocket.receive" and not bucket.consume():
+                logger.warning("WebSocket message rate exceeded, closing connection")
+                await send({"type": "websocket.close", "code": self.CLOSE_CODE_MESSAGE_RATE_EXCEEDED})
+                return {"type": "websocket.disconnect", "code": self.CLOSE_CODE_MESSAGE_RATE_EXCEEDED}
+            return message
+
+        return limited_receive
@@ -3,14 +3,14 @@ WebSocket routing configuration for Intellectual Partner
 """
 
 from django.urls import re_path
+from channels.auth import AuthMiddlewareStack
 from channels.routing import URLRouter
+from .middleware import WebSocketMessageRateLimitMiddleware, WebSocketRateLimitMiddleware
 
 # WebSocket コンシューマのインポート
-from notifications.consumers import (
-    NotificationsConsumer,
-    TeacherDashboardConsumer,
-    StudySessionConsumer,
-)
+from core.consumers import StudySessionConsumer
+from notifications.consumers import NotificationsConsumer
+from teacher_support.consumers import TeacherDashboardConsumer
 from analytics.consumers import (
     AnalyticsConsumer,
     RealTimeAnalyticsConsumer,
@@ -30,7 +30,13 @@ websocket_urlpatterns = [
         TeacherDashboardConsumer.as_asgi(),
         name="teacher_dashboard_ws",
     ),
-    # 学習セッション用WebSocket (リアルタイム進捗更新)
+    # 学習セッション開始用WebSocket (セッションIDはサーバーで発行)
+    re_path(
+        r"ws/study-session/$",
+        StudySessionConsumer.as_asgi(),
+        name="study_session_start_ws",
+    ),
+    # 学習セッション用WebSocket (リアルタイム進捗更新・再接続)
     re_path(
         r"ws/study-session/(?P<session_id>\w+)/$",
         StudySessionConsumer.as_asgi(),
@@ -66,20 +72,11 @@ if settings.DEBUG:
     websocket_urlpatterns.extend(development_websocket_patterns)
 
 
-# WebSocketミドルウェア設定 (将来的な拡張用)
-class WebSocketRateLimitMiddleware:
-    """WebSocketの接続数制限ミドルウェア"""
-
-    def __init__(self, inner):
-        self.inner = inner
-
-    async def __call__(self, scope, receive, send):
-        # レート制限ロジック (将来実装)
-        # 現在はそのまま通す
-        return await self.inner(scope, receive, send)
-
-
 # カスタムWebSocketミドルウェアスタック
 def WebSocketMiddlewareStack(inner):
-    """カスタムWebSocketミドルウェアスタック"""
-    return WebSocketRateLimitMiddleware(inner)
+    """
+    カスタムWebSocketミドルウェアスタック
+
+    接続数の制限は認証より外側, メッセージレートの制限は認証済みユーザーが分かる内側で行う.
+    """
+    return WebSocketRateLimitMiddleware(AuthMiddlewareStack(WebSocketMessageRateLimitMiddleware(inner)))
@@ -411,8 +411,59 @@ INTELLECTUAL_PARTNER_SETTINGS = {
     "DEFAULT_STUDY_SESSION_DURATION": config("DEFAULT_STUDY_SESSION_DURATION", default=25, cast=int),  # minutes
     "NOTIFICATION_BATCH_SIZE": config("NOTIFICATION_BATCH_SIZE", default=100, cast=int),
     "ANALYTICS_RETENTION_DAYS": config("ANALYTICS_RETENTION_DAYS", default=365, cast=int),
+    "NOTIFICATION_RETENTION_DAYS": config("NOTIFICATION_RETENTION_DAYS", default=90, cast=int),
     "ENABLE_GAMIFICATION": config("ENABLE_GAMIFICATION", default=True, cast=bool),
     "ENABLE_TEACHER_SUPPORT": config("ENABLE_TEACHER_SUPPORT", default=True, cast=bool),
+    "AUTH_PRINCIPAL_CACHE_TIMEOUT": config("AUTH_PRINCIPAL_CACHE_TIMEOUT", default=60, cast=int),  # seconds
+    "WEBSOCKET_MAX_CONNECTIONS_PER_USER": config("WEBSOCKET_MAX_CONNECTIONS_PER_USER", default=5, cast=int),
+    "WEBSOCKET_MAX_CONNECTIONS_PER_IP": config("WEBSOCKET_MAX_CONNECTIONS_PER_IP", default=20, cast=int),
+    # WebSocketの前段にある信頼できるリバースプロキシの台数 (0ならX-Forwarded-Forを無視する)
+    "WEBSOCKET_TRUSTED_PROXY_COUNT": config("WEBSOCKET_TRUSTED_PROXY_COUNT", default=0, cast=int),
+    "REALTIME_ANALYTICS_MAX_HZ": config("REALTIME_ANALYTICS_MAX_HZ", default=2.0, cast=float),
+    # websocket.send!* channel_capacity と揃える
+    "REALTIME_ANALYTICS_ACK_WINDOW": config("REALTIME_ANALYTICS_ACK_WINDOW", default=20, cast=int),
+    "TEACHER_DASHBOARD_INACTIVE_DAYS": config("TEACHER_DASHBOARD_INACTIVE_DAYS", default=3, cast=int),
+    "STUDY_SESSION_IDLE_TIMEOUT": config("STUDY_SESSION_IDLE_TIMEOUT", default=300, cast=int),  # seconds
+    "STUDY_SESSION_STREAM_MAXLEN": config("STUDY_SESSION_STREAM_MAXLEN", default=500, cast=int),
+    "STUDY_SESSION_FLUSH_BATCH_SIZE": config("STUDY_SESSION_FLUSH_BATCH_SIZE", default=500, cast=int),
+    "ABANDONED_TICKET_DAYS": config("ABANDONED_TICKET_DAYS", default=7, cast=int),
+    "ABANDONED_TICKET_CHUNK_SIZE": config("ABANDONED_TICKET_CHUNK_SIZE", default=2000, cast=int),
+    # task_time_limit (600秒) より短く打ち切り, 残りは次のタスクで処理する
+    "ABANDONED_TICKET_TIME_BUDGET": config("ABANDONED_TICKET_TIME_BUDGET", default=480, cast=int),  # seconds
+    # 提案通知をユーザーごとの枠に分散して配信する時間幅 (毎分の配信ジョブで送られる)
+    "ABANDONED_TICKET_DELIVERY_WINDOW": config("ABANDONED_TICKET_DELIVERY_WINDOW", default=3600, cast=int),  # seconds
+    # ユーザーIDの範囲で分割したシャード数 (ワーカー数以上にしておく)
+    "DAILY_ANALYTICS_SHARD_COUNT": config("DAILY_ANALYTICS_SHARD_COUNT", default=32, cast=int),
+    "DAILY_ANALYTICS_BATCH_SIZE": config("DAILY_ANALYTICS_BATCH_SIZE", default=500, cast=int),
+    # 時間切れのシャードはチェックポイントから再実行する
+    "DAILY_ANALYTICS_SHARD_TIME_BUDGET": config("DAILY_ANALYTICS_SHARD_TIME_BUDGET", default=480, cast=int),  # seconds
+    "DAILY_ANALYTICS_SUMMARY_CACHE_TIMEOUT": config("DAILY_ANALYTICS_SUMMARY_CACHE_TIMEOUT", default=86400, cast=int),  # seconds
+    "EMOTION_AGGREGATION_BATCH_SIZE": config("EMOTION_AGGREGATION_BATCH_SIZE", default=5000, cast=int),
+    # 遅れてコミットされた行を拾うため, ウォーターマークより前のこの秒数を再走査する
+    "EMOTION_AGGREGATION_OVERLAP_SECONDS": config("EMOTION_AGGREGATION_OVERLAP_SECONDS", default=300, cast=int),
+    "EMOTION_AGGREGATION_TIME_BUDGET": config("EMOTION_AGGREGATION_TIME_BUDGET", default=480, cast=int),  # seconds
+    "WEEKLY_REPORT_STUDENT_CHUNK_SIZE": config("WEEKLY_REPORT_STUDENT_CHUNK_SIZE", default=500, cast=int),
+    # 保持期間切れデータの削除 (core.retention): 1回のDELETEの行数とバッチ間の待機秒数
+    "RETENTION_BATCH_SIZE": config("RETENTION_BATCH_SIZE", default=5000, cast=int),
+    "RETENTION_BATCH_SLEEP": config("RETENTION_BATCH_SLEEP", default=0.1, cast=float),  # seconds
+    "RETENTION_TIME_BUDGET": config("RETENTION_TIME_BUDGET", default=480, cast=int),  # seconds
+    # 同じユーザーの再集計タスクは, 最後の書き込みからこの秒数だけ待ってまとめて1回実行する (core.debounce)
+    "DEBOUNCE_WINDOW": config("DEBOUNCE_WINDOW", default=30, cast=int),  # seconds
+    "DEBOUNCE_MAX_WAIT": config("DEBOUNCE_MAX_WAIT", default=300, cast=int),  # seconds
+    # 感情パターン分析: 集中度記録の前のこの分数以内の感情・チケット完了を関連付ける
+    "EMOTION_PATTERN_CONTEXT_MINUTES": config("EMOTION_PATTERN_CONTEXT_MINUTES", default=120, cast=int),
+    # 相関・感情別平均を表示するのに必要な観測数
+    "EMOTION_PATTERN_MIN_SAMPLES": config("EMOTION_PATTERN_MIN_SAMPLES", default=10, cast=int),
+    # 集中度記録のトランザクションがコミットされるまでの最大分数 (これより古い記録は反映順序に依存しない)
+    "EMOTION_PATTERN_SETTLE_MINUTES": config("EMOTION_PATTERN_SETTLE_MINUTES", default=10, cast=int),
+    # 学習時間帯予測 (曜日×時間の168区分): 集中度記録の重みが半分になる日数
+    "STUDY_TIME_HALF_LIFE_DAYS": config("STUDY_TIME_HALF_LIFE_DAYS", default=28, cast=float),
+    # 各区分の平均をユーザー全体の平均に寄せる擬似記録数 (記録の少ない区分が上位に来ないように)
+    "STUDY_TIME_PRIOR_WEIGHT": config("STUDY_TIME_PRIOR_WEIGHT", default=3.0, cast=float),
+    # 次回学習時刻の候補にする上位区分数
+    "STUDY_TIME_TOP_SLOTS": config("STUDY_TIME_TOP_SLOTS", default=12, cast=int),
+    # 環境要因分析で返す環境の組み合わせの数 (信頼区間の下限が高い順)
+    "STUDY_ENVIRONMENT_COMBINATION_LIMIT": config("STUDY_ENVIRONMENT_COMBINATION_LIMIT", default=20, cast=int),
 }
 
 # DEVELOPMENT SETTINGS
@@ -440,7 +491,7 @@ AUTH_USER_MODEL = "accounts.User"
 
 # APIレスポンス最適化設定
 DEFAULT_RENDERER_CLASSES = [
-    "ninja.renderers.JSONRenderer",
+    "core.renderers.ORJSONRenderer",
 ]
 
 # ファイルアップロード設定（API用）
@@ -7,14 +7,17 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from ninja import NinjaAPI
-from ninja_jwt.authentication import JWTAuth
+from accounts.authentication import CachedJWTAuth
+from core.renderers import ORJSONParser, ORJSONRenderer
 
 # Django Ninja API インスタンス
 api = NinjaAPI(
     title="学習支援アプリ API",
     version="1.0.0",
     description="知的な伴奏者 - 学習支援アプリのRESTful API",
-    auth=JWTAuth(),
+    auth=CachedJWTAuth(),
+    renderer=ORJSONRenderer(),
+    parser=ORJSONParser(),
     docs_url="api/docs" if settings.DEBUG else None,
 )
 
@@ -13,6 +13,20 @@ MIN_CONCENTRATION_LEVEL = 1
 MAX_CONCENTRATION_LEVEL = 10
 GOOD_CONCENTRATION_THRESHOLD = 7
 
+# Emotion valence (-2: very negative .. 2: very positive), keyed by EmotionChoices value
+EMOTION_VALENCE = {
+    "very_happy": 2,
+    "happy": 1,
+    "neutral": 0,
+    "sad": -1,
+    "very_sad": -2,
+    "excited": 1,
+    "frustrated": -1,
+    "tired": -1,
+    "stressed": -2,
+    "relaxed": 1,
+}
+
 # Study environment ratings
 MIN_ENVIRONMENT_RATING = 1
 MAX_ENVIRONMENT_RATING = 5
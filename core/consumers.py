@@ -0,0 +1,154 @@
+"""
+Common WebSocket consumer base classes, and the study session consumer.
+"""
+
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from . import framing
+from .exceptions import ApplicationError
+from .renderers import dumps
+from .services import StudySessionStateService
+import orjson
+
+
+class BaseJsonConsumer(AsyncJsonWebsocketConsumer):
+    """
+    JSON consumer using orjson for frame encoding/decoding.
+    Consumers with binary_framing = True also accept the MessagePack subprotocol (core.framing).
+    """
+
+    binary_framing = False
+    use_msgpack = False
+
+    @classmethod
+    async def decode_json(cls, text_data):
+        return orjson.loads(text_data)
+
+    @classmethod
+    async def encode_json(cls, content):
+        return dumps(content).decode()
+
+    async def accept(self, subprotocol=None):
+        if subprotocol is None:
+            subprotocol = framing.select_subprotocol(self.scope.get("subprotocols") or [], self.binary_framing)
+        self.use_msgpack = subprotocol == framing.SUBPROTOCOL_MSGPACK
+        await super().accept(subprotocol=subprotocol)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data and self.use_msgpack:
+            await self.receive_json(framing.unpack(bytes_data), **kwargs)
+        else:
+            await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+    async def send_json(self, content, close=False):
+        if self.use_msgpack:
+            await self.send(bytes_data=framing.pack(content), close=close)
+        else:
+            await super().send_json(content, close=close)
+
+    def is_owner(self, user_id):
+        """Check that the authenticated user owns the requested resource (URL ids are UUID hex)."""
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            return False
+        return user.pk.hex == user_id.replace("-", "")
+
+
+def changed_fields(previous, current):
+    """Fields of ``current`` whose value differs from ``previous`` (delta compression)."""
+    return {key: value for key, value in current.items() if key not in previous or previous[key] != value}
+
+
+class StudySessionConsumer(BaseJsonConsumer):
+    """
+    Live study session, resumable across reconnects.
+
+    State and the event log live in Redis (core.services.StudySessionStateService).
+    Clients start a session on ws/study-session/ and reconnect to
+    ws/study-session/<session_id>/ with the id of the first state frame; ids of
+    sessions that do not exist are refused. A reconnecting client passes ?last_event_id=<id> (or sends {"type": "resume",
+    "last_event_id": <id>}) and receives only the events it missed; a full state
+    snapshot is sent instead on first connect or when the missed events were trimmed.
+    Clients may negotiate MessagePack framing (core.framing).
+    """
+
+    binary_framing = True
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.session_id = self.scope["url_route"]["kwargs"].get("session_id")
+        if self.session_id is None:
+            # ws/study-session/ starts a new session, its id is sent in the first state frame
+            self.session_id, state = await sync_to_async(StudySessionStateService.start)(user.pk)
+            loaded = (state, None)
+        else:
+            loaded = await sync_to_async(StudySessionStateService.load)(self.session_id, user.pk)
+        if loaded is None:
+            await self.close()
+            return
+
+        self.group_name = f"study_session_{self.session_id}"
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        state, last_event_id = loaded
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        if "last_event_id" in query:
+            await self.resume(query["last_event_id"][0])
+        else:
+            await self.send_state(state, last_event_id)
+
+    async def disconnect(self, code):
+        # Presence expires through missing heartbeats, so flaky networks do not end sessions
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def send_state(self, state, last_event_id):
+        await self.send_json(
+            {
+                "type": "session.state",
+                "session_id": self.session_id,
+                "last_event_id": last_event_id,
+                "state": StudySessionStateService.public_state(state),
+            }
+        )
+
+    async def resume(self, last_event_id):
+        events = await sync_to_async(StudySessionStateService.replay)(self.session_id, last_event_id)
+        if events is None:
+            loaded = await sync_to_async(StudySessionStateService.load)(self.session_id, self.scope["user"].pk)
+            if loaded is not None:
+                await self.send_state(*loaded)
+            return
+        for event_id, event in events:
+            await self.send_json({"type": "session.event", "id": event_id, **event})
+
+    async def receive_json(self, content, **kwargs):
+        message_type = content.get("type")
+
+        if message_type == "heartbeat":
+            await sync_to_async(StudySessionStateService.heartbeat)(self.session_id)
+            await self.send_json({"type": "heartbeat.ack"})
+        elif message_type == "resume":
+            await self.resume(str(content.get("last_event_id", "")))
+        else:
+            try:
+                event_id, event = await sync_to_async(StudySessionStateService.apply)(
+                    self.session_id, message_type, content.get("data") or {}
+                )
+            except ApplicationError as e:
+                await self.send_json({"type": "error", "message": e.message})
+                return
+            # Every socket of the session, including this one, receives the event with its id
+            await self.channel_layer.group_send(
+                self.group_name, {"type": "session.event", "id": event_id, "event": event}
+            )
+
+    async def session_event(self, event):
+        await self.send_json({"type": "session.event", "id": event["id"], **event["event"]})
@@ -0,0 +1,145 @@
+"""
+Debounced, deduplicated per-user Celery tasks.
+
+Writes for one user often each want the same recompute. At most one execution per
+(task, user_id) is kept pending:
+
+- the first trigger of a key schedules the task `window` seconds later;
+- later triggers only push the run back until the user has been quiet for `window`
+  seconds (and no later than `max_wait` after the first trigger), and merge their
+  items into the pending run; each of them is counted as a dropped duplicate;
+- the run claims the key atomically before doing any work, so a trigger arriving
+  after the claim schedules a new run and the last write is always followed by a
+  recompute that sees it;
+- the key expires 2 * max_wait + window seconds after the first trigger, however many
+  triggers follow, so a lost run (worker killed, message dropped) delays the next
+  recompute by at most that long.
+
+Triggers should be sent after commit (transaction.on_commit) so the run reads the write.
+
+Usage:
+    @debounced_task(window=30)
+    def recompute_user_statistics(user_id, items): ...
+
+    TaskDebouncer.trigger(recompute_user_statistics, user_id, items=["study"])
+"""
+
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from celery import shared_task
+from django.conf import settings
+from django_redis import get_redis_connection
+
+KEY_PREFIX = "intellectual_partner:debounce"
+DROPPED_KEY = f"{KEY_PREFIX}:dropped"
+
+
+class TaskDebouncer:
+    """Pending-run bookkeeping of debounced tasks, in Redis."""
+
+    # task name -> (window, max_wait) given to debounced_task
+    windows: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+
+    @staticmethod
+    def get_client():
+        return get_redis_connection("default")
+
+    @classmethod
+    def get_windows(cls, task_name: str) -> Tuple[float, float]:
+        window, max_wait = cls.windows.get(task_name, (None, None))
+        defaults = settings.INTELLECTUAL_PARTNER_SETTINGS
+        window = window if window is not None else defaults.get("DEBOUNCE_WINDOW", 30)
+        max_wait = max_wait if max_wait is not None else defaults.get("DEBOUNCE_MAX_WAIT", 300)
+        return window, max(max_wait, window)
+
+    @staticmethod
+    def keys(task_name: str, user_id: Any) -> Tuple[str, str]:
+        """Hash of the pending run (first, last, triggers) and set of its merged items."""
+        key = f"{KEY_PREFIX}:{task_name}:{user_id}"
+        return key, f"{key}:items"
+
+    @classmethod
+    def trigger(cls, task: Any, user_id: Any, items: Iterable[str] = ()) -> bool:
+        """Request a run for user_id; returns False if merged into an already pending run."""
+        window, max_wait = cls.get_windows(task.name)
+        key, items_key = cls.keys(task.name, user_id)
+        items = list(items)
+        now = time.time()
+
+        client = cls.get_client()
+        pipe = client.pipeline()
+        pipe.hsetnx(key, "first", now)
+        pipe.hget(key, "first")
+        pipe.hset(key, "last", now)
+        pipe.hincrby(key, "triggers", 1)
+        if items:
+            pipe.sadd(items_key, *items)
+        created, first = pipe.execute()[:2]
+
+        # Expiry is anchored to the first trigger, so later triggers never extend it: the key
+        # outlives the pending run, and a lost run only delays the next one until expiry
+        expires_at = int(float(first) + max_wait * 2 + window)
+        pipe = client.pipeline()
+        pipe.expireat(key, expires_at)
+        pipe.expireat(items_key, expires_at)
+        if not created:
+            pipe.hincrby(DROPPED_KEY, task.name, 1)
+        pipe.execute()
+        if not created:
+            return False
+
+        task.apply_async((str(user_id),), countdown=window)
+        return True
+
+    @classmethod
+    def claim(cls, task: Any, user_id: Any) -> Optional[Set[str]]:
+        """
+        Called by the run: None if triggers are still arriving (the run is rescheduled),
+        otherwise the merged items, with the key released for new triggers.
+        """
+        window, max_wait = cls.get_windows(task.name)
+        key, items_key = cls.keys(task.name, user_id)
+        client = cls.get_client()
+
+        pending = client.hmget(key, "first", "last")
+        if pending[0] is not None:
+            first, last = float(pending[0]), float(pending[1] or pending[0])
+            due = min(last + window, first + max_wait)
+            delay = due - time.time()
+            if delay > 0.5:
+                task.apply_async((str(user_id),), countdown=delay)
+                return None
+
+        pipe = client.pipeline()
+        pipe.smembers(items_key)
+        pipe.delete(key, items_key)
+        items, _ = pipe.execute()
+        return {item.decode() for item in items}
+
+    @classmethod
+    def dropped_counts(cls) -> Dict[str, int]:
+        """Triggers merged into a pending run, per task, since the counters were created."""
+        return {name.decode(): int(count) for name, count in cls.get_client().hgetall(DROPPED_KEY).items()}
+
+
+def debounced_task(window: Optional[float] = None, max_wait: Optional[float] = None, **options) -> Callable:
+    """
+    Register func(user_id, items) as a Celery task triggered through TaskDebouncer.trigger.
+    window / max_wait default to DEBOUNCE_WINDOW / DEBOUNCE_MAX_WAIT seconds.
+    """
+
+    def decorator(func: Callable) -> Any:
+        name = options.pop("name", f"{func.__module__}.{func.__name__}")
+        TaskDebouncer.windows[name] = (window, max_wait)
+
+        def run(self, user_id):
+            items = TaskDebouncer.claim(self, user_id)
+            if items is None:
+                return {"rescheduled": True}
+            return func(user_id, items)
+
+        run.__doc__ = func.__doc__
+        return shared_task(bind=True, name=name, **options)(run)
+
+    return decorator
@@ -0,0 +1,140 @@
+"""
+Sparse fieldsets for Ninja list endpoints.
+
+Clients pass ``?fields=id,title,achieved_at`` to receive only those keys. The
+requested fields are validated against the schema and pushed down into the
+queryset (``values()`` when every field is a column, ``only()`` otherwise), so
+large text columns such as ``description``/``notes`` are never read.
+
+Usage:
+    achievement_fields = SparseFieldset(AchievementSchema)
+
+    @router.get("/achievements", response=List[achievement_fields.schema], exclude_unset=True)
+    @paginate(CursorPagination, ordering="-achieved_at")
+    @achievement_fields.apply
+    def list_achievements(request):
+        return Achievement.objects.filter(user_id=request.auth.id)
+
+Computed schema fields (e.g. ``CategorySchema.full_path``) declare the columns
+they read through ``sources``: ``SparseFieldset(CategorySchema, sources={"full_path": ["name", "parent"]})``.
+Requesting a computed field without ``sources`` loads full rows (no ``only()``)
+rather than deferring columns it may read.
+"""
+
+from functools import wraps
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Type
+
+from django.db.models import QuerySet
+from django.http import HttpRequest
+from ninja import Query, Schema
+from ninja.utils import contribute_operation_args
+from pydantic import ValidationInfo, create_model, model_validator
+
+from .exceptions import handle_http_error
+
+REQUEST_ATTRIBUTE = "_sparse_fieldsets"
+
+
+class FieldsInput(Schema):
+    fields: Optional[str] = None
+
+
+class SparseFieldsetMixin:
+    """Restricts validation to the fields requested for the current request."""
+
+    _sparse_source: Type[Schema]
+
+    @model_validator(mode="wrap")
+    @classmethod
+    def _select_requested_fields(cls, values: Any, handler: Callable, info: ValidationInfo) -> Any:
+        request = (info.context or {}).get("request")
+        fields = getattr(request, REQUEST_ATTRIBUTE, {}).get(cls._sparse_source)
+        if fields is None:
+            return handler(values)
+
+        # Only requested fields are read, so deferred columns never trigger extra queries
+        if isinstance(values, dict):
+            values = {name: values[name] for name in fields if name in values}
+        else:
+            values = {name: getattr(values, name) for name in fields}
+        return handler(values)
+
+
+class SparseFieldset:
+    """Client-selected projection of a schema and its backing queryset."""
+
+    def __init__(self, schema: Type[Schema], sources: Optional[Dict[str, List[str]]] = None):
+        self.source = schema
+        self.sources = sources or {}
+        self.schema = self.build_response_schema(schema)
+
+    @staticmethod
+    def build_response_schema(schema: Type[Schema]) -> Type[Schema]:
+        """
+        Build the response schema: every field optional so that unrequested fields stay unset
+        and are dropped by the route's ``exclude_unset=True``.
+        """
+        fields = {name: (Optional[field.annotation], None) for name, field in schema.model_fields.items()}
+        response_schema = create_model(
+            f"Sparse{schema.__name__}",
+            __base__=(SparseFieldsetMixin, Schema),
+            __doc__=schema.__doc__,
+            **fields,
+        )
+        response_schema._sparse_source = schema
+        return response_schema
+
+    def parse(self, raw_fields: Optional[str]) -> Optional[FrozenSet[str]]:
+        """Parse and validate the ``fields`` query parameter."""
+        if not raw_fields:
+            return None
+
+        fields = frozenset(name.strip() for name in raw_fields.split(",") if name.strip())
+        unknown = fields - set(self.source.model_fields)
+        if unknown:
+            raise handle_http_error(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+        return fields
+
+    def project(self, queryset: QuerySet, fields: Iterable[str]) -> QuerySet:
+        """Push the projection down into the queryset."""
+        columns = {}
+        for field in queryset.model._meta.concrete_fields:
+            columns[field.name] = field.name
+            columns[field.attname] = field.name
+
+        if all(name in columns for name in fields):
+            # Plain columns only: skip model instantiation entirely
+            return queryset.values(*fields)
+
+        if any(name not in columns and name not in self.sources for name in fields):
+            # A computed field with unknown sources would load deferred columns row by row
+            return queryset
+
+        only = {"pk"}
+        for name in fields:
+            if name in columns:
+                only.add(columns[name])
+            else:
+                only.update(self.sources[name])
+        return queryset.only(*only)
+
+    def apply(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """View decorator adding the ``fields`` query parameter to a list endpoint."""
+
+        @wraps(func)
+        def view_with_fieldset(request: HttpRequest, **kwargs: Any) -> Any:
+            fields = self.parse(kwargs.pop("ninja_sparse_fields").fields)
+            result = func(request, **kwargs)
+            if fields is None:
+                return result
+
+            if not hasattr(request, REQUEST_ATTRIBUTE):
+                setattr(request, REQUEST_ATTRIBUTE, {})
+            getattr(request, REQUEST_ATTRIBUTE)[self.source] = fields
+
+            if isinstance(result, QuerySet):
+                result = self.project(result, fields)
+            return result
+
+        contribute_operation_args(view_with_fieldset, "ninja_sparse_fields", FieldsInput, Query(...))
+        return view_with_fieldset
@@ -0,0 +1,142 @@
+"""
+Compact binary WebSocket framing.
+
+High-frequency channels (study sessions, realtime analytics) send small messages
+where repeated JSON keys dominate the frame size. Clients can negotiate the
+MessagePack subprotocol through Sec-WebSocket-Protocol; frames are then MessagePack
+binary messages with short field codes and integer message types:
+
+    {"type": "analytics.delta", "seq": 3, "changed": {"concentration": 7}}
+    -> msgpack({"t": 1, "s": 3, "c": {"cl": 7}})
+
+Keys that are not in FIELD_CODES (student ids, emotion names, user data) are sent
+as is, except those that would decode as something else: keys equal to a code or
+starting with ESCAPE, and a type field whose value is an integer. These are sent
+with ESCAPE prepended, which the decoder strips, so any payload round-trips. New
+fields and types are only ever appended: changing an existing code or index breaks
+deployed clients.
+Clients that offer no subprotocol, or only SUBPROTOCOL_JSON, keep JSON text frames.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import msgpack
+
+SUBPROTOCOL_MSGPACK = "intellectual-partner.msgpack.v1"
+SUBPROTOCOL_JSON = "intellectual-partner.json.v1"
+
+FIELD_CODES = {
+    "type": "t",
+    "seq": "s",
+    "full": "f",
+    "changed": "c",
+    "coalesced": "k",
+    "unacked": "u",
+    "id": "i",
+    "data": "d",
+    "event": "e",
+    "state": "st",
+    "message": "m",
+    "level": "l",
+    "ticket_id": "ti",
+    "last_event_id": "le",
+    "concentration": "cl",
+    "session_id": "si",
+    "recorded_at": "ra",
+    "name": "n",
+    "status": "ss",
+    "started_at": "sa",
+    "ended_at": "ea",
+    "elapsed_seconds": "es",
+    "timer_running": "tr",
+    "current_ticket_id": "ct",
+    "last_concentration": "lc",
+}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+
+# Prefix of keys sent literally (neither coded nor decoded)
+ESCAPE = "~"
+
+MESSAGE_TYPES = (
+    "error",
+    "analytics.delta",
+    "analytics.backpressure",
+    "ack",
+    "resync",
+    "session.state",
+    "session.event",
+    "heartbeat",
+    "heartbeat.ack",
+    "resume",
+    "timer.start",
+    "timer.pause",
+    "ticket.select",
+    "concentration",
+    "session.end",
+)
+TYPE_CODES = {name: index for index, name in enumerate(MESSAGE_TYPES)}
+
+# Message types are carried both in "type" and in the "event" field of session events
+TYPE_FIELDS = ("type", "event")
+
+
+def escape(key: Any) -> Any:
+    """Escape a key that expand() would otherwise decode."""
+    if isinstance(key, str) and (key in FIELD_NAMES or key.startswith(ESCAPE)):
+        return ESCAPE + key
+    return key
+
+
+def compact(value: Any) -> Any:
+    """Replace known field names and message types with their codes."""
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if key in TYPE_FIELDS and item in TYPE_CODES:
+                compacted[FIELD_CODES[key]] = TYPE_CODES[item]
+            elif key in TYPE_FIELDS and isinstance(item, int):
+                # Would decode as a message type
+                compacted[ESCAPE + key] = item
+            else:
+                compacted[FIELD_CODES.get(key) or escape(key)] = compact(item)
+        return compacted
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    return value
+
+
+def expand(value: Any) -> Any:
+    """Inverse of compact()."""
+    if isinstance(value, dict):
+        expanded = {}
+        for code, item in value.items():
+            if isinstance(code, str) and code.startswith(ESCAPE):
+                expanded[code[len(ESCAPE) :]] = expand(item)
+                continue
+            key = FIELD_NAMES.get(code, code)
+            if key in TYPE_FIELDS and isinstance(item, int) and 0 <= item < len(MESSAGE_TYPES):
+                item = MESSAGE_TYPES[item]
+            else:
+                item = expand(item)
+            expanded[key] = item
+        return expanded
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    return value
+
+
+def pack(content: Dict[str, Any]) -> bytes:
+    return msgpack.packb(compact(content), use_bin_type=True)
+
+
+def unpack(data: bytes) -> Dict[str, Any]:
+    return expand(msgpack.unpackb(data, raw=False))
+
+
+def select_subprotocol(offered: List[str], binary: bool) -> Optional[str]:
+    """Subprotocol to accept: MessagePack when offered and supported, JSON otherwise."""
+    if binary and SUBPROTOCOL_MSGPACK in offered:
+        return SUBPROTOCOL_MSGPACK
+    if SUBPROTOCOL_JSON in offered:
+        return SUBPROTOCOL_JSON
+    return None
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark for API response serialization.
+
+Compares the stdlib json + NinjaJSONEncoder path with the orjson renderer
+on typical list payloads.
+
+Usage:
+    python manage.py benchmark_serialization --iterations 200
+"""
+
+import json
+import random
+import timeit
+import uuid
+from datetime import timedelta
+
+import orjson
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from ninja.responses import NinjaJSONEncoder
+
+from core.renderers import dumps as orjson_dumps
+from core.serializers import AchievementSchema, ConcentrationLevelSchema
+
+
+class Command(BaseCommand):
+    help = "Benchmark stdlib json vs orjson serialization on typical API list payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200, help="Number of runs per payload")
+        parser.add_argument("--achievements", type=int, default=100, help="Achievement rows in the payload")
+        parser.add_argument("--concentrations", type=int, default=500, help="Concentration rows in the payload")
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        payloads = {
+            f"{options['achievements']} achievements": self.build_achievements(options["achievements"]),
+            f"{options['concentrations']} concentration rows": self.build_concentrations(
+                options["concentrations"]
+            ),
+        }
+
+        for name, payload in payloads.items():
+            stdlib_body = json.dumps(payload, cls=NinjaJSONEncoder).encode()
+            orjson_body = orjson_dumps(payload)
+
+            results = {
+                "json.dumps": timeit.timeit(lambda: json.dumps(payload, cls=NinjaJSONEncoder), number=iterations),
+                "orjson.dumps": timeit.timeit(lambda: orjson_dumps(payload), number=iterations),
+                "json.loads": timeit.timeit(lambda: json.loads(stdlib_body), number=iterations),
+                "orjson.loads": timeit.timeit(lambda: orjson.loads(orjson_body), number=iterations),
+            }
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({len(orjson_body):,} bytes)"))
+            for label, elapsed in results.items():
+                self.stdout.write(f"  {label:<14} {elapsed / iterations * 1_000_000:>10.1f} µs/op")
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"  encode speedup x{results['json.dumps'] / results['orjson.dumps']:.1f}, "
+                    f"decode speedup x{results['json.loads'] / results['orjson.loads']:.1f}"
+                )
+            )
+
+    @staticmethod
+    def build_achievements(count):
+        """Build an achievement list payload as Ninja hands it to the renderer."""
+        now = timezone.now()
+        user_id = random.randint(1, 10_000)
+        return [
+            AchievementSchema(
+                id=uuid.uuid4(),
+                user_id=user_id,
+                title=f"連続学習達成 {i}",
+                description="連続学習記録を達成しました",
+                type="streak",
+                points=150,
+                badge_icon="fire",
+                badge_color="#FFD700",
+                achieved_at=now - timedelta(hours=i),
+            ).model_dump()
+            for i in range(count)
+        ]
+
+    @staticmethod
+    def build_concentrations(count):
+        """Build a concentration level list payload as Ninja hands it to the renderer."""
+        now = timezone.now()
+        user_id = random.randint(1, 10_000)
+        session_id = uuid.uuid4()
+        return [
+            ConcentrationLevelSchema(
+                id=i,
+                user_id=user_id,
+                level=random.randint(1, 10),
+                timestamp=now - timedelta(minutes=i),
+                session_id=session_id,
+                notes="",
+            ).model_dump()
+            for i in range(count)
+        ]
@@ -0,0 +1,113 @@
+"""
+Benchmark of the interactive / batch task lanes (config.celery WORKER_PROFILES).
+
+Runs in-process Celery workers on the in-memory broker. A backlog of batch tasks is
+queued, then interactive tasks are sent at a steady rate while it drains, and their
+publish-to-start latency is measured in two layouts:
+
+- shared: both kinds on one queue, served by the same workers (the old single-queue setup)
+- lanes: batch tasks on "analytics" and interactive tasks on "interactive", each with
+  its own workers and the prefetch of its profile
+
+With lanes the interactive latency should stay flat regardless of the backlog.
+(Eager mode runs tasks inline and has no queueing to measure, hence the broker.)
+
+Usage:
+    python manage.py benchmark_task_lanes --backlog 200 --batch-seconds 0.05 --interactive 50
+"""
+
+import statistics
+import time
+from contextlib import ExitStack
+
+from celery import Celery
+from celery.contrib.testing.worker import start_worker
+from django.core.management.base import BaseCommand
+
+from config.celery import WORKER_PROFILES
+
+
+def build_app():
+    bench = Celery("task-lanes-benchmark", broker="memory://", backend="cache+memory://", set_as_current=False)
+    bench.conf.update(
+        broker_transport_options={"polling_interval": 0.005},
+        task_default_queue="interactive",
+        worker_hijack_root_logger=False,
+    )
+
+    @bench.task(name="bench.batch")
+    def batch(seconds):
+        time.sleep(seconds)
+
+    @bench.task(name="bench.interactive")
+    def interactive(published_at):
+        return time.time() - published_at
+
+    return bench, batch, interactive
+
+
+class Command(BaseCommand):
+    help = "Measure interactive task latency while a batch backlog drains, with and without separate lanes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backlog", type=int, default=200, help="Batch tasks queued up front")
+        parser.add_argument("--batch-seconds", type=float, default=0.05, help="Duration of a batch task")
+        parser.add_argument("--interactive", type=int, default=50, help="Interactive tasks sent while draining")
+        parser.add_argument("--interval", type=float, default=0.02, help="Seconds between interactive tasks")
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker threads per lane")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'layout':<8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'backlog left':>14}")
+        for layout in ("shared", "lanes"):
+            latencies, left = self.run(layout, options)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            self.stdout.write(
+                f"{layout:<8}{statistics.median(latencies) * 1000:>10.1f}{p95 * 1000:>10.1f}"
+                f"{max(latencies) * 1000:>10.1f}{left:>14}"
+            )
+
+    def run(self, layout, options):
+        bench, batch, interactive = build_app()
+        concurrency = options["concurrency"]
+
+        if layout == "shared":
+            batch_queue = interactive_queue = "shared"
+            workers = [
+                start_worker(
+                    bench,
+                    pool="threads",
+                    concurrency=concurrency * 2,
+                    queues=["shared"],
+                    prefetch_multiplier=4,
+                    perform_ping_check=False,
+                )
+            ]
+        else:
+            batch_queue, interactive_queue = "analytics", "interactive"
+            workers = [
+                start_worker(
+                    bench,
+                    pool="threads",
+                    concurrency=concurrency,
+                    queues=[queue],
+                    prefetch_multiplier=WORKER_PROFILES[queue]["worker_prefetch_multiplier"],
+                    perform_ping_check=False,
+                )
+                for queue in (batch_queue, interactive_queue)
+            ]
+
+        with ExitStack() as stack:
+            for worker in workers:
+                stack.enter_context(worker)
+            backlog = [
+                batch.apply_async((options["batch_seconds"],), queue=batch_queue) for _ in range(options["backlog"])
+            ]
+            results = []
+            for _ in range(options["interactive"]):
+                results.append(interactive.apply_async((time.time(),), queue=interactive_queue))
+                time.sleep(options["interval"])
+            latencies = [result.get(timeout=600) for result in results]
+            left = sum(1 for result in backlog if not result.ready())
+            for result in backlog:
+                result.get(timeout=600)
+        return latencies, left
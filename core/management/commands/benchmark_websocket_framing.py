@@ -0,0 +1,82 @@
+"""
+Benchmark for the WebSocket frame encodings of core.framing.
+
+Compares bytes/message and encode/decode time of the JSON text path (orjson) with
+MessagePack, with and without the short field codes, on typical study-session and
+realtime-analytics frames.
+
+Usage:
+    python manage.py benchmark_websocket_framing --iterations 100000
+"""
+
+import time
+import uuid
+
+import msgpack
+import orjson
+from django.core.management.base import BaseCommand
+
+from core import framing
+
+SESSION_STATE = {
+    "name": "作戦集中の学習",
+    "status": "in_progress",
+    "started_at": "2024-05-01T09:00:00+09:00",
+    "ended_at": None,
+    "elapsed_seconds": 1520,
+    "timer_running": True,
+    "current_ticket_id": str(uuid.uuid4()),
+    "last_concentration": 7,
+}
+
+FRAMES = {
+    "analytics.delta": {
+        "type": "analytics.delta",
+        "seq": 1842,
+        "full": False,
+        "changed": {"concentration": 7, "recorded_at": "2024-05-01T09:25:20.123456+09:00"},
+        "coalesced": 3,
+    },
+    "session.event": {"type": "session.event", "id": "1714523120123-0", "event": "concentration", "state": SESSION_STATE},
+    "concentration (client)": {"type": "concentration", "data": {"level": 7}},
+    "heartbeat (client)": {"type": "heartbeat"},
+}
+
+
+class Command(BaseCommand):
+    help = "Compare JSON and MessagePack WebSocket framing: bytes/message and encode/decode time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=100000, help="Encode/decode iterations per frame")
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        codecs = {
+            "json": (lambda content: orjson.dumps(content), orjson.loads),
+            "msgpack": (
+                lambda content: msgpack.packb(content, use_bin_type=True),
+                lambda data: msgpack.unpackb(data, raw=False),
+            ),
+            "msgpack+codes": (framing.pack, framing.unpack),
+        }
+
+        self.stdout.write(f"{'frame':<24}{'codec':<15}{'bytes':>7}{'encode µs':>12}{'decode µs':>12}")
+        for name, frame in FRAMES.items():
+            baseline = None
+            for codec, (encode, decode) in codecs.items():
+                data = encode(frame)
+                assert decode(data) == frame
+
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    encode(frame)
+                encode_us = (time.perf_counter() - started) / iterations * 1e6
+
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    decode(data)
+                decode_us = (time.perf_counter() - started) / iterations * 1e6
+
+                baseline = baseline or len(data)
+                ratio = f"  ({len(data) / baseline:.0%})" if codec != "json" else ""
+                self.stdout.write(f"{name:<24}{codec:<15}{len(data):>7}{encode_us:>12.2f}{decode_us:>12.2f}{ratio}")
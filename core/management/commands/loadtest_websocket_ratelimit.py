@@ -0,0 +1,104 @@
+"""
+Load test for the WebSocket rate limiters in config.middleware.
+
+Simulates a buggy client that reconnects in a loop and floods messages, with and
+without the middleware, and reports how many connections and channel-layer sends
+reach the application. Runs entirely in-process on the in-memory channel layer.
+
+Usage:
+    python manage.py loadtest_websocket_ratelimit --connections 200 --messages 1000
+"""
+
+import asyncio
+import math
+import time
+
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+
+from config.middleware import ConnectionTracker, WebSocketMessageRateLimitMiddleware, WebSocketRateLimitMiddleware
+
+
+class LayerPublishingApp:
+    """Minimal consumer: accepts and publishes every received frame to a group."""
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+        self.group_sends = 0
+        self.accepted = 0
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.connect":
+                self.accepted += 1
+                await send({"type": "websocket.accept"})
+            elif message["type"] == "websocket.receive":
+                self.group_sends += 1
+                await self.channel_layer.group_send("loadtest", {"type": "loadtest.message"})
+            elif message["type"] == "websocket.disconnect":
+                return
+
+
+class Command(BaseCommand):
+    help = "Show how the WebSocket rate limiter protects the channel layer from a reconnecting/flooding client"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=200, help="Connections opened by the reconnect loop")
+        parser.add_argument("--messages", type=int, default=1000, help="Messages sent by the flooding client")
+
+    def handle(self, *args, **options):
+        for protected in (False, True):
+            label = "with rate limiter" if protected else "without rate limiter"
+            result = asyncio.run(self.run_scenario(protected, options["connections"], options["messages"]))
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(
+                f"  connections accepted  {result['accepted']:>6} / {options['connections']}"
+                f"  ({result['connect_seconds'] * 1000:.1f} ms)"
+            )
+            self.stdout.write(
+                f"  layer group_send      {result['group_sends']:>6} / {options['messages']}"
+                f"  ({result['flood_seconds'] * 1000:.1f} ms)"
+            )
+
+    async def run_scenario(self, protected, connections, messages):
+        channel_layer = InMemoryChannelLayer(capacity=100)
+        inner = LayerPublishingApp(channel_layer)
+        # Local counters only: the load test must not depend on a running Redis
+        app = inner
+        if protected:
+            tracker = ConnectionTracker(sync_interval=math.inf)
+            app = WebSocketRateLimitMiddleware(WebSocketMessageRateLimitMiddleware(inner), tracker=tracker)
+        headers = [(b"cookie", b"sessionid=loadtest-session")]
+
+        # Reconnect loop: the client never closes its previous sockets
+        started = time.perf_counter()
+        communicators = []
+        for _ in range(connections):
+            communicator = WebsocketCommunicator(app, "/ws/notifications/loadtest/", headers=headers)
+            communicator.scope["client"] = ["203.0.113.7", 0]
+            connected, _ = await communicator.connect()
+            if connected:
+                communicators.append(communicator)
+            else:
+                await communicator.wait()
+        connect_seconds = time.perf_counter() - started
+        accepted = inner.accepted
+
+        # Message flood on one of the open sockets
+        started = time.perf_counter()
+        flooder = communicators[0]
+        for _ in range(messages):
+            await flooder.send_to(text_data="{}")
+        await asyncio.sleep(0)
+        for communicator in communicators:
+            await communicator.disconnect()
+        flood_seconds = time.perf_counter() - started
+
+        return {
+            "accepted": accepted,
+            "connect_seconds": connect_seconds,
+            "group_sends": inner.group_sends,
+            "flood_seconds": flood_seconds,
+        }
@@ -0,0 +1,330 @@
+"""
+In-process load test of the WebSocket stack.
+
+Opens N simulated clients spread over the five routes of config.routing, behind the
+same rate limiters + URLRouter stack as config.asgi, and drives traffic:
+
+- notifications / analytics / teacher dashboard: server-side fan-out through the layer
+- realtime-analytics: concentration samples (throttled and coalesced by the consumer)
+- study-session: client events, fanned out to every socket of the session (2 per session)
+
+Reports connect time, p50/p95/p99 end-to-end fan-out latency, dropped messages and
+messages coalesced by design. Runs on InMemoryChannelLayer (default) or channels_redis.
+
+Session authentication needs logged-in users in the database, so instead of
+AuthMiddlewareStack each client gets an accounts.authentication.AuthPrincipal in its scope.
+Consumers keeping state in Redis use the configured connection, or fakeredis with --fake-redis.
+
+Usage:
+    python manage.py loadtest_websockets --clients 500 --rounds 20 --fake-redis
+    python manage.py loadtest_websockets --layer redis --redis-url redis://localhost:6379/3
+"""
+
+import asyncio
+import math
+import statistics
+import time
+import uuid
+from collections import defaultdict
+
+import orjson
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.authentication import AuthPrincipal
+from analytics.consumers import AnalyticsConsumer
+from analytics.services import RealTimeAnalyticsService
+from config.middleware import ConnectionTracker, WebSocketMessageRateLimitMiddleware, WebSocketRateLimitMiddleware
+from config.routing import websocket_urlpatterns
+from core.services import StudySessionKeys, StudySessionStateService
+from notifications.services import NotificationFanoutService
+from teacher_support.services import DashboardKeys, TeacherDashboardService
+
+ROUTES = ("notifications", "analytics", "realtime-analytics", "teacher-dashboard", "study-session")
+# Realtime analytics frames are acknowledged cumulatively, like a well-behaved client
+ACK_EVERY = 5
+
+
+def percentiles(values):
+    """(p50, p95, p99) in milliseconds."""
+    if len(values) < 2:
+        value = values[0] * 1000 if values else math.nan
+        return value, value, value
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+class SimulatedClient:
+    """One socket: records receive latencies from the sent_at stamps in the frames."""
+
+    def __init__(self, route, key, principal, index):
+        self.route = route
+        self.key = key
+        self.principal = principal
+        self.index = index
+        self.communicator = None
+        self.received = 0
+        self.coalesced = 0
+        self.latencies = []
+        self.session_events = 0
+        self.receiver = None
+
+    def path(self):
+        return {
+            "notifications": f"/ws/notifications/{self.principal.id.hex}/",
+            "analytics": f"/ws/analytics/{self.principal.id.hex}/",
+            "realtime-analytics": f"/ws/realtime-analytics/{self.principal.id.hex}/",
+            "teacher-dashboard": f"/ws/teacher/dashboard/{self.principal.id.hex}/",
+            "study-session": f"/ws/study-session/{self.key}/",
+        }[self.route]
+
+    async def connect(self, app):
+        headers = [(b"cookie", f"sessionid=loadtest-{self.principal.id.hex}".encode())]
+        self.communicator = WebsocketCommunicator(app, self.path(), headers=headers)
+        self.communicator.scope["user"] = self.principal
+        # Spread clients over addresses so the per-IP cap does not mask the layer
+        self.communicator.scope["client"] = [
+            f"10.{self.index // 65536 % 256}.{self.index // 256 % 256}.{self.index % 256}",
+            0,
+        ]
+        connected, _ = await self.communicator.connect(timeout=10)
+        return connected
+
+    async def receive_forever(self, session_sent_at):
+        while True:
+            output = await self.communicator.receive_output(timeout=3600)
+            if output["type"] != "websocket.send" or not output.get("text"):
+                continue
+            frame = orjson.loads(output["text"])
+            now = time.perf_counter()
+
+            sent_at = None
+            if frame.get("type") == "notifications":
+                for notification in frame["notifications"]:
+                    self.received += 1
+                    self.latencies.append(now - notification["data"]["sent_at"])
+                continue
+            elif frame.get("type") == "analytics":
+                sent_at = frame["data"]["sent_at"]
+            elif frame.get("type") == "analytics.delta":
+                sent_at = frame["changed"].get("sent_at")
+                self.coalesced += max(frame.get("coalesced", 1) - 1, 0)
+                if frame["seq"] % ACK_EVERY == 0:
+                    await self.communicator.send_json_to({"type": "ack", "seq": frame["seq"]})
+            elif frame.get("type") == "analytics.backpressure":
+                await self.communicator.send_json_to({"type": "ack", "seq": frame["seq"]})
+            elif frame.get("type") == "dashboard.delta":
+                sent_at = frame["changed"].get("sent_at")
+            elif frame.get("type") == "session.event":
+                sent_at = session_sent_at[self.key][self.session_events]
+                self.session_events += 1
+
+            if sent_at is not None:
+                self.received += 1
+                self.latencies.append(now - sent_at)
+
+
+class Command(BaseCommand):
+    help = "Load test the WebSocket routes in-process and report connect time, fan-out latency and drops"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=200, help="Simulated sockets, spread over the five routes")
+        parser.add_argument("--rounds", type=int, default=20, help="Traffic rounds")
+        parser.add_argument("--interval", type=float, default=0.05, help="Seconds between rounds")
+        parser.add_argument("--layer", choices=("memory", "redis"), default="memory", help="Channel layer backend")
+        parser.add_argument("--redis-url", default="redis://localhost:6379/3", help="channels_redis host for --layer redis")
+        parser.add_argument("--capacity", type=int, default=100, help="Layer channel capacity (as in settings)")
+        parser.add_argument("--fake-redis", action="store_true", help="Use fakeredis for consumer state instead of Redis")
+
+    def handle(self, *args, **options):
+        if options["layer"] == "redis":
+            from channels_redis.core import RedisChannelLayer
+
+            layer = RedisChannelLayer(hosts=[options["redis_url"]], capacity=options["capacity"])
+        else:
+            layer = InMemoryChannelLayer(capacity=options["capacity"])
+        channel_layers.backends["default"] = layer
+
+        if options["fake_redis"]:
+            try:
+                import fakeredis
+            except ImportError:
+                raise CommandError("--fake-redis requires the fakeredis package")
+            client = fakeredis.FakeRedis()
+            TeacherDashboardService.get_client = staticmethod(lambda: client)
+            StudySessionStateService.get_client = staticmethod(lambda: client)
+
+        result = asyncio.run(self.run(layer, options))
+        self.report(result, options)
+
+    def build_clients(self, count):
+        clients = []
+        unpaired_session = None
+        for index in range(count):
+            route = ROUTES[index % len(ROUTES)]
+            if route == "study-session" and unpaired_session is not None:
+                # Second device of the session, so events fan out to two sockets
+                clients.append(SimulatedClient(route, unpaired_session.key, unpaired_session.principal, index))
+                unpaired_session = None
+                continue
+
+            principal = AuthPrincipal(
+                uuid.uuid4(), is_teacher=route == "teacher-dashboard", is_student=True, is_active=True
+            )
+            client = SimulatedClient(route, uuid.uuid4().hex, principal, index)
+            if route == "study-session":
+                unpaired_session = client
+            clients.append(client)
+        return clients
+
+    def seed_state(self, clients):
+        """Pre-create Redis state so connects do not fall back to the database."""
+        for client in clients:
+            if client.route == "teacher-dashboard":
+                redis = TeacherDashboardService.get_client()
+                redis.sadd(DashboardKeys.classes(client.principal.id), "loadtest")
+            elif client.route == "study-session":
+                state = {
+                    "user_id": str(client.principal.id),
+                    "name": "loadtest",
+                    "status": "in_progress",
+                    "started_at": "2024-01-01T00:00:00+00:00",
+                    "ended_at": None,
+                    "elapsed_seconds": 0,
+                    "timer_started_at": None,
+                    "current_ticket_id": None,
+                    "last_concentration": None,
+                    "event_count": 0,
+                }
+                StudySessionStateService.get_client().hset(
+                    StudySessionKeys.state(client.key), mapping=StudySessionStateService.encode(state)
+                )
+
+    async def run(self, layer, options):
+        tracker = ConnectionTracker(sync_interval=math.inf)
+        app = WebSocketRateLimitMiddleware(
+            WebSocketMessageRateLimitMiddleware(URLRouter(websocket_urlpatterns)), tracker=tracker
+        )
+        clients = self.build_clients(options["clients"])
+        self.seed_state(clients)
+
+        # Connect everything concurrently
+        connect_times = []
+
+        async def connect(client):
+            started = time.perf_counter()
+            connected = await client.connect(app)
+            connect_times.append(time.perf_counter() - started)
+            return connected
+
+        started = time.perf_counter()
+        connected = await asyncio.gather(*(connect(client) for client in clients))
+        connect_total = time.perf_counter() - started
+        clients = [client for client, ok in zip(clients, connected) if ok]
+
+        # Discard initial snapshots, then start the receivers
+        for client in clients:
+            while not await client.communicator.receive_nothing(timeout=0.01):
+                await client.communicator.receive_output()
+        session_sent_at = defaultdict(list)
+        for client in clients:
+            client.receiver = asyncio.ensure_future(client.receive_forever(session_sent_at))
+
+        by_route = defaultdict(list)
+        for client in clients:
+            by_route[client.route].append(client)
+        sessions = {}
+        session_sockets = defaultdict(int)
+        for client in by_route["study-session"]:
+            sessions.setdefault(client.key, client)
+            session_sockets[client.key] += 1
+
+        expected = defaultdict(int)
+        traffic_started = time.perf_counter()
+        for round_number in range(options["rounds"]):
+            sends = []
+            for client in by_route["notifications"]:
+                frame = {
+                    "type": "notification.batch",
+                    "notifications": [
+                        {"id": str(uuid.uuid4()), "title": "loadtest", "data": {"sent_at": time.perf_counter()}}
+                    ],
+                }
+                sends.append(layer.group_send(NotificationFanoutService.group_name(client.principal.id), frame))
+                expected["notifications"] += 1
+            for client in by_route["analytics"]:
+                sends.append(
+                    layer.group_send(
+                        AnalyticsConsumer.group_name(client.principal.id),
+                        {"type": "analytics.update", "data": {"sent_at": time.perf_counter()}},
+                    )
+                )
+                expected["analytics"] += 1
+            for client in by_route["realtime-analytics"]:
+                state = {"concentration": round_number % 10 + 1, "sent_at": time.perf_counter()}
+                sends.append(RealTimeAnalyticsService.apublish(client.principal.id, state, channel_layer=layer))
+                expected["realtime-analytics"] += 1
+            for client in by_route["teacher-dashboard"]:
+                delta = {
+                    "type": "dashboard.delta",
+                    "class_name": "loadtest",
+                    "changed": {"active_sessions": round_number, "sent_at": time.perf_counter()},
+                    "student_status": {},
+                }
+                sends.append(layer.group_send(TeacherDashboardService.group_name(client.principal.id), delta))
+                expected["teacher-dashboard"] += 1
+            for key, client in sessions.items():
+                session_sent_at[key].append(time.perf_counter())
+                sends.append(
+                    client.communicator.send_json_to({"type": "concentration", "data": {"level": round_number % 10 + 1}})
+                )
+                expected["study-session"] += session_sockets[key]
+            await asyncio.gather(*sends)
+            await asyncio.sleep(options["interval"])
+
+        # Let in-flight messages (and throttled realtime pushes) drain
+        await asyncio.sleep(1.0)
+        traffic_seconds = time.perf_counter() - traffic_started
+
+        for client in clients:
+            client.receiver.cancel()
+        await asyncio.gather(*(client.receiver for client in clients), return_exceptions=True)
+        await asyncio.gather(*(client.communicator.disconnect() for client in clients), return_exceptions=True)
+
+        return {
+            "requested": options["clients"],
+            "connected": len(clients),
+            "connect_total": connect_total,
+            "connect_times": connect_times,
+            "traffic_seconds": traffic_seconds,
+            "by_route": by_route,
+            "expected": expected,
+        }
+
+    def report(self, result, options):
+        p50, p95, p99 = percentiles(result["connect_times"])
+        self.stdout.write(self.style.MIGRATE_HEADING(f"layer={options['layer']} capacity={options['capacity']}"))
+        self.stdout.write(
+            f"connected {result['connected']}/{result['requested']} in {result['connect_total'] * 1000:.0f} ms"
+            f"  (per socket p50 {p50:.1f} / p95 {p95:.1f} / p99 {p99:.1f} ms)"
+        )
+        self.stdout.write(
+            f"{'route':<20}{'sockets':>8}{'expected':>10}{'received':>10}{'dropped':>9}{'coalesced':>11}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        )
+        for route in ROUTES:
+            clients = result["by_route"][route]
+            received = sum(client.received for client in clients)
+            coalesced = sum(client.coalesced for client in clients)
+            latencies = [latency for client in clients for latency in client.latencies]
+            expected = result["expected"][route]
+            # Realtime analytics coalesces samples by design; only unexplained losses are drops
+            dropped = max(expected - received - coalesced, 0)
+            p50, p95, p99 = percentiles(latencies)
+            self.stdout.write(
+                f"{route:<20}{len(clients):>8}{expected:>10}{received:>10}{dropped:>9}{coalesced:>11}"
+                f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}"
+            )
+        self.stdout.write(f"traffic phase {result['traffic_seconds']:.2f} s")
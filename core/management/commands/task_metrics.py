@@ -0,0 +1,102 @@
+"""
+Celery task metrics recorded by core.task_metrics.InstrumentedTask.
+
+Per queue and task over the last --minutes: runs, failures, retries, wait (mean, p95
+from the histogram, max), runtime, result size and load, the busy worker-seconds
+per second. A queue's load is the number of worker processes it keeps busy; size
+its workers above it, and treat growing wait percentiles as saturation.
+
+Usage:
+    python manage.py task_metrics --minutes 15
+    python manage.py task_metrics --queue analytics
+"""
+
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from core.debounce import TaskDebouncer
+from core.task_metrics import KEY_PREFIX, WAIT_BUCKETS
+
+
+def wait_percentile(counters, fraction):
+    """Upper bound of the histogram bucket holding the given fraction of waits."""
+    total = counters.get("waited", 0)
+    if not total:
+        return None
+    seen = 0
+    for bound in (*WAIT_BUCKETS, "inf"):
+        seen += counters.get(f"wait_le_{bound}", 0)
+        if seen >= total * fraction:
+            return float(bound)
+    return float("inf")
+
+
+class Command(BaseCommand):
+    help = "Show Celery wait time, runtime, retries, result size and load per queue and task"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--minutes", type=int, default=15, help="Window to aggregate")
+        parser.add_argument("--queue", help="Only this queue")
+
+    def handle(self, *args, **options):
+        minutes = options["minutes"]
+        client = get_redis_connection("default")
+        current = int(time.time() // 60)
+
+        counters = defaultdict(lambda: defaultdict(float))
+        for minute in range(current - minutes + 1, current + 1):
+            key = f"{KEY_PREFIX}:{minute}"
+            for field, value in client.hgetall(key).items():
+                queue, task_name, metric = field.decode().rsplit("|", 2)
+                counters[(queue, task_name)][metric] += float(value)
+            for field, value in client.zrange(f"{key}:max", 0, -1, withscores=True):
+                queue, task_name, metric = field.decode().rsplit("|", 2)
+                counters[(queue, task_name)][metric] = max(counters[(queue, task_name)][metric], value)
+
+        if options["queue"]:
+            counters = {key: value for key, value in counters.items() if key[0] == options["queue"]}
+        if not counters:
+            self.stdout.write("No task metrics recorded in this window")
+            return
+
+        window = minutes * 60
+        header = (
+            f"{'queue':<16}{'task':<52}{'runs':>7}{'fail':>6}{'retry':>6}"
+            f"{'wait avg':>10}{'p95':>8}{'max':>8}{'run avg':>9}{'result':>9}{'load':>7}"
+        )
+        self.stdout.write(header)
+        queues = defaultdict(lambda: defaultdict(float))
+        for (queue, task_name), values in sorted(counters.items()):
+            self.write_row(queue, task_name, values, window)
+            for metric, value in values.items():
+                if metric.endswith("_max"):
+                    queues[queue][metric] = max(queues[queue][metric], value)
+                else:
+                    queues[queue][metric] += value
+
+        self.stdout.write("")
+        for queue, values in sorted(queues.items()):
+            self.write_row(queue, "(all tasks)", values, window)
+
+        dropped = TaskDebouncer.dropped_counts()
+        if dropped:
+            self.stdout.write("\nDuplicate triggers merged into pending debounced runs (since start):")
+            for task_name, count in sorted(dropped.items()):
+                self.stdout.write(f"  {task_name:<66}{count:>9}")
+
+    def write_row(self, queue, task_name, values, window):
+        runs = values["succeeded"] + values["failed"] + values["retries"]
+        waited = values["waited"]
+        p95 = wait_percentile(values, 0.95)
+        self.stdout.write(
+            f"{queue:<16}{task_name[-51:]:<52}{int(runs):>7}{int(values['failed']):>6}{int(values['retries']):>6}"
+            f"{(values['wait_sum'] / waited if waited else 0):>9.2f}s"
+            f"{'' if p95 is None else f'<{p95:g}s':>8}"
+            f"{values['wait_max']:>7.1f}s"
+            f"{(values['runtime_sum'] / runs if runs else 0):>8.2f}s"
+            f"{(values['result_bytes'] / runs / 1024 if runs else 0):>7.1f}KB"
+            f"{values['runtime_sum'] / window:>7.2f}"
+        )
@@ -0,0 +1,91 @@
+"""
+Validate core.sketches.KLLSketch against exact quantiles.
+
+For several distributions (continuous, heavy-tailed, discrete levels, sorted input),
+compares a sketch built from the whole stream and one merged from --parts serialized
+partial sketches (like class sketches merged into a school) with the exact ranks
+computed by NumPy. Fails when the worst normalized rank error exceeds the documented
+bound (core.sketches.rank_error_bound).
+
+Usage:
+    python manage.py validate_quantile_sketches --items 200000 --parts 300
+"""
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sketches import DEFAULT_K, KLLSketch, rank_error_bound
+
+FRACTIONS = np.linspace(0.01, 0.99, 99)
+
+
+def max_rank_error(sketch: KLLSketch, exact: np.ndarray) -> float:
+    """Worst |estimated rank - exact rank| over rank() probes and quantile() answers."""
+    worst = 0.0
+    for value in np.quantile(exact, FRACTIONS):
+        true_rank = np.searchsorted(exact, value, side="right") / len(exact)
+        worst = max(worst, abs(sketch.rank(value) - true_rank))
+    for fraction in FRACTIONS:
+        value = sketch.quantile(fraction)
+        low = np.searchsorted(exact, value, side="left") / len(exact)
+        high = np.searchsorted(exact, value, side="right") / len(exact)
+        # With ties, any fraction within [low, high] is answered exactly by value
+        worst = max(worst, low - fraction, fraction - high, 0.0)
+    return worst
+
+
+class Command(BaseCommand):
+    help = "Check KLL quantile sketch accuracy, single-stream and merged, against exact computation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=200000, help="Items per distribution")
+        parser.add_argument("--parts", type=int, default=300, help="Partial sketches merged per distribution")
+        parser.add_argument("--k", type=int, default=DEFAULT_K)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        items, parts, k = options["items"], options["parts"], options["k"]
+        rng = np.random.default_rng(options["seed"])
+        bound = rank_error_bound(k)
+        distributions = {
+            # Minutes per student-day: many zeros and a long tail
+            "study_minutes": np.where(rng.random(items) < 0.3, 0, np.round(rng.gamma(2.0, 30.0, items))),
+            "concentration": rng.integers(1, 11, items).astype(np.float64),
+            "completion_rate": rng.beta(2.0, 1.5, items),
+            "lognormal": rng.lognormal(0.0, 1.5, items),
+            "sorted": np.arange(items, dtype=np.float64),
+        }
+
+        self.stdout.write(f"k={k}, bound {bound:.2%} (99% confidence)")
+        self.stdout.write(f"{'distribution':<18}{'single':>9}{'merged':>9}{'items kept':>12}{'bytes':>8}{'build s':>9}")
+        failures = []
+        for name, values in distributions.items():
+            # Sketches store float32
+            values = values.astype(np.float32).astype(np.float64)
+            exact = np.sort(values)
+
+            started = time.perf_counter()
+            single = KLLSketch(k)
+            single.extend(values.tolist())
+            elapsed = time.perf_counter() - started
+
+            partials = []
+            for part in np.array_split(values, parts):
+                sketch = KLLSketch(k)
+                sketch.extend(part.tolist())
+                partials.append(KLLSketch.from_bytes(sketch.to_bytes()))
+            merged = KLLSketch.merged(partials, k)
+
+            errors = (max_rank_error(single, exact), max_rank_error(merged, exact))
+            size = len(single.to_bytes())
+            self.stdout.write(
+                f"{name:<18}{errors[0]:>9.3%}{errors[1]:>9.3%}{single.size():>12}{size:>8}{elapsed:>9.2f}"
+            )
+            if merged.count != len(values) or max(errors) > bound:
+                failures.append(name)
+
+        if failures:
+            raise CommandError(f"Rank error above {bound:.2%} for: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All sketches within the documented rank error bound"))
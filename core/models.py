@@ -128,11 +128,47 @@ class ConcentrationLevel(models.Model):
         verbose_name = "集中度記録"
         verbose_name_plural = "集中度記録"
         ordering = ["-timestamp"]
+        indexes = [
+            # Keyset pagination seek (core.pagination.CursorPagination)
+            models.Index(fields=["user", "-timestamp", "-id"], name="concentration_user_feed_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - Level {self.level} at {self.timestamp}"
 
 
+class StudySession(UserRelatedModel):
+    """
+    Study session.
+    Live state is kept in Redis while the session runs and flushed here in batches
+    (core.services.StudySessionStateService) when it ends or goes idle.
+    """
+
+    name = models.CharField(max_length=200, blank=True, verbose_name="セッション名")
+    status = models.CharField(
+        max_length=20, choices=StatusChoices.choices, default=StatusChoices.IN_PROGRESS, verbose_name="ステータス"
+    )
+    started_at = models.DateTimeField(verbose_name="開始日時")
+    ended_at = models.DateTimeField(null=True, blank=True, verbose_name="終了日時")
+    elapsed_seconds = models.PositiveIntegerField(default=0, verbose_name="経過時間(秒)")
+    current_ticket_id = models.UUIDField(null=True, blank=True, verbose_name="現在のチケット")
+    last_concentration = models.IntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(10)], verbose_name="最終集中度"
+    )
+    event_count = models.PositiveIntegerField(default=0, verbose_name="イベント数")
+
+    class Meta:
+        verbose_name = "学習セッション"
+        verbose_name_plural = "学習セッション"
+        ordering = ["-started_at"]
+        indexes = [
+            models.Index(fields=["user", "-started_at"], name="study_session_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.name or self.id} ({self.status})"
+
+
 class StudyEnvironment(models.Model):
     """
     Model to track study environment preferences and conditions.
@@ -189,7 +225,7 @@ class StudyEnvironment(models.Model):
         ordering = ["-timestamp"]
 
     def __str__(self):
-        return f"{self.user.username} - {self.location} ({self.effectiveness_rating}/5)"
+        return f"{self.user.username} - {self.location} ({self.effective_rating}/5)"
 
 
 class Tag(BaseModel):
@@ -282,7 +318,7 @@ class Achievement(BaseModel):
         ],
         verbose_name="達成タイプ",
     )
-    points = models.ImageField(default=0, verbose_name="獲得ポイント")
+    points = models.IntegerField(default=0, verbose_name="獲得ポイント")
     badge_icon = models.CharField(max_length=50, blank=True, verbose_name="バッジアイコン")
     badge_color = models.CharField(max_length=7, default="#FFD700", verbose_name="バッジカラー")
     achieved_at = models.DateTimeField(auto_now_add=True, verbose_name="達成日時")
@@ -291,6 +327,27 @@ class Achievement(BaseModel):
         verbose_name = "達成記録"
         verbose_name_plural = "達成記録"
         ordering = ["-achieved_at"]
+        indexes = [
+            # Keyset pagination seek (core.pagination.CursorPagination)
+            models.Index(fields=["user", "-achieved_at", "-id"], name="achievement_user_feed_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.title}"
+
+
+class AggregationWatermark(TimeStampedModel):
+    """
+    High-water mark (created_at, id) of an incremental aggregation job.
+    """
+
+    name = models.CharField(max_length=100, unique=True, verbose_name="集計名")
+    position_at = models.DateTimeField(null=True, blank=True, verbose_name="処理済み作成日時")
+    position_id = models.UUIDField(null=True, blank=True, verbose_name="処理済みID")
+
+    class Meta:
+        verbose_name = "集計ウォーターマーク"
+        verbose_name_plural = "集計ウォーターマーク"
+
+    def __str__(self):
+        return f"{self.name} @ {self.position_at}"
@@ -0,0 +1,107 @@
+"""
+Keyset (cursor) pagination for time-ordered feeds.
+
+LimitOffsetPagination runs a COUNT(*) per page and OFFSET scans grow with the page
+number. CursorPagination seeks from the last seen (ordering value, pk) pair instead,
+so every page costs the same index range scan. The total count is opt-in.
+
+Usage:
+    from ninja.pagination import paginate
+    from core.pagination import CursorPagination
+
+    @router.get("/concentrations", response=List[ConcentrationLevelSchema])
+    @paginate(CursorPagination, ordering="-timestamp")
+    def list_concentrations(request):
+        return ConcentrationLevel.objects.filter(user_id=request.auth.id)
+"""
+
+import base64
+import binascii
+from typing import Any, List, Optional, Tuple
+
+import orjson
+from django.db.models import Q, QuerySet
+from ninja import Field, Schema
+from ninja.conf import settings
+from ninja.pagination import AsyncPaginationBase
+
+from .exceptions import handle_http_error
+from .renderers import dumps
+
+
+class CursorPagination(AsyncPaginationBase):
+    """Keyset pagination over (ordering field, pk) with opaque cursors."""
+
+    class Input(Schema):
+        cursor: Optional[str] = Field(None, description="Cursor returned as next_cursor by the previous page")
+        limit: int = Field(settings.PAGINATION_PER_PAGE, ge=1, le=settings.PAGINATION_MAX_PER_PAGE_SIZE)
+        with_count: bool = Field(False, description="Also return the total count (runs COUNT(*))")
+
+    class Output(Schema):
+        items: List[Any]
+        next_cursor: Optional[str] = None
+        count: Optional[int] = None
+
+    def __init__(self, ordering: str = "-timestamp", **kwargs: Any) -> None:
+        self.descending = ordering.startswith("-")
+        self.field = ordering.lstrip("-")
+        super().__init__(**kwargs)
+
+    def encode_cursor(self, item: Any) -> str:
+        """Encode the (ordering value, pk) of an item into an opaque cursor."""
+        if isinstance(item, dict):
+            position = [item[self.field], item.get("pk", item.get("id"))]
+        else:
+            position = [getattr(item, self.field), item.pk]
+        return base64.urlsafe_b64encode(dumps(position)).rstrip(b"=").decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+        """Decode a cursor into its (ordering value, pk) pair."""
+        try:
+            value, pk = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+            raise handle_http_error(400, "Invalid cursor")
+        return value, pk
+
+    def get_ordering(self) -> List[str]:
+        prefix = "-" if self.descending else ""
+        return [f"{prefix}{self.field}", f"{prefix}pk"]
+
+    def seek(self, queryset: QuerySet, cursor: Optional[str]) -> QuerySet:
+        """Order the queryset and skip everything up to and including the cursor."""
+        queryset = queryset.order_by(*self.get_ordering())
+        # Projections (core.fieldsets) still need the cursor columns
+        if getattr(queryset, "_fields", None):
+            queryset = queryset.values(*dict.fromkeys([*queryset._fields, self.field, "pk"]))
+        else:
+            loaded, deferred = queryset.query.deferred_loading
+            if loaded and not deferred:
+                queryset = queryset.only(*loaded, self.field)
+        if not cursor:
+            return queryset
+
+        value, pk = self.decode_cursor(cursor)
+        op = "lt" if self.descending else "gt"
+        return queryset.filter(Q(**{f"{self.field}__{op}": value}) | Q(**{self.field: value, f"pk__{op}": pk}))
+
+    def build_page(self, items: List[Any], limit: int) -> dict:
+        has_next = len(items) > limit
+        items = items[:limit]
+        return {
+            "items": items,
+            "next_cursor": self.encode_cursor(items[-1]) if has_next else None,
+        }
+
+    def paginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        # Fetch one extra row to know whether a next page exists without counting
+        items = list(self.seek(queryset, pagination.cursor)[: pagination.limit + 1])
+        page = self.build_page(items, pagination.limit)
+        page["count"] = self._items_count(queryset) if pagination.with_count else None
+        return page
+
+    async def apaginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        items = [obj async for obj in self.seek(queryset, pagination.cursor)[: pagination.limit + 1]]
+        page = self.build_page(items, pagination.limit)
+        page["count"] = await self._aitems_count(queryset) if pagination.with_count else None
+        return page
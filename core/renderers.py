@@ -0,0 +1,65 @@
+"""
+orjson based renderer and parser for the Ninja API.
+
+orjson serializes UUID, datetime, date, time, Enum and dataclass values natively,
+so the common payloads of this API (UUID primary keys and aware timestamps) never
+reach the Python-level ``default`` hook.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
+from typing import Any
+
+import orjson
+from django.http import HttpRequest
+from django.utils.duration import duration_iso_string
+from django.utils.functional import Promise
+from ninja.parser import Parser
+from ninja.renderers import BaseRenderer
+from ninja.types import DictStrAny
+from pydantic import BaseModel
+from pydantic_core import Url
+
+# UTC datetimes are rendered with a trailing "Z" like DjangoJSONEncoder does,
+# dict keys such as UUIDs/ints are allowed and NumPy arrays from analytics pass through.
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def orjson_default(obj: Any) -> Any:
+    """
+    Fallback for types orjson does not serialize natively.
+    Mirrors ninja.responses.NinjaJSONEncoder for the remaining types.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, timedelta):
+        return duration_iso_string(obj)
+    if isinstance(obj, (Promise, Url, IPv4Address, IPv4Network, IPv6Address, IPv6Network)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(data: Any) -> bytes:
+    """Serialize data to JSON bytes with the API-wide orjson options."""
+    return orjson.dumps(data, default=orjson_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """Response renderer using orjson."""
+
+    media_type = "application/json"
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        return dumps(data)
+
+
+class ORJSONParser(Parser):
+    """Request body parser using orjson."""
+
+    def parse_body(self, request: HttpRequest) -> DictStrAny:
+        return orjson.loads(request.body)
@@ -0,0 +1,160 @@
+"""
+Batched retention purges.
+
+A single ``filter(created_at__lt=cutoff).delete()`` on a large table holds row locks
+for the whole statement, and Django's deletion collector loads every row to send
+signals and emulate cascades. RetentionEngine deletes with raw set-based DELETE
+statements in bounded batches, each committed on its own, and sleeps between
+batches so replication and concurrent writers keep up:
+
+- integer primary keys (monotonic with the timestamp) are purged in PK ranges:
+  ``DELETE ... WHERE id >= %s AND id < %s AND timestamp < %s``
+- UUID primary keys are purged by the oldest rows of the timestamp index:
+  ``DELETE ... WHERE id IN (SELECT id ... WHERE created_at < %s ORDER BY created_at LIMIT %s)``
+
+Signals are not sent and cascades are not emulated, so only models that no other
+model references can be registered. Policies read their retention period from
+INTELLECTUAL_PARTNER_SETTINGS.
+
+Usage:
+    from core.retention import RetentionEngine
+
+    RetentionEngine.purge("notifications")
+"""
+
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, models
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """Rows of `model` whose `field` is older than the `days_setting` days are purged."""
+
+    def __init__(self, model: str, field: str, days_setting: str, default_days: int, batch_size: Optional[int] = None):
+        self.model = model
+        self.field = field
+        self.days_setting = days_setting
+        self.default_days = default_days
+        self.batch_size = batch_size
+
+    def get_days(self) -> int:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(self.days_setting, self.default_days)
+
+
+class RetentionEngine:
+    """Purges expired rows of the registered POLICIES in bounded batches."""
+
+    POLICIES = {
+        "notifications": RetentionPolicy("notifications.Notification", "created_at", "NOTIFICATION_RETENTION_DAYS", 90),
+        "emotion_logs": RetentionPolicy("emotions.EmotionLog", "created_at", "ANALYTICS_RETENTION_DAYS", 365),
+        # Integer PKs: ranges of RETENTION_BATCH_SIZE ids
+        "concentration_levels": RetentionPolicy("core.ConcentrationLevel", "timestamp", "ANALYTICS_RETENTION_DAYS", 365),
+    }
+
+    @staticmethod
+    def get_setting(name: str, default: Any) -> Any:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @staticmethod
+    def get_model(policy: RetentionPolicy):
+        model = apps.get_model(policy.model)
+        referenced_by = [relation.related_model.__name__ for relation in model._meta.related_objects]
+        if referenced_by or model._meta.many_to_many:
+            raise ImproperlyConfigured(
+                f"{policy.model} is referenced by {', '.join(referenced_by) or 'a many-to-many table'}; "
+                "raw retention deletes would skip cascades"
+            )
+        return model
+
+    @classmethod
+    def purge(cls, name: str, now=None, time_budget: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Purge the expired rows of one policy.
+        Stops after time_budget seconds (RETENTION_TIME_BUDGET) with completed=False.
+        """
+        policy = cls.POLICIES[name]
+        model = cls.get_model(policy)
+        cutoff = (now or timezone.now()) - timedelta(days=policy.get_days())
+        batch_size = policy.batch_size or cls.get_setting("RETENTION_BATCH_SIZE", 5000)
+        pause = cls.get_setting("RETENTION_BATCH_SLEEP", 0.1)
+        time_budget = time_budget if time_budget is not None else cls.get_setting("RETENTION_TIME_BUDGET", 480)
+
+        if isinstance(model._meta.pk, (models.AutoField, models.BigAutoField, models.SmallAutoField)):
+            batches = cls.iter_pk_range_batches(model, policy.field, cutoff, batch_size)
+        else:
+            batches = cls.iter_oldest_batches(model, policy.field, cutoff, batch_size)
+
+        started = time.monotonic()
+        deleted = batch_count = 0
+        completed = True
+        for rows in batches:
+            deleted += rows
+            batch_count += 1
+            if time.monotonic() - started > time_budget:
+                completed = False
+                break
+            if pause:
+                time.sleep(pause)
+
+        elapsed = time.monotonic() - started
+        result = {
+            "policy": name,
+            "cutoff": cutoff.isoformat(),
+            "deleted": deleted,
+            "batches": batch_count,
+            "seconds": round(elapsed, 2),
+            "rows_per_second": round(deleted / elapsed, 1) if elapsed else 0.0,
+            "completed": completed,
+        }
+        logger.info(
+            f"Retention {name}: deleted {deleted} rows in {batch_count} batches, "
+            f"{result['rows_per_second']} rows/s (completed={completed})"
+        )
+        return result
+
+    @staticmethod
+    def iter_pk_range_batches(model, field: str, cutoff, batch_size: int):
+        """DELETE over consecutive PK ranges, seeking over gaps, until the first live row."""
+        quote = connection.ops.quote_name
+        sql = (
+            f"DELETE FROM {quote(model._meta.db_table)} "
+            f"WHERE {quote(model._meta.pk.column)} >= %s AND {quote(model._meta.pk.column)} < %s "
+            f"AND {quote(model._meta.get_field(field).column)} < %s"
+        )
+        rows = model._base_manager.order_by("pk").values_list("pk", field)
+        position = rows.first()
+        while position is not None and position[1] < cutoff:
+            lower = position[0]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [lower, lower + batch_size, cutoff])
+                deleted = cursor.rowcount
+            yield deleted
+            position = rows.filter(pk__gte=lower + batch_size).first()
+
+    @staticmethod
+    def iter_oldest_batches(model, field: str, cutoff, batch_size: int):
+        """DELETE the oldest expired rows, batch_size at a time, through the index on `field`."""
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        pk = quote(model._meta.pk.column)
+        column = quote(model._meta.get_field(field).column)
+        sql = (
+            f"DELETE FROM {table} WHERE {pk} IN "
+            f"(SELECT {pk} FROM {table} WHERE {column} < %s ORDER BY {column} LIMIT %s)"
+        )
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [cutoff, batch_size])
+                deleted = cursor.rowcount
+            if not deleted:
+                return
+            yield deleted
@@ -0,0 +1,67 @@
+"""
+Periodic and per-user job scheduling.
+
+- Beat entries run through core.tasks.run_periodic, which takes a single-run lock
+  (SET NX with a TTL shorter than the period) before sending the real task. A
+  second beat replica, or a DatabaseScheduler restart replaying a due entry,
+  finds the lock held and skips. Tasks continuing their own work (.delay() from
+  within the task) call the real task directly and are not affected.
+- Each entry is delayed by a stable per-task offset within its jitter window, so
+  jobs sharing a crontab minute do not start at the same second.
+- UserSlotSpreader hashes users into slots of a window, so per-user jobs
+  (reminders, recovery checks) are spread evenly instead of all starting at once.
+  The slot of a user is stable across runs.
+
+Usage:
+    from core.scheduling import UserSlotSpreader
+
+    UserSlotSpreader(window=3600, salt="reminders").schedule(send_reminder, user_ids)
+"""
+
+import hashlib
+from typing import Any, Dict, Iterable, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+from .utils import CacheManager
+
+
+def stable_hash(value: Any) -> int:
+    """Process-independent hash (Python's hash() of str is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+def task_offset(task_name: str, jitter: int) -> int:
+    """Stable start offset of a periodic task within [0, jitter) seconds."""
+    return stable_hash(task_name) % jitter if jitter > 0 else 0
+
+
+def acquire_single_run(name: str, ttl: int) -> bool:
+    """Claim the run of a periodic job; False if another scheduler already claimed it within ttl seconds."""
+    return cache.add(CacheManager.get_cache_key("periodic", name), timezone.now().isoformat(), ttl)
+
+
+class UserSlotSpreader:
+    """Spreads per-user work over a window by hashing each user into one of `slots` slots."""
+
+    def __init__(self, window: int, slots: Optional[int] = None, salt: str = ""):
+        self.window = window
+        self.slots = max(1, min(slots or window, window))
+        self.salt = salt
+
+    def slot(self, user_id: Any) -> int:
+        return stable_hash(f"{self.salt}:{user_id}") % self.slots
+
+    def offset(self, user_id: Any) -> int:
+        """Seconds from the start of the window at which the user's work runs."""
+        return self.slot(user_id) * self.window // self.slots
+
+    def schedule(
+        self, task: Any, user_ids: Iterable[Any], args: tuple = (), kwargs: Optional[Dict[str, Any]] = None, **options
+    ) -> int:
+        """Send task(user_id, *args, **kwargs) for every user, delayed by the user's offset."""
+        count = 0
+        for user_id in user_ids:
+            task.apply_async(args=(str(user_id), *args), kwargs=kwargs, countdown=self.offset(user_id), **options)
+            count += 1
+        return count
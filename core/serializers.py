@@ -72,7 +72,7 @@ class ConcentrationLevelSchema(Schema):
     """Concentration level schema."""
 
     id: int
-    user_id: int
+    user_id: UUID
     level: int = Field(ge=1, le=10)
     timestamp: datetime
     session_id: UUID
@@ -97,7 +97,7 @@ class AchievementSchema(Schema):
     """Achievement schema."""
 
     id: UUID
-    user_id: int
+    user_id: UUID
     title: str
     description: str
     type: str
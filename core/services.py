@@ -2,14 +2,33 @@
 Core business logic services.
 """
 
-from typing import List, Optional, Dict, Any
+import math
+import time
+import uuid
+from typing import List, Optional, Dict, Any, Tuple
+
+import orjson
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import QuerySet
+from django.db import transaction
+from django.db.models import Avg, Count, F, QuerySet, Sum
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import Tag, Category, Subject, Achievement, ConcentrationLevel, StudyEnvironment
+from django_redis import get_redis_connection
+from redis.exceptions import WatchError
+from .models import (
+    Tag,
+    Category,
+    Subject,
+    Achievement,
+    ConcentrationLevel,
+    StudyEnvironment,
+    StudySession,
+    StatusChoices,
+)
+from .constants import CACHE_TIMEOUT_LONG
 from .exceptions import NotFoundError, ValidationError, BusinessLogicError
-from .utils import StudySessionGenerator, ProgressCalculator
+from .utils import StudySessionGenerator, ProgressCalculator, CacheManager
 import logging
 
 logger = logging.getLogger(__name__)
@@ -111,7 +130,20 @@ class ConcentrationService:
 
 
 class StudyEnvironmentService:
-    """Service for study environment tracking."""
+    """
+    Service for study environment tracking.
+
+    analyze_factors() measures how each environment factor (lighting, temperature, noise,
+    location, BGM) relates to the self-rated effectiveness: rating mean, count and 95%
+    confidence interval per factor level and per combination of levels, all grouped in SQL.
+    The result is cached per user and invalidated when the user's environments change
+    (core.signals.invalidate_environment_factors).
+    """
+
+    FACTORS = ("lighting", "temperature", "noise_level", "location", "background_music")
+    FACTORS_CACHE_TYPE = "environment_factors"
+    # Two-sided 95% normal quantile
+    CONFIDENCE_Z = 1.96
 
     @staticmethod
     def record_environment(
@@ -149,6 +181,78 @@ class StudyEnvironmentService:
             )
         )
 
+    @staticmethod
+    def count_optimal_environments(user_id: Any, min_rating: int = 4) -> int:
+        """Number of the user's optimal study environments, counted in the database."""
+        return StudyEnvironment.objects.filter(user_id=user_id, effective_rating__gte=min_rating).count()
+
+    @classmethod
+    def rating_stats(cls, row: Dict[str, Any], overall_mean: float) -> Dict[str, Any]:
+        """Mean, count and 95% confidence interval of a grouped row."""
+        count = row["count"]
+        mean = row["total"] / count
+        stats = {"count": count, "mean_rating": round(mean, 2), "effect": round(mean - overall_mean, 2)}
+        if count > 1:
+            variance = max(row["squares"] - count * mean * mean, 0.0) / (count - 1)
+            margin = cls.CONFIDENCE_Z * math.sqrt(variance / count)
+            stats.update(ci_low=round(mean - margin, 2), ci_high=round(mean + margin, 2))
+        else:
+            stats.update(ci_low=None, ci_high=None)
+        return stats
+
+    @classmethod
+    def analyze_factors(cls, user_id: Any) -> Dict[str, Any]:
+        """
+        Effect of each environment factor level and of the best factor combinations on the rating.
+        Combinations are ranked by the lower bound of their confidence interval, so a single
+        well-rated record does not outrank a consistently good setup; the best
+        STUDY_ENVIRONMENT_COMBINATION_LIMIT are returned.
+        """
+        cached = CacheManager.get_cached_user_data(user_id, cls.FACTORS_CACHE_TYPE)
+        if cached is not None:
+            return cached
+
+        environments = StudyEnvironment.objects.filter(user_id=user_id).order_by()
+        aggregates = {
+            "count": Count("id"),
+            "total": Sum("effective_rating"),
+            "squares": Sum(F("effective_rating") * F("effective_rating")),
+        }
+        overall = environments.aggregate(mean=Avg("effective_rating"), count=Count("id"))
+        if not overall["count"]:
+            result = {"count": 0, "mean_rating": None, "factors": {}, "combinations": []}
+        else:
+            overall_mean = overall["mean"]
+            factors = {}
+            for factor in cls.FACTORS:
+                levels = [
+                    {"level": row[factor], **cls.rating_stats(row, overall_mean)}
+                    for row in environments.values(factor).annotate(**aggregates)
+                ]
+                factors[factor] = sorted(levels, key=lambda level: level["mean_rating"], reverse=True)
+
+            combinations = [
+                {"levels": {factor: row[factor] for factor in cls.FACTORS}, **cls.rating_stats(row, overall_mean)}
+                for row in environments.values(*cls.FACTORS).annotate(**aggregates)
+            ]
+            combinations.sort(
+                key=lambda combination: (
+                    combination["ci_low"] if combination["ci_low"] is not None else float("-inf"),
+                    combination["count"],
+                ),
+                reverse=True,
+            )
+            limit = settings.INTELLECTUAL_PARTNER_SETTINGS.get("STUDY_ENVIRONMENT_COMBINATION_LIMIT", 20)
+            result = {
+                "count": overall["count"],
+                "mean_rating": round(overall_mean, 2),
+                "factors": factors,
+                "combinations": combinations[:limit],
+            }
+
+        CacheManager.cache_user_data(user_id, cls.FACTORS_CACHE_TYPE, result, timeout=CACHE_TIMEOUT_LONG)
+        return result
+
 
 class AchievementService:
     """Service for achievement operations."""
@@ -219,6 +323,426 @@ class StudySessionService:
         )
 
 
+class StudySessionKeys:
+    """Redis keys of live study sessions."""
+
+    PREFIX = "intellectual_partner:study_session"
+    HEARTBEATS = f"{PREFIX}:heartbeats"
+    FLUSH_QUEUE = f"{PREFIX}:flush_queue"
+
+    @staticmethod
+    def state(session_id: Any) -> str:
+        return f"{StudySessionKeys.PREFIX}:{uuid.UUID(str(session_id)).hex}:state"
+
+    @staticmethod
+    def events(session_id: Any) -> str:
+        return f"{StudySessionKeys.PREFIX}:{uuid.UUID(str(session_id)).hex}:events"
+
+
+class StudySessionStateService:
+    """
+    Live study session state for ws/study-session/<session_id>/.
+
+    - State (timer, current ticket, last concentration) is a Redis hash.
+    - Every state change is appended to a capped Redis stream (STUDY_SESSION_STREAM_MAXLEN),
+      so a reconnecting client resumes from its last event id without any DB read.
+    - Heartbeats are scores in a sorted set. Sessions that end, or stay silent for
+      STUDY_SESSION_IDLE_TIMEOUT seconds, are queued and written to StudySession in batches.
+    """
+
+    EVENT_TYPES = ("timer.start", "timer.pause", "ticket.select", "concentration", "session.end")
+    STATE_FIELDS = (
+        "user_id",
+        "name",
+        "status",
+        "started_at",
+        "ended_at",
+        "elapsed_seconds",
+        "timer_started_at",
+        "current_ticket_id",
+        "last_concentration",
+        "event_count",
+    )
+
+    @staticmethod
+    def get_client():
+        return get_redis_connection("default")
+
+    @staticmethod
+    def get_setting(name: str, default: int) -> int:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @classmethod
+    def key_ttl(cls) -> int:
+        # Keys outlive the idle timeout so the expiry sweep can still flush them
+        return cls.get_setting("STUDY_SESSION_IDLE_TIMEOUT", 300) * 4
+
+    @staticmethod
+    def decode(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+        return {key.decode(): orjson.loads(value) for key, value in raw.items()}
+
+    @staticmethod
+    def encode(state: Dict[str, Any]) -> Dict[str, bytes]:
+        return {key: orjson.dumps(value) for key, value in state.items()}
+
+    @classmethod
+    def public_state(cls, state: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+        """State sent to clients; elapsed time includes the running timer."""
+        now = now or time.time()
+        elapsed = state.get("elapsed_seconds", 0)
+        if state.get("timer_started_at"):
+            elapsed += now - state["timer_started_at"]
+        return {
+            "name": state.get("name", ""),
+            "status": state.get("status"),
+            "started_at": state.get("started_at"),
+            "ended_at": state.get("ended_at"),
+            "elapsed_seconds": int(elapsed),
+            "timer_running": bool(state.get("timer_started_at")),
+            "current_ticket_id": state.get("current_ticket_id"),
+            "last_concentration": state.get("last_concentration"),
+        }
+
+    @classmethod
+    def start(cls, user_id: Any) -> Tuple[str, Dict[str, Any]]:
+        """Start a new session. Ids are generated here, never taken from clients. Returns (session id, state)."""
+        session_id = uuid.uuid4().hex
+        state = {
+            "user_id": str(user_id),
+            "name": StudySessionService.generate_session_name(),
+            "status": StatusChoices.IN_PROGRESS,
+            "started_at": timezone.now().isoformat(),
+            "ended_at": None,
+            "elapsed_seconds": 0,
+            "timer_started_at": None,
+            "current_ticket_id": None,
+            "last_concentration": None,
+            "event_count": 0,
+        }
+        cls.activate(session_id, user_id, state)
+        return session_id, state
+
+    @classmethod
+    def activate(cls, session_id: Any, user_id: Any, state: Dict[str, Any]) -> None:
+        """Make a session live in Redis."""
+        from .signals import study_session_started
+
+        pipe = cls.get_client().pipeline(transaction=True)
+        pipe.hset(StudySessionKeys.state(session_id), mapping=cls.encode(state))
+        pipe.expire(StudySessionKeys.state(session_id), cls.key_ttl())
+        pipe.zadd(StudySessionKeys.HEARTBEATS, {str(session_id): time.time()})
+        pipe.execute()
+        study_session_started.send(sender=cls, user_id=user_id, session_id=session_id)
+
+    @classmethod
+    def load(cls, session_id: Any, user_id: Any) -> Optional[Tuple[Dict[str, Any], Optional[str]]]:
+        """
+        (state, last event id) of an existing session owned by the user, None if the id is
+        invalid or unknown, or the session is not theirs or ended. New sessions come from start().
+        Only sessions that are not live in Redis are looked up in the database.
+        """
+        from .signals import study_session_started
+
+        try:
+            uuid.UUID(str(session_id))
+        except ValueError:
+            return None
+
+        state_key = StudySessionKeys.state(session_id)
+        with cls.get_client().pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # WATCH: flush() may drop the state between the read and the resume below
+                    pipe.watch(state_key)
+                    raw = pipe.hgetall(state_key)
+                    if not raw:
+                        pipe.unwatch()
+                        break
+                    state = cls.decode(raw)
+                    if state["user_id"] != str(user_id):
+                        pipe.unwatch()
+                        return None
+                    last_events = pipe.xrevrange(StudySessionKeys.events(session_id), count=1)
+
+                    running = state.get("status") == StatusChoices.IN_PROGRESS
+                    pipe.multi()
+                    pipe.expire(state_key, cls.key_ttl())
+                    if running:
+                        # A session queued after going idle is live again: take it out of the flush queue
+                        pipe.srem(StudySessionKeys.FLUSH_QUEUE, str(session_id))
+                        pipe.zadd(StudySessionKeys.HEARTBEATS, {str(session_id): time.time()})
+                    results = pipe.execute()
+                    if running and results[1]:
+                        study_session_started.send(sender=cls, user_id=user_id, session_id=session_id)
+                    return state, last_events[0][0].decode() if last_events else None
+                except WatchError:
+                    continue
+
+        session = StudySession.objects.filter(pk=session_id, user_id=user_id, is_deleted=False).first()
+        if session is None or session.status == StatusChoices.COMPLETED:
+            return None
+        state = {
+            "user_id": str(session.user_id),
+            "name": session.name,
+            "status": StatusChoices.IN_PROGRESS,
+            "started_at": session.started_at.isoformat(),
+            "ended_at": None,
+            "elapsed_seconds": session.elapsed_seconds,
+            "timer_started_at": None,
+            "current_ticket_id": str(session.current_ticket_id) if session.current_ticket_id else None,
+            "last_concentration": session.last_concentration,
+            "event_count": session.event_count,
+        }
+        cls.activate(session_id, user_id, state)
+        return state, None
+
+    @classmethod
+    def heartbeat(cls, session_id: Any) -> None:
+        client = cls.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(StudySessionKeys.HEARTBEATS, {str(session_id): time.time()}, xx=True)
+        pipe.expire(StudySessionKeys.state(session_id), cls.key_ttl())
+        pipe.expire(StudySessionKeys.events(session_id), cls.key_ttl())
+        pipe.execute()
+
+    @classmethod
+    def changes(cls, state: Dict[str, Any], event_type: str, data: Dict[str, Any], now: float) -> Dict[str, Any]:
+        """State fields changed by a client event."""
+        changes: Dict[str, Any] = {}
+        if event_type == "timer.start" and not state.get("timer_started_at"):
+            changes["timer_started_at"] = now
+        elif event_type in ("timer.pause", "session.end") and state.get("timer_started_at"):
+            changes["elapsed_seconds"] = state.get("elapsed_seconds", 0) + now - state["timer_started_at"]
+            changes["timer_started_at"] = None
+        if event_type == "ticket.select":
+            try:
+                changes["current_ticket_id"] = str(uuid.UUID(str(data.get("ticket_id"))))
+            except ValueError:
+                raise ValidationError("Invalid ticket_id")
+        elif event_type == "concentration":
+            level = data.get("level")
+            if not isinstance(level, int) or not (1 <= level <= 10):
+                raise ValidationError("Concentration level must be between 1 and 10")
+            changes["last_concentration"] = level
+        elif event_type == "session.end":
+            changes["status"] = StatusChoices.COMPLETED
+            changes["ended_at"] = timezone.now().isoformat()
+        changes["event_count"] = state.get("event_count", 0) + 1
+        return changes
+
+    @classmethod
+    def apply(cls, session_id: Any, event_type: str, data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Apply a client event: update the state hash and append to the stream in one transaction.
+        The state is read under WATCH, so concurrent events on the same session (e.g. pause
+        and end from two tabs) are serialized: the loser retries on the new state instead of
+        adding the same timer span twice. Returns (event id, event).
+        """
+        from .signals import study_session_ended
+
+        if event_type not in cls.EVENT_TYPES:
+            raise ValidationError(f"Unknown study session event: {event_type}")
+
+        state_key = StudySessionKeys.state(session_id)
+        with cls.get_client().pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    pipe.watch(state_key)
+                    state = cls.decode(pipe.hgetall(state_key))
+                    if not state or state.get("status") != StatusChoices.IN_PROGRESS:
+                        raise BusinessLogicError("Study session is not running")
+
+                    now = time.time()
+                    changes = cls.changes(state, event_type, data, now)
+                    state.update(changes)
+                    event = {"event": event_type, "state": cls.public_state(state, now)}
+
+                    pipe.multi()
+                    pipe.hset(state_key, mapping=cls.encode(changes))
+                    pipe.xadd(
+                        StudySessionKeys.events(session_id),
+                        {"event": orjson.dumps(event)},
+                        maxlen=cls.get_setting("STUDY_SESSION_STREAM_MAXLEN", 500),
+                        approximate=True,
+                    )
+                    pipe.expire(StudySessionKeys.events(session_id), cls.key_ttl())
+                    if event_type == "session.end":
+                        pipe.zrem(StudySessionKeys.HEARTBEATS, str(session_id))
+                        pipe.sadd(StudySessionKeys.FLUSH_QUEUE, str(session_id))
+                    else:
+                        pipe.zadd(StudySessionKeys.HEARTBEATS, {str(session_id): now})
+                    event_id = pipe.execute()[1].decode()
+                    break
+                except WatchError:
+                    continue
+
+        if event_type == "session.end":
+            study_session_ended.send(sender=cls, user_id=state["user_id"], session_id=session_id)
+        return event_id, event
+
+    @classmethod
+    def replay(cls, session_id: Any, last_event_id: str) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """
+        Events after last_event_id, or None when some of them were already trimmed
+        from the stream (the client should then take a full state snapshot).
+        """
+        try:
+            last = tuple(int(part) for part in last_event_id.split("-", 1))
+        except ValueError:
+            return None
+
+        client = cls.get_client()
+        pipe = client.pipeline(transaction=False)
+        pipe.xrange(StudySessionKeys.events(session_id), count=1)
+        pipe.xrange(StudySessionKeys.events(session_id), min=f"({last_event_id}")
+        first, missed = pipe.execute()
+
+        if first and tuple(int(part) for part in first[0][0].decode().split("-", 1)) > last:
+            # The client's last event is gone, events right after it may have been trimmed too
+            return None
+        return [(event_id.decode(), orjson.loads(fields[b"event"])) for event_id, fields in missed]
+
+    @classmethod
+    def expire_idle(cls) -> int:
+        """Queue sessions without heartbeat for STUDY_SESSION_IDLE_TIMEOUT seconds for flushing."""
+        from .signals import study_session_ended
+
+        client = cls.get_client()
+        cutoff = time.time() - cls.get_setting("STUDY_SESSION_IDLE_TIMEOUT", 300)
+        idle = [session_id.decode() for session_id in client.zrangebyscore(StudySessionKeys.HEARTBEATS, "-inf", cutoff)]
+        if not idle:
+            return 0
+
+        pipe = client.pipeline(transaction=False)
+        for session_id in idle:
+            pipe.hget(StudySessionKeys.state(session_id), "user_id")
+        owners = pipe.execute()
+
+        pipe = client.pipeline(transaction=True)
+        pipe.zrem(StudySessionKeys.HEARTBEATS, *idle)
+        pipe.sadd(StudySessionKeys.FLUSH_QUEUE, *idle)
+        pipe.execute()
+
+        for session_id, owner in zip(idle, owners):
+            if owner is not None:
+                study_session_ended.send(sender=cls, user_id=orjson.loads(owner), session_id=session_id)
+        logger.info(f"Expired {len(idle)} idle study sessions")
+        return len(idle)
+
+    @classmethod
+    def flush(cls) -> int:
+        """
+        Write queued sessions to the database in batches and drop their Redis state.
+        Session ids stay in the flush queue until their rows are committed, so a crash or
+        database error leaves them queued for the next run (the upsert is idempotent).
+        """
+        from .signals import study_sessions_flushed
+
+        client = cls.get_client()
+        batch_size = cls.get_setting("STUDY_SESSION_FLUSH_BATCH_SIZE", 500)
+        flushed = 0
+
+        while True:
+            session_ids = [
+                session_id.decode() for session_id in client.srandmember(StudySessionKeys.FLUSH_QUEUE, batch_size)
+            ]
+            if not session_ids:
+                break
+
+            pipe = client.pipeline(transaction=False)
+            for session_id in session_ids:
+                pipe.hgetall(StudySessionKeys.state(session_id))
+            states = pipe.execute()
+
+            now = time.time()
+            sessions = []
+            versions = {}
+            for session_id, raw in zip(session_ids, states):
+                versions[session_id] = raw.get(b"event_count")
+                if not raw:
+                    continue
+                state = cls.decode(raw)
+                public = cls.public_state(state, now)
+                sessions.append(
+                    StudySession(
+                        id=session_id,
+                        user_id=state["user_id"],
+                        name=public["name"],
+                        # Idle sessions stay resumable from the database
+                        status=state["status"] if state["status"] == StatusChoices.COMPLETED else StatusChoices.PAUSED,
+                        started_at=datetime.fromisoformat(state["started_at"]),
+                        ended_at=datetime.fromisoformat(state["ended_at"]) if state.get("ended_at") else None,
+                        elapsed_seconds=public["elapsed_seconds"],
+                        current_ticket_id=state.get("current_ticket_id"),
+                        last_concentration=state.get("last_concentration"),
+                        event_count=state.get("event_count", 0),
+                    )
+                )
+
+            with transaction.atomic():
+                StudySession.objects.bulk_create(
+                    sessions,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=[
+                        "name",
+                        "status",
+                        "ended_at",
+                        "elapsed_seconds",
+                        "current_ticket_id",
+                        "last_concentration",
+                        "event_count",
+                        "updated_at",
+                    ],
+                )
+            user_ids = {session.user_id for session in sessions}
+            CacheManager.bump_user_data_versions(user_ids)
+            study_sessions_flushed.send(sender=cls, user_ids=user_ids)
+
+            cls.drop_flushed(client, versions)
+            flushed += len(sessions)
+
+        if flushed:
+            logger.info(f"Flushed {flushed} study sessions to the database")
+        return flushed
+
+    @staticmethod
+    def drop_flushed(client: Any, versions: Dict[str, Optional[bytes]]) -> None:
+        """
+        Dequeue written sessions and drop their Redis state, unless they changed after being read.
+        versions maps session ids to the event_count read by flush(). A session resumed since
+        (load() took it out of the queue) stays live; one with new events stays queued, and the
+        next pass writes its new state.
+        """
+        state_keys = [StudySessionKeys.state(session_id) for session_id in versions]
+        with client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # Resumes and events write the state key, which aborts the transaction
+                    pipe.watch(*state_keys)
+                    check = client.pipeline(transaction=False)
+                    for session_id in versions:
+                        check.sismember(StudySessionKeys.FLUSH_QUEUE, session_id)
+                        check.hget(StudySessionKeys.state(session_id), "event_count")
+                    results = check.execute()
+                    unchanged = [
+                        session_id
+                        for index, (session_id, version) in enumerate(versions.items())
+                        if results[index * 2] and results[index * 2 + 1] == version
+                    ]
+
+                    pipe.multi()
+                    if unchanged:
+                        pipe.srem(StudySessionKeys.FLUSH_QUEUE, *unchanged)
+                        for session_id in unchanged:
+                            pipe.delete(StudySessionKeys.state(session_id), StudySessionKeys.events(session_id))
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+
 class AnalyticsService:
     """Service for analytics operations."""
 
@@ -255,7 +779,7 @@ class AnalyticsService:
             "total_points": sum(a.points for a in achievements),
             "weekly_progress": weekly_progress,
             "concentration_trend": ConcentrationService.get_user_concentration_trend(user, days),
-            "optimal_environments": len(StudyEnvironmentService.get_optimal_environments(user)),
+            "optimal_environments": StudyEnvironmentService.count_optimal_environments(user.id),
             "recent_achievements": [
                 {"title": a.title, "type": a.type, "points": a.points, "achieved_at": a.achieved_at}
                 for a in achievements[:5]
@@ -3,18 +3,28 @@ Core signals for the intellectual partner application.
 Contains signal handlers for common model operations.
 """
 
+from functools import partial
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete, pre_save
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from .utils import CacheManager
 import logging
 
 logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# Sent by core.services.StudySessionStateService with user_id and session_id:
+# live sessions are kept in Redis, so they never go through post_save
+study_session_started = Signal()
+study_session_ended = Signal()
+# Sent by StudySessionStateService.flush() with user_ids once the StudySession rows are committed
+study_sessions_flushed = Signal()
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -36,13 +46,29 @@ def create_user_profile(sender, instance, created, **kwargs):
 def invalidate_user_cache(sender, instance, **kwargs):
     """
     Invalidate user-specific cache when user-related models are updated.
+    Also bumps the user data version so conditional GETs (core.etags) see the change.
+    The bump waits for the commit: a request served in between would otherwise store
+    the new version with the old data.
     """
+    if sender is User:
+        transaction.on_commit(partial(CacheManager.bump_user_data_version, instance.pk))
+
     if hasattr(instance, "user_id"):
         user_id = instance.user_id
         cache.delete_many(cache.keys(f"ユーザー:{user_id}:*"))
+        transaction.on_commit(partial(CacheManager.bump_user_data_version, user_id))
         logger.debug(f"Invalidated cache for user {user_id}")
 
 
+@receiver(post_save, sender="core.StudyEnvironment")
+@receiver(post_delete, sender="core.StudyEnvironment")
+def invalidate_environment_factors(sender, instance, **kwargs):
+    """
+    Drop the cached environment factor analysis (core.services.StudyEnvironmentService) of the user.
+    """
+    CacheManager.invalidate_user_cache(instance.user_id, "environment_factors")
+
+
 @receiver(post_delete)
 def cleanup_soft_deleted_cache(sender, instance, **kwargs):
     """
@@ -51,6 +77,7 @@ def cleanup_soft_deleted_cache(sender, instance, **kwargs):
     if hasattr(instance, "user_id"):
         user_id = instance.user_id
         cache.delete_many(cache.keys(f"ユーザー:{user_id}:*"))
+        transaction.on_commit(partial(CacheManager.bump_user_data_version, user_id))
         logger.debug(f"Cleaned up cache for deleted instance of user {user_id}")
 
 
@@ -0,0 +1,158 @@
+"""
+Celery task instrumentation.
+
+InstrumentedTask is the base class of every task (config.celery). Per task name and
+queue it records into an in-process registry:
+
+- wait: publish-to-start delay, from the ``published_at`` header stamped by the
+  before_task_publish handler below (every publisher loads config.celery)
+- runtime, and the busy worker-seconds it adds up to
+- successes, failures, retries and serialized result size
+- a wait-time histogram (WAIT_BUCKETS) for percentiles
+
+Prefork children each own a registry; they add it to per-minute Redis hashes every
+FLUSH_INTERVAL seconds, so ``manage.py task_metrics`` sees the whole cluster. Per
+queue, busy worker-seconds per second is the offered load in workers: a queue
+whose load approaches its concurrency, or whose wait percentiles grow, is saturated.
+Failures are logged here with the traceback; nothing is enqueued on failure.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+from celery import Task
+from celery.signals import before_task_publish, worker_process_shutdown
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED_AT_HEADER = "published_at"
+KEY_PREFIX = "intellectual_partner:task_metrics"
+KEY_TTL = 60 * 60 * 24
+FLUSH_INTERVAL = 10.0
+# Upper bounds (seconds) of the wait histogram buckets; the last bucket is open
+WAIT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+@before_task_publish.connect
+def stamp_published_at(sender=None, headers=None, **kwargs):
+    if headers is not None:
+        headers[PUBLISHED_AT_HEADER] = time.time()
+
+
+class TaskMetricsRegistry:
+    """In-process counters per (queue, task name), flushed to Redis as increments."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.last_flush = time.monotonic()
+
+    def started(self, queue: str, task_name: str, wait: Optional[float]) -> None:
+        with self.lock:
+            self.in_flight[queue] += 1
+            if wait is None:
+                return
+            counters = self.counters[(queue, task_name)]
+            counters["waited"] += 1
+            counters["wait_sum"] += wait
+            counters["wait_max"] = max(counters["wait_max"], wait)
+            bucket = next((bound for bound in WAIT_BUCKETS if wait <= bound), "inf")
+            counters[f"wait_le_{bucket}"] += 1
+
+    def finished(self, queue: str, task_name: str, runtime: float, status: str, result_bytes: int = 0) -> None:
+        """Record the end of a run; status is "succeeded", "failed" or "retries"."""
+        with self.lock:
+            self.in_flight[queue] = max(0, self.in_flight[queue] - 1)
+            counters = self.counters[(queue, task_name)]
+            counters[status] += 1
+            counters["runtime_sum"] += runtime
+            counters["runtime_max"] = max(counters["runtime_max"], runtime)
+            counters["result_bytes"] += result_bytes
+        if time.monotonic() - self.last_flush > FLUSH_INTERVAL:
+            self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Unflushed counters and tasks currently running in this process."""
+        with self.lock:
+            return {
+                "tasks": {f"{queue}|{task_name}": dict(values) for (queue, task_name), values in self.counters.items()},
+                "in_flight": dict(self.in_flight),
+            }
+
+    def flush(self) -> None:
+        """Add the counters to the Redis hash of the current minute and reset them."""
+        with self.lock:
+            counters, self.counters = self.counters, defaultdict(lambda: defaultdict(float))
+            self.last_flush = time.monotonic()
+        if not counters:
+            return
+
+        try:
+            from django_redis import get_redis_connection
+
+            key = f"{KEY_PREFIX}:{int(time.time() // 60)}"
+            pipe = get_redis_connection("default").pipeline(transaction=False)
+            for (queue, task_name), values in counters.items():
+                for metric, value in values.items():
+                    field = f"{queue}|{task_name}|{metric}"
+                    if metric.endswith("_max"):
+                        # Maxima go to a sorted set, ZADD GT keeps the largest
+                        pipe.zadd(f"{key}:max", {field: value}, gt=True)
+                    else:
+                        pipe.hincrbyfloat(key, field, value)
+            pipe.expire(key, KEY_TTL)
+            pipe.expire(f"{key}:max", KEY_TTL)
+            pipe.execute()
+        except Exception as e:
+            # Metrics are best effort and must never fail a task
+            logger.warning(f"Failed to flush task metrics: {e}")
+
+
+registry = TaskMetricsRegistry()
+
+
+@worker_process_shutdown.connect
+def flush_on_shutdown(**kwargs):
+    registry.flush()
+
+
+class InstrumentedTask(Task):
+    """Task base class recording wait, runtime, retries, failures and result size."""
+
+    def get_queue(self) -> str:
+        delivery_info = self.request.delivery_info or {}
+        return delivery_info.get("routing_key") or self.app.conf.task_default_queue
+
+    def before_start(self, task_id, args, kwargs):
+        published_at = self.request.get(PUBLISHED_AT_HEADER)
+        wait = max(0.0, time.time() - published_at) if published_at else None
+        self.request.metrics_started = time.monotonic()
+        registry.started(self.get_queue(), self.name, wait)
+
+    def on_success(self, retval, task_id, args, kwargs):
+        try:
+            result_bytes = len(orjson.dumps(retval, default=str))
+        except TypeError:
+            result_bytes = 0
+        self.record_finish("succeeded", result_bytes)
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        self.record_finish("failed")
+        logger.error(
+            f"Task {self.name}[{task_id}] failed on {self.get_queue()}: {exc!r}",
+            exc_info=einfo.exc_info if einfo else None,
+        )
+
+    def on_retry(self, exc, task_id, args, kwargs, einfo):
+        self.record_finish("retries")
+        logger.warning(f"Task {self.name}[{task_id}] retry {self.request.retries + 1}: {exc!r}")
+
+    def record_finish(self, status: str, result_bytes: int = 0) -> None:
+        started = self.request.get("metrics_started")
+        runtime = time.monotonic() - started if started else 0.0
+        registry.finished(self.get_queue(), self.name, runtime, status, result_bytes)
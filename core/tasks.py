@@ -0,0 +1,44 @@
+"""
+Celery tasks for core.
+"""
+
+from celery import current_app, shared_task
+from .retention import RetentionEngine
+from .scheduling import acquire_single_run, task_offset
+from .services import StudySessionStateService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def run_periodic(task_name, lock_ttl, jitter=0, options=None):
+    """
+    Beat entry point (config.celery.periodic): send task_name once per lock_ttl seconds
+    across beat replicas, staggered by its stable offset within jitter seconds.
+    """
+    if not acquire_single_run(task_name, lock_ttl):
+        logger.info(f"Periodic task {task_name} already dispatched, skipped")
+        return {"task": task_name, "skipped": True}
+
+    countdown = task_offset(task_name, jitter)
+    current_app.send_task(task_name, countdown=countdown, **(options or {}))
+    return {"task": task_name, "countdown": countdown}
+
+
+@shared_task
+def flush_study_sessions():
+    """Expire idle live study sessions and write ended/expired ones to the database in batches."""
+    expired = StudySessionStateService.expire_idle()
+    flushed = StudySessionStateService.flush()
+    return {"expired": expired, "flushed": flushed}
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def purge_expired_data(policies=("emotion_logs", "concentration_levels")):
+    """Purge rows past their retention period (ANALYTICS_RETENTION_DAYS) in batches (daily beat job)."""
+    results = [RetentionEngine.purge(name) for name in policies]
+    unfinished = [result["policy"] for result in results if not result["completed"]]
+    if unfinished:
+        purge_expired_data.delay(unfinished)
+    return results
@@ -1,3 +1,705 @@
-from django.test import TestCase
+import io
+import statistics
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import orjson
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.http import JsonResponse
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from ninja_jwt.tokens import AccessToken
+
+from accounts.authentication import TokenRevocation
+from config.celery import app as celery_app
+from config.middleware import WebSocketMessageRateLimitMiddleware
+from config.routing import websocket_urlpatterns
+from core import framing, task_metrics
+from core.debounce import TaskDebouncer
+from core.etags import user_etag
+from core.management.commands.loadtest_websockets import ROUTES
+from core.management.commands.task_metrics import wait_percentile
+from core.management.commands.validate_quantile_sketches import max_rank_error
+from core.models import Achievement, ConcentrationLevel, StatusChoices, StudySession
+from core.renderers import ORJSONParser, ORJSONRenderer, dumps
+from core.retention import RetentionEngine, RetentionPolicy
+from core.scheduling import UserSlotSpreader, task_offset
+from core.exceptions import ValidationError
+from core.services import StudyEnvironmentService, StudySessionKeys, StudySessionStateService
+from core.sketches import DEFAULT_K, KLLSketch, rank_error_bound
+from core.tasks import run_periodic
+from core.utils import CacheManager
+from notifications.models import Notification
+
+User = get_user_model()
+
+
+class KLLSketchAccuracyTests(SimpleTestCase):
+    """Rank error of KLLSketch against exact NumPy ranks, within rank_error_bound()."""
+
+    ITEMS = 50000
+    PARTS = 100
+
+    def distributions(self):
+        rng = np.random.default_rng(0)
+        distributions = {
+            "study_minutes": np.where(rng.random(self.ITEMS) < 0.3, 0, np.round(rng.gamma(2.0, 30.0, self.ITEMS))),
+            "concentration": rng.integers(1, 11, self.ITEMS).astype(np.float64),
+            "lognormal": rng.lognormal(0.0, 1.5, self.ITEMS),
+            "sorted": np.arange(self.ITEMS, dtype=np.float64),
+        }
+        # Sketches store float32
+        return {name: values.astype(np.float32).astype(np.float64) for name, values in distributions.items()}
+
+    def test_single_stream_within_bound(self):
+        for name, values in self.distributions().items():
+            with self.subTest(distribution=name):
+                sketch = KLLSketch()
+                sketch.extend(values.tolist())
+                self.assertEqual(sketch.count, len(values))
+                self.assertLessEqual(max_rank_error(sketch, np.sort(values)), rank_error_bound(DEFAULT_K))
+
+    def test_merged_serialized_within_bound(self):
+        for name, values in self.distributions().items():
+            with self.subTest(distribution=name):
+                partials = []
+                for part in np.array_split(values, self.PARTS):
+                    sketch = KLLSketch()
+                    sketch.extend(part.tolist())
+                    partials.append(KLLSketch.from_bytes(sketch.to_bytes()))
+                merged = KLLSketch.merged(partials)
+                self.assertEqual(merged.count, len(values))
+                self.assertEqual(merged.min_value, values.min())
+                self.assertEqual(merged.max_value, values.max())
+                self.assertLessEqual(max_rank_error(merged, np.sort(values)), rank_error_bound(DEFAULT_K))
+
+    def test_small_sketch_is_exact(self):
+        values = np.random.default_rng(1).normal(50.0, 10.0, DEFAULT_K // 2).astype(np.float32).astype(np.float64)
+        sketch = KLLSketch()
+        sketch.extend(values.tolist())
+        self.assertAlmostEqual(max_rank_error(KLLSketch.from_bytes(sketch.to_bytes()), np.sort(values)), 0.0)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def test_api_types_are_rendered_like_the_default_encoder(self):
+        user_id = uuid.UUID("12345678-1234-5678-1234-567812345678")
+        payload = {
+            "id": user_id,
+            "achieved_at": datetime(2026, 4, 1, 9, 30, tzinfo=dt_timezone.utc),
+            "date": date(2026, 4, 1),
+            "points": Decimal("1.50"),
+            "duration": timedelta(minutes=25),
+            "tags": {"streak"},
+            "by_user": {user_id: 3, 7: "seven"},
+            "levels": np.array([1.5, 2.0]),
+        }
+        self.assertEqual(
+            orjson.loads(dumps(payload)),
+            {
+                "id": str(user_id),
+                "achieved_at": "2026-04-01T09:30:00Z",
+                "date": "2026-04-01",
+                "points": "1.50",
+                "duration": "P0DT00H25M00S",
+                "tags": ["streak"],
+                "by_user": {str(user_id): 3, "7": "seven"},
+                "levels": [1.5, 2.0],
+            },
+        )
+
+    def test_unsupported_types_raise(self):
+        with self.assertRaises(TypeError):
+            dumps({"value": object()})
+
+    def test_round_trip(self):
+        request = RequestFactory().post("/", data='{"level": 7, "emotion": "集中"}', content_type="application/json")
+        body = ORJSONParser().parse_body(request)
+        self.assertEqual(body, {"level": 7, "emotion": "集中"})
+        self.assertEqual(orjson.loads(ORJSONRenderer().render(request, body, response_status=200)), body)
+
+
+class FramingTests(SimpleTestCase):
+    def test_envelope_fields_are_coded(self):
+        message = {"type": "analytics.delta", "seq": 3, "changed": {"concentration": 7}}
+        self.assertEqual(framing.compact(message), {"t": 1, "s": 3, "c": {"cl": 7}})
+        self.assertEqual(framing.unpack(framing.pack(message)), message)
+
+    def test_user_keys_round_trip(self):
+        messages = [
+            # User data whose keys are codes, or look escaped
+            {"type": "session.event", "event": "concentration", "data": {"t": 0, "s": "x", "c": [1], "d": None}},
+            {"type": "resync", "data": {"st": {"~": 1, "~t": 2, "~~s": 3}, "i": "id"}},
+            # Type fields with values that are not message types
+            {"type": 3, "data": {"event": 0, "type": True, "state": {"type": "custom"}}},
+            {"data": [{"t": 1, "seq": 2}, {"level": 5, "l": 6}], "9f3b": {"emotion:happy": 2}},
+        ]
+        for message in messages:
+            with self.subTest(message=message):
+                self.assertEqual(framing.unpack(framing.pack(message)), message)
+
+
+class UserETagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+        self.token = AccessToken.for_user(self.user)
+        self.calls = 0
+
+        def view(request):
+            self.calls += 1
+            return JsonResponse({"ok": True})
+
+        self.view = user_etag(view)
+
+    def get(self, etag=None):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        if etag:
+            headers["If-None-Match"] = etag
+        return self.view(RequestFactory().get("/api/gamification/achievements", headers=headers))
+
+    def test_matching_etag_skips_the_view(self):
+        etag = self.get()["ETag"]
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.calls, 1)
+
+    def test_revoked_token_never_gets_a_304(self):
+        etag = self.get()["ETag"]
+        TokenRevocation.blacklist_token(self.token["jti"], self.token["exp"])
+        self.assertEqual(self.get(etag).status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+    def test_inactive_user_never_gets_a_304(self):
+        etag = self.get()["ETag"]
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_version_is_bumped_after_commit(self):
+        etag = self.get()["ETag"]
+        version = CacheManager.get_user_data_version(self.user.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Achievement.objects.create(user=self.user, title="初達成", description="", type="streak")
+            # Still inside the transaction: concurrent readers keep the old version
+            self.assertEqual(CacheManager.get_user_data_version(self.user.id), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.get(etag).status_code, 304)
+
+
+class StudySessionStateServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+        self.redis = StudySessionStateService.get_client()
+
+    def start(self):
+        session_id, _ = StudySessionStateService.start(self.user.id)
+        self.addCleanup(self.redis.zrem, StudySessionKeys.HEARTBEATS, session_id)
+        self.addCleanup(self.redis.srem, StudySessionKeys.FLUSH_QUEUE, session_id)
+        self.addCleanup(self.redis.delete, StudySessionKeys.state(session_id), StudySessionKeys.events(session_id))
+        return session_id
+
+    def queue(self, session_id):
+        # What expire_idle() does once the heartbeats stop
+        self.redis.zrem(StudySessionKeys.HEARTBEATS, session_id)
+        self.redis.sadd(StudySessionKeys.FLUSH_QUEUE, session_id)
+
+    def test_only_existing_sessions_are_loaded(self):
+        session_id = self.start()
+        other = User.objects.create(username="other", email="other@example.com")
+
+        self.assertIsNotNone(StudySessionStateService.load(session_id, self.user.id))
+        self.assertIsNone(StudySessionStateService.load(session_id, other.id))
+        self.assertIsNone(StudySessionStateService.load(uuid.uuid4().hex, self.user.id))
+        self.assertIsNone(StudySessionStateService.load("not-a-session", self.user.id))
+
+    def test_flush_writes_and_drops_idle_sessions(self):
+        session_id = self.start()
+        StudySessionStateService.apply(session_id, "concentration", {"level": 7})
+        self.queue(session_id)
+
+        StudySessionStateService.flush()
+        session = StudySession.objects.get(pk=session_id)
+        self.assertEqual((session.status, session.last_concentration), (StatusChoices.PAUSED, 7))
+        self.assertFalse(self.redis.exists(StudySessionKeys.state(session_id)))
+
+        # Resumable from the database
+        state, _ = StudySessionStateService.load(session_id, self.user.id)
+        self.assertEqual(state["event_count"], 1)
+
+    def test_resumed_session_is_not_dropped(self):
+        session_id = self.start()
+        self.queue(session_id)
+        StudySessionStateService.load(session_id, self.user.id)
+
+        self.assertFalse(self.redis.sismember(StudySessionKeys.FLUSH_QUEUE, session_id))
+        StudySessionStateService.flush()
+        self.assertTrue(self.redis.exists(StudySessionKeys.state(session_id)))
+
+    def test_session_changed_after_the_read_stays_queued(self):
+        session_id = self.start()
+        self.queue(session_id)
+        version = self.redis.hget(StudySessionKeys.state(session_id), "event_count")
+        StudySessionStateService.apply(session_id, "concentration", {"level": 4})
+
+        StudySessionStateService.drop_flushed(self.redis, {session_id: version})
+        self.assertTrue(self.redis.sismember(StudySessionKeys.FLUSH_QUEUE, session_id))
+        self.assertTrue(self.redis.exists(StudySessionKeys.state(session_id)))
+
+        StudySessionStateService.flush()
+        self.assertEqual(StudySession.objects.get(pk=session_id).last_concentration, 4)
+        self.assertFalse(self.redis.exists(StudySessionKeys.state(session_id)))
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class StudySessionConsumerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+
+    async def connect(self, path):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_server_generates_session_ids(self):
+        communicator, connected = await self.connect("/ws/study-session/")
+        self.assertTrue(connected)
+        frame = await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(frame["type"], "session.state")
+        session_id = frame["session_id"]
+
+        communicator, connected = await self.connect(f"/ws/study-session/{session_id}/")
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())["session_id"], session_id)
+        await communicator.disconnect()
+
+    async def test_unknown_session_ids_are_refused(self):
+        _, connected = await self.connect(f"/ws/study-session/{uuid.uuid4().hex}/")
+        self.assertFalse(connected)
+
+
+class EchoApp:
+    """Accepts and echoes every received frame."""
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.connect":
+                await send({"type": "websocket.accept"})
+            elif message["type"] == "websocket.receive":
+                await send({"type": "websocket.send", "text": message["text"]})
+            elif message["type"] == "websocket.disconnect":
+                return
+
+
+@override_settings(RATELIMIT_DECORATORS={"websocket": "3/m"})
+class WebSocketMessageRateLimitTests(TestCase):
+    def setUp(self):
+        self.app = WebSocketMessageRateLimitMiddleware(EchoApp())
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+
+    async def connect(self, user, ip="203.0.113.7", session="a"):
+        communicator = WebsocketCommunicator(self.app, "/ws/", headers=[(b"cookie", f"sessionid={session}".encode())])
+        communicator.scope["user"] = user
+        communicator.scope["client"] = [ip, 0]
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def send(self, communicator):
+        """True if the frame was echoed, False if the connection was closed for the rate."""
+        await communicator.send_to(text_data="{}")
+        output = await communicator.receive_output()
+        if output["type"] == "websocket.close":
+            self.assertEqual(output["code"], WebSocketMessageRateLimitMiddleware.CLOSE_CODE_MESSAGE_RATE_EXCEEDED)
+            return False
+        return True
+
+    async def test_user_bucket_is_shared_across_sessions(self):
+        first = await self.connect(self.user, session="a")
+        second = await self.connect(self.user, ip="198.51.100.1", session="b")
+        self.assertEqual([await self.send(first), await self.send(second), await self.send(first)], [True] * 3)
+        self.assertFalse(await self.send(second))
+        await first.disconnect()
+
+        # Another user keeps a full bucket
+        other = await self.connect(await User.objects.acreate(username="other", email="other@example.com"))
+        self.assertTrue(await self.send(other))
+        await other.disconnect()
+
+    async def test_anonymous_clients_share_a_bucket_per_ip(self):
+        first = await self.connect(AnonymousUser(), session="a")
+        second = await self.connect(AnonymousUser(), session="b")
+        for _ in range(3):
+            self.assertTrue(await self.send(first))
+        self.assertFalse(await self.send(second))
+
+        elsewhere = await self.connect(AnonymousUser(), ip="198.51.100.1")
+        self.assertTrue(await self.send(elsewhere))
+        await first.disconnect()
+        await elsewhere.disconnect()
+
+    async def test_bucket_is_dropped_with_the_last_connection(self):
+        communicator = await self.connect(self.user)
+        for _ in range(3):
+            await self.send(communicator)
+        await communicator.disconnect()
+        self.assertEqual(self.app.buckets, {})
+
+        communicator = await self.connect(self.user)
+        self.assertTrue(await self.send(communicator))
+        await communicator.disconnect()
+
+
+class TaskDebouncerTests(TestCase):
+    WINDOW, MAX_WAIT = 30, 300
+
+    def setUp(self):
+        self.task = mock.Mock()
+        self.task.name = f"tests.debounced_{uuid.uuid4().hex}"
+        TaskDebouncer.windows[self.task.name] = (self.WINDOW, self.MAX_WAIT)
+        self.addCleanup(TaskDebouncer.windows.pop, self.task.name)
+        self.user_id = uuid.uuid4()
+        self.key, self.items_key = TaskDebouncer.keys(self.task.name, self.user_id)
+        self.redis = TaskDebouncer.get_client()
+
+    def trigger(self, at, items=()):
+        with mock.patch("core.debounce.time.time", return_value=at):
+            return TaskDebouncer.trigger(self.task, self.user_id, items=items)
+
+    def test_triggers_merge_into_one_run(self):
+        now = time.time()
+        self.assertTrue(self.trigger(now, ["study"]))
+        self.assertFalse(self.trigger(now + 1, ["emotions"]))
+        self.assertEqual(self.task.apply_async.call_count, 1)
+        self.assertEqual(TaskDebouncer.dropped_counts()[self.task.name], 1)
+
+        with mock.patch("core.debounce.time.time", return_value=now + 1 + self.WINDOW):
+            self.assertEqual(TaskDebouncer.claim(self.task, self.user_id), {"study", "emotions"})
+        self.assertTrue(self.trigger(now + 2))
+        self.assertEqual(self.task.apply_async.call_count, 2)
+
+    def test_later_triggers_do_not_extend_the_expiry(self):
+        lifetime = self.MAX_WAIT * 2 + self.WINDOW
+        now = time.time()
+        self.trigger(now - 100)
+        self.trigger(now, ["study"])
+        for key in (self.key, self.items_key):
+            self.assertLessEqual(self.redis.ttl(key), lifetime - 99)
+
+    def test_a_lost_run_is_replaced_after_expiry(self):
+        now = time.time()
+        self.trigger(now - self.MAX_WAIT * 2 - self.WINDOW + 1)
+        # The run is lost: it never claims the key, and retriggers keep arriving
+        self.assertFalse(self.trigger(now))
+        time.sleep(1.1)
+        self.assertTrue(self.trigger(time.time()))
+        self.assertEqual(self.task.apply_async.call_count, 2)
+
+
+class TaskPriorityTests(SimpleTestCase):
+    def route(self, name, **options):
+        route = celery_app.amqp.router.route(options, name)
+        return route["queue"].name, route.get("priority", celery_app.conf.task_default_priority)
+
+    def test_priorities_order_tasks_within_a_lane(self):
+        self.assertEqual(self.route("analytics.tasks.recompute_user_statistics"), ("analytics", 0))
+        self.assertEqual(self.route("analytics.tasks.process_analytics_shard"), ("analytics", 6))
+        self.assertEqual(self.route("core.tasks.purge_expired_data"), ("analytics", 9))
+        self.assertEqual(self.route("notifications.tasks.flush_pending_notifications"), ("interactive", 0))
+
+    def test_beat_options_keep_the_route_priority(self):
+        # run_periodic sends with an explicit queue
+        route = self.route("notifications.tasks.cleanup_old_notifications", queue="notifications")
+        self.assertEqual(route, ("notifications", 9))
+
+
+class WebSocketLoadTestCommandTests(TestCase):
+    def test_small_run_delivers_every_message(self):
+        self.addCleanup(channel_layers.backends.pop, "default", None)
+        out = io.StringIO()
+        call_command("loadtest_websockets", clients=10, rounds=3, interval=0.01, stdout=out)
+
+        self.assertIn("connected 10/10", out.getvalue())
+        rows = {}
+        for line in out.getvalue().splitlines():
+            route, *columns = line.split() or [""]
+            if route in ROUTES:
+                rows[route] = columns
+        self.assertEqual(set(rows), set(ROUTES))
+        for route, (sockets, expected, received, dropped, *_) in rows.items():
+            with self.subTest(route=route):
+                self.assertEqual(dropped, "0")
+                self.assertGreater(int(received), 0)
+
+
+def with_settings(**values):
+    return override_settings(INTELLECTUAL_PARTNER_SETTINGS={**settings.INTELLECTUAL_PARTNER_SETTINGS, **values})
+
+
+@with_settings(RETENTION_BATCH_SIZE=3, RETENTION_BATCH_SLEEP=0)
+class RetentionEngineTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+
+    def create_samples(self, *ages):
+        samples = []
+        for age in ages:
+            sample = ConcentrationLevel.objects.create(user=self.user, level=5, session_id=uuid.uuid4())
+            ConcentrationLevel.objects.filter(pk=sample.pk).update(timestamp=self.now - timedelta(days=age))
+            samples.append(sample)
+        return samples
+
+    def create_notifications(self, *ages):
+        for age in ages:
+            notification = Notification.objects.create(user=self.user, title="お知らせ", message="本文")
+            Notification.objects.filter(pk=notification.pk).update(created_at=self.now - timedelta(days=age))
+
+    def test_integer_keys_are_purged_in_ranges_over_gaps(self):
+        samples = self.create_samples(*[400] * 9, 10, 1)
+        ConcentrationLevel.objects.filter(pk__in=[samples[3].pk, samples[4].pk, samples[5].pk]).delete()
+
+        result = RetentionEngine.purge("concentration_levels", now=self.now)
+        self.assertEqual((result["deleted"], result["batches"], result["completed"]), (6, 2, True))
+        self.assertEqual(
+            list(ConcentrationLevel.objects.order_by("pk").values_list("pk", flat=True)),
+            [samples[9].pk, samples[10].pk],
+        )
+
+    def test_uuid_keys_are_purged_oldest_first(self):
+        self.create_notifications(100, 200, 300, 95, 91, 89, 1)
+
+        result = RetentionEngine.purge("notifications", now=self.now)
+        self.assertEqual((result["deleted"], result["batches"], result["completed"]), (5, 2, True))
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(RetentionEngine.purge("notifications", now=self.now)["deleted"], 0)
+
+    def test_retention_period_comes_from_settings(self):
+        self.create_notifications(100, 40, 1)
+        with with_settings(NOTIFICATION_RETENTION_DAYS=30):
+            self.assertEqual(RetentionEngine.purge("notifications", now=self.now)["deleted"], 2)
+
+    def test_exhausted_budget_stops_after_a_batch(self):
+        self.create_samples(*[400] * 7)
+        result = RetentionEngine.purge("concentration_levels", now=self.now, time_budget=-1)
+        self.assertEqual((result["deleted"], result["completed"]), (3, False))
+        self.assertEqual(RetentionEngine.purge("concentration_levels", now=self.now)["deleted"], 4)
+
+    def test_referenced_models_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RetentionEngine.get_model(RetentionPolicy("tickets.Ticket", "created_at", "ANALYTICS_RETENTION_DAYS", 365))
+
+
+@celery_app.task(name="core.tests.metrics_probe")
+def metrics_probe(size):
+    return "x" * size
+
+
+@celery_app.task(name="core.tests.failing_probe")
+def failing_probe():
+    raise ValueError("boom")
+
+
+class TaskMetricsTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = task_metrics.TaskMetricsRegistry()
+        patcher = mock.patch.object(task_metrics, "registry", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.delete_flushed)
+
+    def delete_flushed(self):
+        redis = TaskDebouncer.get_client()
+        for key in redis.keys(f"{task_metrics.KEY_PREFIX}:*"):
+            redis.delete(key)
+
+    def counters(self, queue, task_name):
+        return self.registry.snapshot()["tasks"][f"{queue}|{task_name}"]
+
+    def test_waits_are_bucketed(self):
+        for wait in (0.05, 0.1, 2, 400):
+            self.registry.started("analytics", "probe", wait)
+        self.registry.started("analytics", "probe", None)
+
+        counters = self.counters("analytics", "probe")
+        self.assertEqual(counters["waited"], 4)
+        self.assertEqual(
+            {metric: count for metric, count in counters.items() if metric.startswith("wait_le_")},
+            {"wait_le_0.1": 2, "wait_le_5": 1, "wait_le_inf": 1},
+        )
+        self.assertEqual(counters["wait_max"], 400)
+        self.assertEqual(self.registry.snapshot()["in_flight"], {"analytics": 5})
+        self.assertEqual(wait_percentile(counters, 0.5), 0.1)
+        self.assertEqual(wait_percentile(counters, 0.95), float("inf"))
+
+    def test_published_at_header_gives_the_wait(self):
+        headers = {}
+        task_metrics.stamp_published_at(headers=headers)
+        headers[task_metrics.PUBLISHED_AT_HEADER] -= 3
+
+        metrics_probe.push_request(delivery_info={"routing_key": "analytics"}, **headers)
+        try:
+            metrics_probe.before_start("id", (), {})
+            metrics_probe.on_success("x" * 10, "id", (), {})
+        finally:
+            metrics_probe.pop_request()
+
+        counters = self.counters("analytics", metrics_probe.name)
+        self.assertAlmostEqual(counters["wait_sum"], 3, delta=0.5)
+        self.assertEqual((counters["succeeded"], counters["result_bytes"]), (1, 12))
+
+    def test_runs_and_failures_are_recorded(self):
+        metrics_probe.apply((100,))
+        with self.assertLogs("core.task_metrics", "ERROR"):
+            failing_probe.apply()
+
+        queue = celery_app.conf.task_default_queue
+        self.assertEqual(self.counters(queue, metrics_probe.name)["succeeded"], 1)
+        self.assertEqual(self.counters(queue, metrics_probe.name)["result_bytes"], 102)
+        self.assertEqual(self.counters(queue, failing_probe.name)["failed"], 1)
+        self.assertEqual(self.registry.snapshot()["in_flight"], {queue: 0})
+
+    def test_command_reports_flushed_counters(self):
+        for wait, status in ((0.2, "succeeded"), (0.3, "succeeded"), (20, "failed")):
+            self.registry.started("analytics", "analytics.tasks.process_analytics_shard", wait)
+            self.registry.finished("analytics", "analytics.tasks.process_analytics_shard", 1.5, status)
+        self.registry.flush()
+        self.assertEqual(self.registry.snapshot()["tasks"], {})
+
+        out = io.StringIO()
+        call_command("task_metrics", minutes=2, stdout=out)
+        row = next(line for line in out.getvalue().splitlines() if "process_analytics_shard" in line).split()
+        self.assertEqual(row[:5], ["analytics", "analytics.tasks.process_analytics_shard", "3", "1", "0"])
+        self.assertEqual(row[6:8], ["<30s", "20.0s"])
+
+        out = io.StringIO()
+        call_command("task_metrics", minutes=2, queue="interactive", stdout=out)
+        self.assertIn("No task metrics recorded", out.getvalue())
+
+
+class StudyEnvironmentServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+
+    def record(self, *ratings, location="自宅", **levels):
+        for rating in ratings:
+            StudyEnvironmentService.record_environment(self.user, location, rating, **levels)
+
+    def analyze(self):
+        return StudyEnvironmentService.analyze_factors(self.user.id)
+
+    def test_levels_with_confidence_intervals(self):
+        self.record(5, 5, 4, lighting="bright")
+        self.record(2, 3, lighting="dim")
+        self.record(4, lighting="moderate", noise_level="loud")
+
+        result = self.analyze()
+        self.assertEqual((result["count"], result["mean_rating"]), (6, 3.83))
+        bright, moderate, dim = result["factors"]["lighting"]
+        self.assertEqual((bright["level"], bright["count"], bright["mean_rating"]), ("bright", 3, 4.67))
+        self.assertEqual(bright["effect"], round(14 / 3 - 23 / 6, 2))
+        margin = StudyEnvironmentService.CONFIDENCE_Z * statistics.stdev([5, 5, 4]) / 3**0.5
+        self.assertEqual((bright["ci_low"], bright["ci_high"]), (round(14 / 3 - margin, 2), round(14 / 3 + margin, 2)))
+        # A single record has no interval
+        self.assertEqual((moderate["level"], moderate["ci_low"], moderate["ci_high"]), ("moderate", None, None))
+        self.assertEqual((dim["level"], dim["mean_rating"]), ("dim", 2.5))
+        self.assertEqual([level["level"] for level in result["factors"]["noise_level"]], ["loud", "silent"])
+
+    def test_combinations_are_ranked_by_their_lower_bound(self):
+        self.record(5, location="図書館")
+        self.record(4, 4, 5, 4, location="自宅")
+        self.record(1, 5, location="カフェ")
+
+        combinations = self.analyze()["combinations"]
+        self.assertEqual([combination["levels"]["location"] for combination in combinations], ["自宅", "カフェ", "図書館"])
+        self.assertEqual(combinations[0]["levels"]["lighting"], "moderate")
+
+        cache.clear()
+        with with_settings(STUDY_ENVIRONMENT_COMBINATION_LIMIT=1):
+            self.assertEqual(len(self.analyze()["combinations"]), 1)
+
+    def test_analysis_is_cached_until_the_environments_change(self):
+        self.record(3)
+        self.assertEqual(self.analyze()["count"], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.analyze()["count"], 1)
+
+        self.record(5)
+        self.assertEqual(self.analyze()["mean_rating"], 4)
+
+    def test_no_environments(self):
+        self.assertEqual(self.analyze(), {"count": 0, "mean_rating": None, "factors": {}, "combinations": []})
+
+    def test_rating_is_validated(self):
+        with self.assertRaises(ValidationError):
+            StudyEnvironmentService.record_environment(self.user, "自宅", 6)
+
+
+class PeriodicSchedulingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_periodic_task_is_sent_once_per_lock_period(self):
+        with mock.patch("core.tasks.current_app") as app:
+            first = run_periodic("analytics.tasks.daily_analytics_processing", 3600, 300, {"queue": "analytics"})
+            second = run_periodic("analytics.tasks.daily_analytics_processing", 3600, 300, {"queue": "analytics"})
+
+        countdown = task_offset("analytics.tasks.daily_analytics_processing", 300)
+        self.assertEqual(first, {"task": "analytics.tasks.daily_analytics_processing", "countdown": countdown})
+        self.assertTrue(second["skipped"])
+        app.send_task.assert_called_once_with(
+            "analytics.tasks.daily_analytics_processing", countdown=countdown, queue="analytics"
+        )
+
+    def test_beat_entries_run_through_the_single_run_lock(self):
+        for name, entry in celery_app.conf.beat_schedule.items():
+            with self.subTest(entry=name):
+                self.assertEqual(entry["task"], "core.tasks.run_periodic")
+                task_name, lock_ttl, jitter, _ = entry["args"]
+                self.assertLess(task_offset(task_name, jitter), max(jitter, 1))
+                self.assertGreater(lock_ttl, jitter)
+
+    def test_users_are_spread_evenly_and_stably(self):
+        spreader = UserSlotSpreader(window=3600, slots=60, salt="reminders")
+        user_ids = [uuid.UUID(int=index * 7919 + 1) for index in range(6000)]
+        offsets = [spreader.offset(user_id) for user_id in user_ids]
+
+        self.assertTrue(all(0 <= offset < 3600 and offset % 60 == 0 for offset in offsets))
+        per_slot = np.bincount([offset // 60 for offset in offsets], minlength=60)
+        self.assertGreater(per_slot.min(), 50)
+        self.assertLess(per_slot.max(), 160)
+        self.assertEqual(offsets, [UserSlotSpreader(3600, 60, "reminders").offset(user_id) for user_id in user_ids])
+        self.assertNotEqual(offsets, [UserSlotSpreader(3600, 60, "recovery").offset(user_id) for user_id in user_ids])
+
+    def test_schedule_delays_each_user_by_its_offset(self):
+        spreader = UserSlotSpreader(window=600, salt="reminders")
+        task = mock.Mock()
+        user_ids = [uuid.uuid4() for _ in range(3)]
+
+        self.assertEqual(spreader.schedule(task, user_ids, args=("daily",), queue="notifications"), 3)
+        for call, user_id in zip(task.apply_async.call_args_list, user_ids):
+            self.assertEqual(
+                call.kwargs,
+                {
+                    "args": (str(user_id), "daily"),
+                    "kwargs": None,
+                    "countdown": spreader.offset(user_id),
+                    "queue": "notifications",
+                },
+            )
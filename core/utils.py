@@ -5,6 +5,7 @@ Common utilities for the intellectual partner application.
 import hashlib
 import random
 import string
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Tuple
 from django.utils import timezone
@@ -331,6 +332,37 @@ class CacheManager:
             pattern = CacheManager.get_cache_key("user", user_id, "*")
             cache.delete_many(cache.keys(pattern))
 
+    @staticmethod
+    def get_user_data_version(user_id: Any) -> int:
+        """
+        Get the data version of a user, creating one if missing.
+        The version only changes on writes, so it can back ETags without touching the DB.
+        """
+        cache_key = CacheManager.get_cache_key("data_version", user_id)
+        version = cache.get(cache_key)
+        if version is None:
+            # add() keeps a concurrently bumped version instead of overwriting it
+            cache.add(cache_key, time.time_ns(), timeout=None)
+            version = cache.get(cache_key)
+        return version
+
+    @staticmethod
+    def bump_user_data_version(user_id: Any) -> None:
+        """
+        Mark user data as changed.
+        Uses a nanosecond timestamp so a version evicted from cache is never reissued.
+        """
+        cache_key = CacheManager.get_cache_key("data_version", user_id)
+        cache.set(cache_key, time.time_ns(), timeout=None)
+
+    @staticmethod
+    def bump_user_data_versions(user_ids: List[Any]) -> None:
+        """Mark data of many users as changed (bulk writes skip post_save signals)."""
+        version = time.time_ns()
+        cache.set_many(
+            {CacheManager.get_cache_key("data_version", user_id): version for user_id in user_ids}, timeout=None
+        )
+
 
 class ValidationUtils:
     """
@@ -437,14 +469,35 @@ def get_time_of_day() -> str:
         return "late_night"
 
 
+def hour_of_week(value: datetime) -> int:
+    """Hour-of-week slot (0 = Monday 0:00 .. 167 = Sunday 23:00) in local time."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.weekday() * 24 + value.hour
+
+
 def calculate_next_study_time(
-    current_time: datetime, interval_minutes: int, user_preferences: Optional[Dict[str, Any]] = None
+    current_time: datetime,
+    interval_minutes: int,
+    user_preferences: Optional[Dict[str, Any]] = None,
+    preferred_slots: Optional[List[int]] = None,
 ) -> datetime:
     """
     Calculate next optimal study time based on interval and user preferences.
+    preferred_slots are hour-of-week slots (see hour_of_week), such as the ones predicted by
+    analytics.study_time.StudyTimePredictor; they take precedence over preferred_study_hours.
     """
     next_time = current_time + timedelta(minutes=interval_minutes)
 
+    if preferred_slots:
+        slots = set(preferred_slots)
+        start = hour_of_week(next_time)
+        for offset in range(168):
+            if (start + offset) % 168 in slots:
+                if offset:
+                    next_time = next_time.replace(minute=0, second=0, microsecond=0) + timedelta(hours=offset)
+                return next_time
+
     # If user preferences are provided, adjust for preferred study times
     if user_preferences and "preferred_study_hours" in user_preferences:
         preferred_hours = user_preferences["preferred_study_hours"]
@@ -1,3 +1,80 @@
+"""
+Emotions models for the intellectual partner application.
+"""
+
 from django.db import models
+from django.contrib.auth import get_user_model
+from django.core.validators import MinValueValidator, MaxValueValidator
+from core.models import EmotionChoices, UserRelatedModel
+
+User = get_user_model()
+
+
+class EmotionLog(UserRelatedModel):
+    """
+    Emotion recorded by a learner.
+    """
+
+    emotion = models.CharField(max_length=20, choices=EmotionChoices.choices, verbose_name="感情")
+    intensity = models.PositiveSmallIntegerField(
+        default=3, validators=[MinValueValidator(1), MaxValueValidator(5)], verbose_name="強さ"
+    )
+    note = models.TextField(blank=True, verbose_name="メモ")
+
+    class Meta:
+        verbose_name = "感情ログ"
+        verbose_name_plural = "感情ログ"
+        ordering = ["-created_at"]
+        indexes = [
+            # Watermark scan of emotions.services.EmotionAggregationService
+            models.Index(fields=["created_at", "id"], name="emotion_log_created_idx"),
+            models.Index(fields=["user", "created_at"], name="emotion_log_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.emotion} at {self.created_at}"
+
+
+class UserEmotionHourlyCount(models.Model):
+    """
+    Emotion counts per user and hour (UTC), maintained incrementally.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="emotion_hourly_counts")
+    hour = models.DateTimeField(verbose_name="時間帯")
+    emotion = models.CharField(max_length=20, choices=EmotionChoices.choices, verbose_name="感情")
+    count = models.PositiveIntegerField(default=0, verbose_name="件数")
+
+    class Meta:
+        verbose_name = "ユーザー別感情集計(時間)"
+        verbose_name_plural = "ユーザー別感情集計(時間)"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "hour", "emotion"], name="user_emotion_hourly_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.hour} {self.emotion}: {self.count}"
+
+
+class ClassEmotionHourlyCount(models.Model):
+    """
+    Emotion counts per class and hour (UTC), over students sharing their emotions with the teacher.
+    """
+
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name="class_emotion_hourly_counts")
+    class_name = models.CharField(max_length=100, blank=True, verbose_name="クラス名")
+    hour = models.DateTimeField(verbose_name="時間帯")
+    emotion = models.CharField(max_length=20, choices=EmotionChoices.choices, verbose_name="感情")
+    count = models.IntegerField(default=0, verbose_name="件数")
+
+    class Meta:
+        verbose_name = "クラス別感情集計(時間)"
+        verbose_name_plural = "クラス別感情集計(時間)"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["teacher", "class_name", "hour", "emotion"], name="class_emotion_hourly_unique"
+            ),
+        ]
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.teacher_id}/{self.class_name} - {self.hour} {self.emotion}: {self.count}"
@@ -0,0 +1,193 @@
+"""
+Emotion services.
+"""
+
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+from accounts.models import StudentTeacherRelation
+from core.models import AggregationWatermark
+from core.utils import CacheManager
+from .models import ClassEmotionHourlyCount, EmotionLog, UserEmotionHourlyCount
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmotionAggregationService:
+    """
+    Incremental hourly emotion counts per user and per class.
+
+    EmotionLog rows are scanned in (created_at, id) order from a persisted high-water mark,
+    so a run reads only rows inserted since the previous one. Rows whose transaction committed
+    after the previous run despite an older created_at are caught by re-scanning the last
+    EMOTION_AGGREGATION_OVERLAP_SECONDS before the mark. Hours touched by scanned rows are
+    recounted for the affected users only and written as absolute values, so re-scanned rows
+    are never counted twice; the per-user differences are then added to the class counts.
+    """
+
+    WATERMARK = "emotions.hourly_counts"
+    LOCK_KEY = CacheManager.get_cache_key("lock", "emotions", "hourly_counts")
+
+    @staticmethod
+    def get_setting(name: str, default: Any) -> Any:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @staticmethod
+    def hour_of(value: datetime) -> datetime:
+        return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def run(cls) -> Dict[str, Any]:
+        batch_size = cls.get_setting("EMOTION_AGGREGATION_BATCH_SIZE", 5000)
+        overlap = timedelta(seconds=cls.get_setting("EMOTION_AGGREGATION_OVERLAP_SECONDS", 300))
+        time_budget = cls.get_setting("EMOTION_AGGREGATION_TIME_BUDGET", 480)
+
+        # Runs must not interleave: class counts are updated with differences
+        if not cache.add(cls.LOCK_KEY, 1, timeout=time_budget + 120):
+            logger.info("Emotion aggregation already running, skipped")
+            return {"scanned": 0, "buckets": 0, "completed": True, "skipped": True}
+
+        try:
+            watermark, _ = AggregationWatermark.objects.get_or_create(name=cls.WATERMARK)
+            logs = EmotionLog.objects.order_by("created_at", "id")
+            batch = logs.filter(created_at__gte=watermark.position_at - overlap) if watermark.position_at else logs
+
+            started = time.monotonic()
+            scanned = buckets = 0
+            completed = True
+            advanced = False
+            while True:
+                rows = list(batch.values_list("created_at", "id", "user_id")[:batch_size])
+                if not rows:
+                    break
+
+                with transaction.atomic():
+                    buckets += cls.merge(rows)
+                    position_at, position_id = rows[-1][:2]
+                    if watermark.position_at is None or (position_at, str(position_id)) > (
+                        watermark.position_at,
+                        str(watermark.position_id),
+                    ):
+                        watermark.position_at, watermark.position_id = position_at, position_id
+                        watermark.save(update_fields=["position_at", "position_id", "updated_at"])
+                        advanced = True
+                scanned += len(rows)
+
+                if len(rows) < batch_size:
+                    break
+                # Batches re-scanning the overlap do not move the watermark: stopping before it
+                # advanced would let a resumed run re-read the same overlap forever
+                if advanced and time.monotonic() - started > time_budget:
+                    completed = False
+                    break
+                batch = logs.filter(Q(created_at__gt=position_at) | Q(created_at=position_at, id__gt=position_id))
+        finally:
+            cache.delete(cls.LOCK_KEY)
+
+        logger.info(f"Aggregated {scanned} emotion logs into {buckets} buckets (completed={completed})")
+        return {"scanned": scanned, "buckets": buckets, "completed": completed}
+
+    @classmethod
+    def merge(cls, rows: List[Tuple[datetime, Any, Any]]) -> int:
+        """Recount the (user, hour) buckets touched by rows; returns the number of changed counts."""
+        touched = {(user_id, cls.hour_of(created_at)) for created_at, _, user_id in rows}
+        user_ids = {user_id for user_id, _ in touched}
+        hours = {hour for _, hour in touched}
+
+        fresh: Dict[Tuple[Any, datetime, str], int] = {}
+        for row in (
+            EmotionLog.objects.filter(
+                user_id__in=user_ids,
+                created_at__gte=min(hours),
+                created_at__lt=max(hours) + timedelta(hours=1),
+                is_deleted=False,
+            )
+            .annotate(hour=TruncHour("created_at", tzinfo=dt_timezone.utc))
+            .order_by()
+            .values("user_id", "hour", "emotion")
+            .annotate(count=Count("id"))
+        ):
+            if (row["user_id"], row["hour"]) in touched:
+                fresh[(row["user_id"], row["hour"], row["emotion"])] = row["count"]
+
+        current = {
+            (count.user_id, count.hour, count.emotion): count.count
+            for count in UserEmotionHourlyCount.objects.filter(user_id__in=user_ids, hour__in=hours)
+            if (count.user_id, count.hour) in touched
+        }
+
+        deltas = {
+            key: fresh.get(key, 0) - current.get(key, 0)
+            for key in fresh.keys() | current.keys()
+            if fresh.get(key, 0) != current.get(key, 0)
+        }
+        if not deltas:
+            return 0
+
+        UserEmotionHourlyCount.objects.bulk_create(
+            [
+                UserEmotionHourlyCount(
+                    user_id=user_id, hour=hour, emotion=emotion, count=fresh.get((user_id, hour, emotion), 0)
+                )
+                for user_id, hour, emotion in deltas
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["user", "hour", "emotion"],
+            update_fields=["count"],
+        )
+        cls.merge_classes(deltas)
+        return len(deltas)
+
+    @staticmethod
+    def merge_classes(deltas: Dict[Tuple[Any, datetime, str], int]) -> None:
+        """Add per-user count differences to the classes the users share their emotions with."""
+        classes_by_student = defaultdict(set)
+        for student_id, teacher_id, class_name in (
+            StudentTeacherRelation.objects.filter(
+                student_id__in={user_id for user_id, _, _ in deltas},
+                is_active=True,
+                can_view_emotions=True,
+                is_deleted=False,
+            ).values_list("student_id", "teacher_id", "class_name")
+        ):
+            classes_by_student[student_id].add((teacher_id, class_name))
+
+        class_deltas: Dict[Tuple[Any, str, datetime, str], int] = defaultdict(int)
+        for (user_id, hour, emotion), delta in deltas.items():
+            for teacher_id, class_name in classes_by_student.get(user_id, ()):
+                class_deltas[(teacher_id, class_name, hour, emotion)] += delta
+        if not class_deltas:
+            return
+
+        current = {
+            (count.teacher_id, count.class_name, count.hour, count.emotion): count.count
+            for count in ClassEmotionHourlyCount.objects.filter(
+                teacher_id__in={key[0] for key in class_deltas},
+                hour__in={key[2] for key in class_deltas},
+            )
+        }
+        ClassEmotionHourlyCount.objects.bulk_create(
+            [
+                ClassEmotionHourlyCount(
+                    teacher_id=teacher_id,
+                    class_name=class_name,
+                    hour=hour,
+                    emotion=emotion,
+                    count=current.get((teacher_id, class_name, hour, emotion), 0) + delta,
+                )
+                for (teacher_id, class_name, hour, emotion), delta in class_deltas.items()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["teacher", "class_name", "hour", "emotion"],
+            update_fields=["count"],
+        )
@@ -0,0 +1,20 @@
+"""
+Celery tasks for emotions.
+"""
+
+from celery import shared_task
+from .services import EmotionAggregationService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Idempotent: a run redelivered after a lost worker recounts from the watermark
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def aggregation_emotion_data():
+    """Merge emotion logs recorded since the last run into the hourly counts (hourly beat job)."""
+    result = EmotionAggregationService.run()
+    if not result["completed"]:
+        # Time budget exhausted: continue from the watermark in a fresh task
+        aggregation_emotion_data.delay()
+    return result
@@ -1,3 +1,108 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import StudentTeacherRelation
+from core.models import AggregationWatermark
+
+from .models import ClassEmotionHourlyCount, EmotionLog, UserEmotionHourlyCount
+from .services import EmotionAggregationService
+
+User = get_user_model()
+
+
+def with_settings(**values):
+    return override_settings(INTELLECTUAL_PARTNER_SETTINGS={**settings.INTELLECTUAL_PARTNER_SETTINGS, **values})
+
+
+class EmotionAggregationServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hour = EmotionAggregationService.hour_of(timezone.now()) - timedelta(hours=3)
+        self.teacher = User.objects.create(username="teacher", email="teacher@example.com", is_teacher=True)
+        self.student = User.objects.create(username="student", email="student@example.com", is_student=True)
+        self.private = User.objects.create(username="private", email="private@example.com", is_student=True)
+        StudentTeacherRelation.objects.create(
+            teacher=self.teacher, student=self.student, class_name="1-A", can_view_emotions=True
+        )
+        StudentTeacherRelation.objects.create(teacher=self.teacher, student=self.private, class_name="1-A")
+
+    def log(self, user, emotion, minutes):
+        log = EmotionLog.objects.create(user=user, emotion=emotion)
+        EmotionLog.objects.filter(pk=log.pk).update(created_at=self.hour + timedelta(minutes=minutes))
+        return log
+
+    def user_counts(self, user):
+        return {
+            (count.hour - self.hour, count.emotion): count.count
+            for count in UserEmotionHourlyCount.objects.filter(user=user, count__gt=0)
+        }
+
+    def class_counts(self):
+        return {
+            (count.hour - self.hour, count.emotion): count.count
+            for count in ClassEmotionHourlyCount.objects.filter(teacher=self.teacher, class_name="1-A", count__gt=0)
+        }
+
+    def test_counts_per_user_and_shared_class(self):
+        self.log(self.student, "happy", 10)
+        self.log(self.student, "happy", 20)
+        self.log(self.student, "tired", 70)
+        self.log(self.private, "happy", 30)
+
+        self.assertEqual(EmotionAggregationService.run()["scanned"], 4)
+        expected = {(timedelta(0), "happy"): 2, (timedelta(hours=1), "tired"): 1}
+        self.assertEqual(self.user_counts(self.student), expected)
+        self.assertEqual(self.user_counts(self.private), {(timedelta(0), "happy"): 1})
+        # Only students sharing their emotions reach the class counts
+        self.assertEqual(self.class_counts(), expected)
+
+    def test_reruns_scan_only_new_rows(self):
+        self.log(self.student, "happy", 10)
+        self.log(self.student, "happy", 100)
+        EmotionAggregationService.run()
+
+        watermark = AggregationWatermark.objects.get(name=EmotionAggregationService.WATERMARK)
+        self.assertEqual(watermark.position_at, self.hour + timedelta(minutes=100))
+        # Only the overlap before the watermark is scanned again, and nothing changes
+        self.assertEqual(EmotionAggregationService.run(), {"scanned": 1, "buckets": 0, "completed": True})
+
+        self.log(self.student, "happy", 110)
+        self.assertEqual(EmotionAggregationService.run()["scanned"], 2)
+        self.assertEqual(self.class_counts(), {(timedelta(0), "happy"): 1, (timedelta(hours=1), "happy"): 2})
+
+    def test_late_committed_rows_within_the_overlap_are_counted_once(self):
+        self.log(self.student, "happy", 50)
+        EmotionAggregationService.run()
+
+        # Committed after the run, with a created_at before the watermark
+        self.log(self.student, "stressed", 47)
+        EmotionAggregationService.run()
+        EmotionAggregationService.run()
+
+        expected = {(timedelta(0), "happy"): 1, (timedelta(0), "stressed"): 1}
+        self.assertEqual(self.user_counts(self.student), expected)
+        self.assertEqual(self.class_counts(), expected)
+
+    def test_exhausted_budget_resumes_from_the_watermark(self):
+        for minutes in range(5):
+            self.log(self.student, "relaxed", minutes)
+        watermark = AggregationWatermark.objects.filter(name=EmotionAggregationService.WATERMARK)
+        with with_settings(EMOTION_AGGREGATION_BATCH_SIZE=2, EMOTION_AGGREGATION_TIME_BUDGET=-1):
+            self.assertEqual(EmotionAggregationService.run(), {"scanned": 2, "buckets": 1, "completed": False})
+            self.assertEqual(watermark.get().position_at, self.hour + timedelta(minutes=1))
+            # The overlap holds a full batch: the resumed run still moves past the watermark
+            self.assertEqual(EmotionAggregationService.run()["scanned"], 4)
+            self.assertEqual(watermark.get().position_at, self.hour + timedelta(minutes=3))
+            self.assertTrue(EmotionAggregationService.run()["completed"])
+        self.assertEqual(self.class_counts(), {(timedelta(0), "relaxed"): 5})
+
+    def test_concurrent_runs_are_skipped(self):
+        cache.add(EmotionAggregationService.LOCK_KEY, 1)
+        self.log(self.student, "happy", 10)
+        self.assertTrue(EmotionAggregationService.run()["skipped"])
+        self.assertFalse(UserEmotionHourlyCount.objects.exists())
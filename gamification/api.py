@@ -0,0 +1,27 @@
+"""
+Gamification API.
+"""
+
+from typing import List
+
+from ninja import Router
+from ninja.decorators import decorate_view
+from ninja.pagination import paginate
+from core.etags import user_etag
+from core.fieldsets import SparseFieldset
+from core.models import Achievement
+from core.pagination import CursorPagination
+from core.serializers import AchievementSchema
+
+router = Router(tags=["gamification"])
+
+achievement_fields = SparseFieldset(AchievementSchema)
+
+
+@router.get("/achievements", response=List[achievement_fields.schema], exclude_unset=True)
+@decorate_view(user_etag)
+@paginate(CursorPagination, ordering="-achieved_at")
+@achievement_fields.apply
+def list_achievements(request):
+    """Achievements of the authenticated user, newest first; ``?fields=`` selects the keys."""
+    return Achievement.objects.filter(user_id=request.auth.id, is_deleted=False)
@@ -1,3 +1,131 @@
-from django.test import TestCase
+from datetime import timedelta
+from uuid import UUID
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from ninja import NinjaAPI, Schema
+from ninja_jwt.tokens import AccessToken
+
+from accounts.authentication import CachedJWTAuth
+from core.fieldsets import SparseFieldset
+from core.models import Achievement
+from core.renderers import ORJSONParser, ORJSONRenderer
+from core.serializers import AchievementSchema
+
+from .api import router
+
+User = get_user_model()
+
+api = NinjaAPI(
+    auth=CachedJWTAuth(), renderer=ORJSONRenderer(), parser=ORJSONParser(), urls_namespace="gamification-tests"
+)
+api.add_router("/gamification", router)
+urlpatterns = [path("api/", api.urls)]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AchievementListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+        other = User.objects.create(username="other", email="other@example.com")
+        now = timezone.now()
+        # Three achievements share a timestamp, so pages split inside the tie
+        for index, achieved_at in enumerate([now, now, now, now - timedelta(hours=1), now - timedelta(days=1)]):
+            achievement = Achievement.objects.create(
+                user=self.user, title=f"達成{index}", description="", type="streak"
+            )
+            Achievement.objects.filter(pk=achievement.pk).update(achieved_at=achieved_at)
+        Achievement.objects.create(user=other, title="他人", description="", type="streak")
+        deleted = Achievement.objects.create(user=self.user, title="削除済み", description="", type="streak")
+        deleted.delete()
+        self.expected = [
+            str(pk)
+            for pk in Achievement.objects.filter(user=self.user, is_deleted=False)
+            .order_by("-achieved_at", "-pk")
+            .values_list("pk", flat=True)
+        ]
+
+    def get(self, **params):
+        return self.client.get(
+            "/api/gamification/achievements",
+            params,
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+        )
+
+    def test_pages_walk_every_achievement_once(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = self.get(**params).json()
+            seen.extend(item["id"] for item in page["items"])
+            self.assertIsNone(page["count"])
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(pages, 3)
+
+    def test_count_is_opt_in(self):
+        page = self.get(limit=10, with_count=True).json()
+        self.assertEqual(page["count"], 5)
+        self.assertEqual(len(page["items"]), 5)
+        self.assertIsNone(page["next_cursor"])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.get(cursor="not-a-cursor").status_code, 400)
+
+
+class AchievementWithLabelSchema(Schema):
+    id: UUID
+    label: str
+
+    @staticmethod
+    def resolve_label(obj):
+        return f"{obj.title} ({obj.points})"
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AchievementFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+        for index in range(3):
+            Achievement.objects.create(user=self.user, title=f"達成{index}", description="長い説明", type="streak")
+
+    def get(self, **params):
+        return self.client.get(
+            "/api/gamification/achievements",
+            params,
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"},
+        )
+
+    def test_only_requested_fields_are_returned(self):
+        items = self.get(fields="id,title").json()["items"]
+        self.assertEqual(len(items), 3)
+        self.assertTrue(all(set(item) == {"id", "title"} for item in items))
+        self.assertEqual(set(self.get().json()["items"][0]), set(AchievementSchema.model_fields))
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.get(fields="id,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["detail"])
+
+    def test_projection_is_pushed_into_the_query(self):
+        fieldset = SparseFieldset(AchievementSchema)
+        queryset = fieldset.project(Achievement.objects.filter(user=self.user), {"id", "title"})
+        self.assertNotIn("description", str(queryset.query))
+
+    def test_computed_fields_do_not_defer_their_columns(self):
+        queryset = Achievement.objects.filter(user=self.user)
+        for fieldset in (
+            SparseFieldset(AchievementWithLabelSchema),
+            SparseFieldset(AchievementWithLabelSchema, sources={"label": ["title", "points"]}),
+        ):
+            with self.subTest(sources=fieldset.sources), self.assertNumQueries(1):
+                labels = [
+                    AchievementWithLabelSchema.from_orm(achievement).label
+                    for achievement in fieldset.project(queryset, {"id", "label"})
+                ]
+                self.assertEqual(len(labels), 3)
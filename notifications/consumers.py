@@ -0,0 +1,34 @@
+"""
+WebSocket consumers for notifications.
+"""
+
+from core.consumers import BaseJsonConsumer
+from .services import NotificationFanoutService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationsConsumer(BaseJsonConsumer):
+    """
+    Per-user notifications socket.
+    Frames are produced by notifications.services.NotificationFanoutService.
+    """
+
+    async def connect(self):
+        user_id = self.scope["url_route"]["kwargs"].get("user_id", "")
+        if not self.is_owner(user_id):
+            await self.close()
+            return
+
+        self.group_name = NotificationFanoutService.group_name(user_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notification_batch(self, event):
+        """Coalesced notifications for this user, sent as one frame."""
+        await self.send_json({"type": "notifications", "notifications": event["notifications"]})
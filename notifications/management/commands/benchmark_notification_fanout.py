@@ -0,0 +1,106 @@
+"""
+Benchmark for notification fan-out on the in-memory channel layer.
+
+Compares the naive path (one create_notification_payload + awaited group_send per
+notification) with NotificationFanoutService (coalesced frames per user, concurrent
+group_send). Persistence is left out unless --persist is passed, so the benchmark
+runs without a database.
+
+Usage:
+    python manage.py benchmark_notification_fanout --users 5000 --per-user 3
+"""
+
+import asyncio
+import time
+import uuid
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.utils import NotificationHelper
+from notifications.models import Notification
+from notifications.services import NotificationFanoutService
+
+
+class Command(BaseCommand):
+    help = "Benchmark batched notification fan-out against one-at-a-time delivery"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5000, help="Number of recipients")
+        parser.add_argument("--per-user", type=int, default=3, help="Pending notifications per recipient")
+        parser.add_argument(
+            "--persist", action="store_true", help="Also time bulk_create persistence on the configured database"
+        )
+
+    def handle(self, *args, **options):
+        user_ids = [uuid.uuid4() for _ in range(options["users"])]
+        per_user = options["per_user"]
+
+        naive = asyncio.run(self.run_naive(user_ids, per_user))
+        batched = asyncio.run(self.run_batched(user_ids, per_user))
+
+        for label, result in (("one at a time", naive), ("batched fan-out", batched)):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(f"  elapsed        {result['seconds'] * 1000:>10.1f} ms")
+            self.stdout.write(f"  group_send     {result['sends']:>10}")
+            self.stdout.write(f"  frames recv'd  {result['received']:>10}")
+        self.stdout.write(self.style.SUCCESS(f"speedup x{naive['seconds'] / batched['seconds']:.1f}"))
+
+        if options["persist"]:
+            started = time.perf_counter()
+            for _ in range(per_user):
+                NotificationFanoutService.fan_out(user_ids, "お知らせ", "ベンチマーク", deliver=False)
+            self.stdout.write(f"bulk_create persistence: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    async def subscribe(self, channel_layer, user_ids):
+        channels = []
+        for user_id in user_ids:
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add(NotificationFanoutService.group_name(user_id), channel)
+            channels.append(channel)
+        return channels
+
+    async def drain(self, channel_layer, channels):
+        received = 0
+        for channel in channels:
+            queue = channel_layer.channels.get(channel)
+            while queue is not None and not queue.empty():
+                await channel_layer.receive(channel)
+                received += 1
+        return received
+
+    async def run_naive(self, user_ids, per_user):
+        channel_layer = InMemoryChannelLayer(capacity=per_user + 1)
+        channels = await self.subscribe(channel_layer, user_ids)
+
+        started = time.perf_counter()
+        sends = 0
+        for user_id in user_ids:
+            for i in range(per_user):
+                payload = NotificationHelper.create_notification_payload(str(user_id), "お知らせ", f"メッセージ {i}")
+                await channel_layer.group_send(
+                    NotificationFanoutService.group_name(user_id), {"type": "notification.message", **payload}
+                )
+                sends += 1
+        seconds = time.perf_counter() - started
+
+        return {"seconds": seconds, "sends": sends, "received": await self.drain(channel_layer, channels)}
+
+    async def run_batched(self, user_ids, per_user):
+        channel_layer = InMemoryChannelLayer(capacity=per_user + 1)
+        channels = await self.subscribe(channel_layer, user_ids)
+
+        now = timezone.now()
+        pending = [
+            Notification(id=uuid.uuid4(), user_id=user_id, title="お知らせ", message=f"メッセージ {i}", created_at=now)
+            for user_id in user_ids
+            for i in range(per_user)
+        ]
+
+        started = time.perf_counter()
+        frames = NotificationFanoutService.build_frames(pending)
+        await NotificationFanoutService.send_frames(frames, channel_layer=channel_layer)
+        seconds = time.perf_counter() - started
+
+        return {"seconds": seconds, "sends": len(frames), "received": await self.drain(channel_layer, channels)}
@@ -1,3 +1,53 @@
+"""
+Notifications models for the intellectual partner application.
+"""
+
 from django.db import models
+from core.models import UserRelatedModel
+
+
+class Notification(UserRelatedModel):
+    """
+    Notification delivered to a user through the notifications WebSocket.
+    """
+
+    title = models.CharField(max_length=200, verbose_name="タイトル")
+    message = models.TextField(verbose_name="本文")
+    type = models.CharField(max_length=50, default="info", verbose_name="通知タイプ")
+    data = models.JSONField(default=dict, blank=True, verbose_name="付加データ")
+    is_read = models.BooleanField(default=False, verbose_name="既読フラグ")
+    read_at = models.DateTimeField(null=True, blank=True, verbose_name="既読日時")
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="配信日時")
+    # 配信処理中の予約期限 (NotificationFanoutService.flush_pending). 期限切れの未配信通知は再送される
+    # 分散配信する通知は作成時に配信枠の時刻を設定し, それまで保留する
+    delivery_claimed_until = models.DateTimeField(null=True, blank=True, verbose_name="配信予約期限")
+
+    class Meta:
+        verbose_name = "通知"
+        verbose_name_plural = "通知"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="notification_user_feed_idx"),
+            # Oldest-first retention purge (core.retention.RetentionEngine)
+            models.Index(fields=["created_at"], name="notification_created_idx"),
+            # Pending deliveries picked up by NotificationFanoutService.flush_pending
+            models.Index(
+                fields=["created_at"],
+                name="notification_undelivered_idx",
+                condition=models.Q(delivered_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.title}"
 
-# Create your models here.
+    def to_payload(self):
+        """WebSocket payload for this notification."""
+        return {
+            "id": str(self.id),
+            "title": self.title,
+            "message": self.message,
+            "type": self.type,
+            "data": self.data,
+            "timestamp": self.created_at.isoformat(),
+        }
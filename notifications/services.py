@@ -0,0 +1,174 @@
+"""
+Notification delivery services.
+"""
+
+import asyncio
+import uuid
+from datetime import timedelta
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from core.utils import CacheManager
+from .models import Notification
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationFanoutService:
+    """
+    Batched notification fan-out.
+
+    Notifications are persisted with bulk_create in batches of NOTIFICATION_BATCH_SIZE
+    and delivered by flush_pending(): every pending notification of a user is coalesced
+    into a single WebSocket frame, and frames are sent with concurrent group_send calls
+    instead of one awaited round trip per recipient.
+    """
+
+    # Maximum group_send calls in flight at once
+    SEND_CONCURRENCY = 100
+    # Claimed notifications are left to other flushers for this long (seconds)
+    CLAIM_SECONDS = 60
+
+    @staticmethod
+    def get_batch_size() -> int:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS["NOTIFICATION_BATCH_SIZE"]
+
+    @staticmethod
+    def group_name(user_id: Any) -> str:
+        """Channel-layer group of a user's notification sockets."""
+        return f"notifications_{uuid.UUID(str(user_id)).hex}"
+
+    @classmethod
+    def fan_out(
+        cls,
+        user_ids: Iterable[Any],
+        title: str,
+        message: str,
+        type: str = "info",
+        data: Optional[Dict[str, Any]] = None,
+        deliver: bool = True,
+    ) -> int:
+        """
+        Persist the same notification for many users and deliver it.
+        Returns the number of notifications created.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        batch_size = cls.get_batch_size()
+        data = data or {}
+
+        for start in range(0, len(user_ids), batch_size):
+            Notification.objects.bulk_create(
+                [
+                    Notification(user_id=user_id, title=title, message=message, type=type, data=data)
+                    for user_id in user_ids[start : start + batch_size]
+                ],
+                batch_size=batch_size,
+            )
+
+        # bulk_create skips post_save, so conditional GET versions are bumped here (after the commit)
+        transaction.on_commit(partial(CacheManager.bump_user_data_versions, user_ids))
+        logger.info(f"Created notification '{title}' for {len(user_ids)} users")
+
+        if deliver:
+            cls.flush_pending()
+        return len(user_ids)
+
+    @classmethod
+    def create_batch(cls, notifications: List[Notification]) -> int:
+        """
+        Persist per-user notifications in batches without delivering them.
+        Delivery is left to flush_pending, so callers creating many batches send one frame per user.
+        """
+        if not notifications:
+            return 0
+        Notification.objects.bulk_create(notifications, batch_size=cls.get_batch_size())
+        user_ids = {notification.user_id for notification in notifications}
+        transaction.on_commit(partial(CacheManager.bump_user_data_versions, user_ids))
+        return len(notifications)
+
+    @classmethod
+    def claim_pending(cls, limit: int) -> List[Notification]:
+        """
+        Claim up to limit pending notifications for CLAIM_SECONDS and commit the claim.
+        Rows are picked with SKIP LOCKED, so concurrent flushers never claim the same row.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            pending = list(
+                Notification.objects.select_for_update(skip_locked=True)
+                .filter(delivered_at__isnull=True)
+                .filter(Q(delivery_claimed_until__isnull=True) | Q(delivery_claimed_until__lt=now))
+                .order_by("created_at")
+                .only("id", "user_id", "title", "message", "type", "data", "created_at")[:limit]
+            )
+            Notification.objects.filter(id__in=[n.id for n in pending]).update(
+                delivery_claimed_until=now + timedelta(seconds=cls.CLAIM_SECONDS)
+            )
+        return pending
+
+    @classmethod
+    def flush_pending(cls, limit: Optional[int] = None) -> int:
+        """
+        Deliver pending notifications, one coalesced frame per user.
+        Rows are claimed in a short transaction and sent after it commits, so no lock is
+        held during the sends. Only notifications of delivered frames are marked delivered:
+        the others stay pending and are retried once their claim expires (CLAIM_SECONDS),
+        as are notifications claimed by a flusher that died mid-send.
+        Returns the number of frames sent.
+        """
+        batch_size = cls.get_batch_size()
+        frames_sent = 0
+
+        while limit is None or frames_sent < limit:
+            pending = cls.claim_pending(batch_size * 10)
+            if not pending:
+                break
+
+            frames = cls.build_frames(pending)
+            failed = async_to_sync(cls.send_frames)(frames)
+            Notification.objects.filter(
+                id__in=[n.id for n in pending if cls.group_name(n.user_id) not in failed]
+            ).update(delivered_at=timezone.now(), delivery_claimed_until=None)
+            frames_sent += len(frames) - len(failed)
+
+        return frames_sent
+
+    @classmethod
+    def build_frames(cls, notifications: Iterable[Notification]) -> Dict[str, Dict[str, Any]]:
+        """Group notifications by recipient group, one frame per group."""
+        frames: Dict[str, Dict[str, Any]] = {}
+        for notification in notifications:
+            group = cls.group_name(notification.user_id)
+            frame = frames.get(group)
+            if frame is None:
+                frame = frames[group] = {"type": "notification.batch", "notifications": []}
+            frame["notifications"].append(notification.to_payload())
+        return frames
+
+    @classmethod
+    async def send_frames(cls, frames: Dict[str, Dict[str, Any]], channel_layer: Any = None) -> Set[str]:
+        """
+        Send frames with bounded concurrency so round trips to the layer overlap.
+        Returns the groups whose frame could not be sent.
+        """
+        channel_layer = channel_layer or get_channel_layer()
+        semaphore = asyncio.Semaphore(cls.SEND_CONCURRENCY)
+
+        async def send(group: str, frame: Dict[str, Any]) -> None:
+            async with semaphore:
+                await channel_layer.group_send(group, frame)
+
+        results = await asyncio.gather(*(send(group, frame) for group, frame in frames.items()), return_exceptions=True)
+        failures = {group: result for group, result in zip(frames, results) if isinstance(result, Exception)}
+        if failures:
+            # Persisted notifications remain readable through the API
+            error = next(iter(failures.values()))
+            logger.warning(f"Failed to deliver {len(failures)}/{len(frames)} notification frames: {error}")
+        return set(failures)
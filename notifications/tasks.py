@@ -0,0 +1,31 @@
+"""
+Celery tasks for notifications.
+"""
+
+from celery import shared_task
+from core.retention import RetentionEngine
+from .services import NotificationFanoutService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def fan_out_notification(user_ids, title, message, type="info", data=None):
+    """Persist and deliver one notification to many users (class/school announcements)."""
+    return NotificationFanoutService.fan_out(user_ids, title, message, type=type, data=data)
+
+
+@shared_task
+def flush_pending_notifications():
+    """Deliver pending notifications, coalesced per user."""
+    return NotificationFanoutService.flush_pending()
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def cleanup_old_notifications():
+    """Purge notifications older than NOTIFICATION_RETENTION_DAYS in batches (daily beat job)."""
+    result = RetentionEngine.purge("notifications")
+    if not result["completed"]:
+        cleanup_old_notifications.delay()
+    return result
@@ -1,3 +1,79 @@
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from .models import Notification
+from .services import NotificationFanoutService
+
+User = get_user_model()
+
+
+class RecordingChannelLayer:
+    """Channel layer recording group_send calls, failing for the given groups."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+        self.claimable_during_send = []
+
+    async def group_send(self, group, message):
+        # Rows being sent are claimed and committed: another flusher cannot take them
+        self.claimable_during_send.append(len(await sync_to_async(NotificationFanoutService.claim_pending)(100)))
+        if group in self.failing:
+            raise ConnectionError("layer unavailable")
+        self.sent.append((group, message))
+
+
+class NotificationFanoutServiceTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(username=f"user{index}", email=f"user{index}@example.com") for index in range(3)
+        ]
+        for user in self.users:
+            Notification.objects.create(user=user, title="お知らせ", message="1")
+            Notification.objects.create(user=user, title="お知らせ", message="2")
+
+    def flush(self, layer):
+        with mock.patch("notifications.services.get_channel_layer", return_value=layer):
+            return NotificationFanoutService.flush_pending()
+
+    def test_one_frame_per_user(self):
+        layer = RecordingChannelLayer()
+        self.assertEqual(self.flush(layer), 3)
+
+        self.assertEqual(len(layer.sent), 3)
+        for _, frame in layer.sent:
+            self.assertEqual(frame["type"], "notification.batch")
+            self.assertEqual(sorted(payload["message"] for payload in frame["notifications"]), ["1", "2"])
+        self.assertEqual(layer.claimable_during_send, [0, 0, 0])
+        self.assertFalse(Notification.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_failed_frames_stay_pending_until_the_claim_expires(self):
+        failing_user = self.users[0]
+        layer = RecordingChannelLayer(failing={NotificationFanoutService.group_name(failing_user.id)})
+        self.assertEqual(self.flush(layer), 2)
+
+        pending = Notification.objects.filter(delivered_at__isnull=True)
+        self.assertEqual({notification.user_id for notification in pending}, {failing_user.id})
+        # Still claimed: an immediate flush does not resend
+        self.assertEqual(self.flush(RecordingChannelLayer()), 0)
+
+        pending.update(delivery_claimed_until=timezone.now() - timedelta(seconds=1))
+        layer = RecordingChannelLayer()
+        self.assertEqual(self.flush(layer), 1)
+        self.assertEqual(layer.sent[0][0], NotificationFanoutService.group_name(failing_user.id))
+        self.assertFalse(Notification.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_fan_out_persists_and_delivers(self):
+        Notification.objects.update(delivered_at=timezone.now())
+        layer = RecordingChannelLayer()
+        with mock.patch("notifications.services.get_channel_layer", return_value=layer):
+            created = NotificationFanoutService.fan_out([user.id for user in self.users] * 2, "告知", "全員へ")
 
-# Create your tests here.
+        self.assertEqual(created, 3)
+        self.assertEqual(len(layer.sent), 3)
+        self.assertEqual(Notification.objects.filter(title="告知", delivered_at__isnull=False).count(), 3)
@@ -0,0 +1,98 @@
+"""
+Teacher support API.
+"""
+
+from datetime import date
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from django.http import StreamingHttpResponse
+from ninja import Router, Schema
+from ninja.errors import HttpError
+from analytics.patterns import EmotionPatternService
+from .models import WeeklyReport
+from .percentiles import METRICS, ClassPercentileService
+from .reports import WeeklyReportService
+
+router = Router(tags=["teacher"])
+
+
+class WeeklyReportSchema(Schema):
+    id: str
+    week_start: date
+    student_count: int
+    class_count: int
+    artifact_size: int
+
+
+def get_teacher(request):
+    if not request.auth.is_teacher:
+        raise HttpError(403, "教師のみ利用できます")
+    return request.auth
+
+
+@router.get("/reports/weekly", response=List[WeeklyReportSchema])
+def list_weekly_reports(request):
+    teacher = get_teacher(request)
+    return [
+        {
+            "id": str(report["id"]),
+            "week_start": report["week_start"],
+            "student_count": report["student_count"],
+            "class_count": report["class_count"],
+            "artifact_size": report["artifact_size"],
+        }
+        for report in WeeklyReport.objects.filter(teacher_id=teacher.id, is_deleted=False).values(
+            "id", "week_start", "student_count", "class_count", "artifact_size"
+        )[:52]
+    ]
+
+
+@router.get("/reports/weekly/{week_start}/export")
+def export_weekly_report(request, week_start: date, format: str = "csv"):
+    """Stream a weekly report as CSV or JSON lines."""
+    teacher = get_teacher(request)
+    if format not in ("csv", "jsonl"):
+        raise HttpError(400, "format は csv または jsonl を指定してください")
+
+    report = WeeklyReport.objects.filter(teacher_id=teacher.id, week_start=week_start, is_deleted=False).first()
+    if report is None:
+        raise HttpError(404, "レポートが見つかりません")
+
+    if format == "csv":
+        response = StreamingHttpResponse(WeeklyReportService.iter_csv(report), content_type="text/csv; charset=utf-8")
+    else:
+        response = StreamingHttpResponse(WeeklyReportService.iter_jsonl(report), content_type="application/x-ndjson")
+    response["Content-Disposition"] = f'attachment; filename="weekly-report-{week_start.isoformat()}.{format}"'
+    return response
+
+
+@router.get("/students/{student_id}/emotion-patterns", response=Dict[str, Any])
+def student_emotion_patterns(request, student_id: UUID):
+    """Emotion × concentration × completion correlations of a student whose emotions the teacher may see."""
+    teacher = get_teacher(request)
+    allowed = (
+        WeeklyReportService.active_relations()
+        .filter(teacher_id=teacher.id, student_id=student_id, can_view_emotions=True)
+        .exists()
+    )
+    if not allowed:
+        raise HttpError(404, "生徒が見つかりません")
+    return EmotionPatternService.get_summary(student_id)
+
+
+@router.get("/classes/{class_name}/distribution", response=Dict[str, Any])
+def class_distribution(
+    request, class_name: str, metric: str = "study_minutes", days: int = 7, student_id: Optional[UUID] = None
+):
+    """Percentiles of a class metric over the last days, and where a student stands in it."""
+    teacher = get_teacher(request)
+    if metric not in METRICS:
+        raise HttpError(400, f"metric は {', '.join(METRICS)} のいずれかを指定してください")
+
+    relations = ClassPercentileService.progress_relations().filter(teacher_id=teacher.id, class_name=class_name)
+    if student_id is not None:
+        relations = relations.filter(student_id=student_id)
+    if not relations.exists():
+        raise HttpError(404, "クラスまたは生徒が見つかりません")
+    return ClassPercentileService.class_distribution(teacher.id, class_name, metric, max(1, min(days, 90)), student_id)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class TeacherSupportConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "teacher_support"
+
+    def ready(self):
+        """
+        Called when the application is ready.
+        Register any signals here.
+        """
+        import teacher_support.signals
@@ -0,0 +1,37 @@
+"""
+WebSocket consumers for teacher support.
+"""
+
+from asgiref.sync import sync_to_async
+from core.consumers import BaseJsonConsumer
+from .services import TeacherDashboardService
+
+
+class TeacherDashboardConsumer(BaseJsonConsumer):
+    """
+    Live class dashboard of a teacher.
+    Sends the materialized state (teacher_support.services.TeacherDashboardService) on
+    connect, then only the aggregates and student rows changed by each student event.
+    """
+
+    async def connect(self):
+        teacher_id = self.scope["url_route"]["kwargs"].get("teacher_id", "")
+        if not self.is_owner(teacher_id) or not self.scope["user"].is_teacher:
+            await self.close()
+            return
+
+        # Join before reading the snapshot: deltas carry absolute values, so an event
+        # already included in the snapshot is simply applied twice with the same result
+        self.group_name = TeacherDashboardService.group_name(teacher_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        snapshot = await sync_to_async(TeacherDashboardService.snapshot)(teacher_id)
+        await self.send_json({"type": "dashboard.snapshot", **snapshot})
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def dashboard_delta(self, event):
+        await self.send_json(event)
@@ -1,3 +1,94 @@
+"""
+Teacher support models for the intellectual partner application.
+"""
+
 from django.db import models
+from django.contrib.auth import get_user_model
+from core.models import BaseModel, TimeStampedModel, UserRelatedModel
+
+User = get_user_model()
+
+
+class StudentWeeklyAggregate(UserRelatedModel):
+    """
+    Weekly aggregates of a student, computed once per week and shared by all of the student's teachers.
+    """
+
+    week_start = models.DateField(verbose_name="週の開始日")
+    study_minutes = models.PositiveIntegerField(default=0, verbose_name="学習時間(分)")
+    session_count = models.PositiveIntegerField(default=0, verbose_name="セッション数")
+    active_days = models.PositiveSmallIntegerField(default=0, verbose_name="学習日数")
+    concentration_average = models.FloatField(null=True, blank=True, verbose_name="平均集中度")
+    concentration_samples = models.PositiveIntegerField(default=0, verbose_name="集中度記録数")
+    tickets_completed = models.PositiveIntegerField(default=0, verbose_name="完了チケット数")
+    emotion_counts = models.JSONField(default=dict, blank=True, verbose_name="感情の記録数")
+    # analytics.patterns.EmotionPatternService.summary() at computation time
+    emotion_patterns = models.JSONField(default=dict, blank=True, verbose_name="感情パターン")
+
+    class Meta:
+        verbose_name = "生徒週次集計"
+        verbose_name_plural = "生徒週次集計"
+        ordering = ["-week_start"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "week_start"], name="student_weekly_aggregate_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.week_start}"
+
+
+class WeeklyReport(BaseModel):
+    """
+    Weekly report of a teacher.
+    The artifact is zlib-compressed JSON lines: one object per student and class
+    (teacher_support.reports.WeeklyReportService).
+    """
+
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name="weekly_reports", verbose_name="教師")
+    week_start = models.DateField(verbose_name="週の開始日")
+    student_count = models.PositiveIntegerField(default=0, verbose_name="生徒数")
+    class_count = models.PositiveIntegerField(default=0, verbose_name="クラス数")
+    artifact = models.BinaryField(verbose_name="レポートデータ")
+    artifact_size = models.PositiveIntegerField(default=0, verbose_name="展開後サイズ(バイト)")
+
+    class Meta:
+        verbose_name = "週次レポート"
+        verbose_name_plural = "週次レポート"
+        ordering = ["-week_start"]
+        constraints = [
+            models.UniqueConstraint(fields=["teacher", "week_start"], name="weekly_report_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.teacher_id} - {self.week_start}"
+
+
+class ClassMetricSketch(TimeStampedModel):
+    """
+    Quantile sketch (core.sketches.KLLSketch) of one metric of a class for one day,
+    maintained by teacher_support.percentiles.ClassPercentileService.
+    """
+
+    teacher = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="class_metric_sketches", verbose_name="教師"
+    )
+    class_name = models.CharField(max_length=100, blank=True, verbose_name="クラス名")
+    metric = models.CharField(max_length=30, verbose_name="指標")
+    date = models.DateField(verbose_name="日付")
+    sketch = models.BinaryField(verbose_name="スケッチ")
+    item_count = models.PositiveIntegerField(default=0, verbose_name="データ数")
+
+    class Meta:
+        verbose_name = "クラス指標分布"
+        verbose_name_plural = "クラス指標分布"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["teacher", "class_name", "metric", "date"], name="class_metric_sketch_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["metric", "date"], name="class_metric_sketch_date_idx"),
+        ]
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.teacher_id} {self.class_name} {self.metric} {self.date} ({self.item_count})"
@@ -0,0 +1,247 @@
+"""
+Class-level percentile distributions.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+from accounts.models import StudentTeacherRelation
+from analytics.models import DailyUserAnalytics
+from core.models import ConcentrationLevel, StatusChoices
+from core.sketches import KLLSketch, rank_error_bound
+from tickets.models import Ticket
+from .models import ClassMetricSketch
+from .services import DashboardKeys, TeacherDashboardService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Built by build_daily() for the previous day
+METRICS = ("study_minutes", "concentration", "completion_rate")
+# Also recorded live for today, merged in at read time
+LIVE_METRICS = ("concentration",)
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+ClassKey = Tuple[Any, str]
+
+
+class ClassPercentileService:
+    """
+    Per class, metric and day quantile sketches: where a student stands in the class.
+
+    - study_minutes: one item per student and day (0 for members who did not study);
+    - concentration: one item per student and day with samples, their average level that day,
+      so students who record often weigh as much as the others;
+    - completion_rate: one item per student with tickets, completed / assigned tickets at the end of the day.
+
+    The sketches of past days are rebuilt from the daily analytics by build_daily(), which
+    overwrites the day's sketches and can be re-run. Today's concentration is recorded live:
+    TeacherDashboardService.record_concentration() keeps every student's running sum and count
+    of the day per class, and distribution() sketches those averages at read time (one hash per
+    class) and merges them with the stored days. distribution() merges the sketches of any set
+    of classes and days (a class over a week, a school, several schools); a lookup reads one
+    small row per class and day, whatever the number of students and events. Percentiles are
+    within core.sketches.rank_error_bound() of the exact ones. Like the dashboard, only
+    relations with can_view_progress contribute.
+    """
+
+    STUDENT_CHUNK_SIZE = 1000
+
+    @staticmethod
+    def progress_relations():
+        return StudentTeacherRelation.objects.filter(is_active=True, is_deleted=False, can_view_progress=True)
+
+    @classmethod
+    def completion_rates(cls, student_ids: Set[Any], day: date) -> Dict[Any, float]:
+        """
+        Completed / assigned tickets of every student with tickets, at the end of the day.
+        Tickets keep no status history: like the weekly reports, a completed ticket counts
+        as completed from its last update, so one edited after completion counts later.
+        """
+        until = timezone.make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+        completed_filter = Q(status=StatusChoices.COMPLETED, updated_at__lt=until)
+        rates = {}
+        student_ids = list(student_ids)
+        for start in range(0, len(student_ids), cls.STUDENT_CHUNK_SIZE):
+            chunk = student_ids[start : start + cls.STUDENT_CHUNK_SIZE]
+            for assignee_id, total, completed in (
+                Ticket.objects.filter(assignee_id__in=chunk, is_deleted=False, created_at__lt=until)
+                .order_by()
+                .values("assignee_id")
+                .annotate(total=Count("id"), completed=Count("id", filter=completed_filter))
+                .values_list("assignee_id", "total", "completed")
+            ):
+                rates[assignee_id] = completed / total
+        return rates
+
+    @classmethod
+    def build_daily(cls, day: date) -> int:
+        """Rebuild the day's sketches of every class. Returns the sketch count."""
+        members: Dict[ClassKey, Set[Any]] = defaultdict(set)
+        for teacher_id, class_name, student_id in cls.progress_relations().values_list(
+            "teacher_id", "class_name", "student_id"
+        ):
+            members[(teacher_id, class_name)].add(student_id)
+        student_ids = set().union(*members.values()) if members else set()
+
+        minutes = {}
+        concentrations = {}
+        for user_id, study_minutes, concentration_average in DailyUserAnalytics.objects.filter(
+            date=day, is_deleted=False
+        ).values_list("user_id", "study_minutes", "concentration_average"):
+            minutes[user_id] = study_minutes
+            if concentration_average is not None:
+                concentrations[user_id] = concentration_average
+        rates = cls.completion_rates(student_ids, day)
+
+        rows = []
+        for (teacher_id, class_name), students in members.items():
+            for metric, values in (
+                ("study_minutes", [minutes.get(student_id, 0) for student_id in students]),
+                (
+                    "concentration",
+                    [concentrations[student_id] for student_id in students if student_id in concentrations],
+                ),
+                ("completion_rate", [rates[student_id] for student_id in students if student_id in rates]),
+            ):
+                sketch = KLLSketch()
+                sketch.extend(values)
+                rows.append(
+                    ClassMetricSketch(
+                        teacher_id=teacher_id,
+                        class_name=class_name,
+                        metric=metric,
+                        date=day,
+                        sketch=sketch.to_bytes(),
+                        item_count=sketch.count,
+                    )
+                )
+
+        ClassMetricSketch.objects.bulk_create(
+            rows,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["teacher", "class_name", "metric", "date"],
+            update_fields=["sketch", "item_count", "updated_at"],
+        )
+        logger.info(f"Built {len(rows)} class percentile sketches for {day}")
+        return len(rows)
+
+    @classmethod
+    def live_sketches(cls, day: date, classes: Optional[Iterable[ClassKey]] = None) -> List[KLLSketch]:
+        """Sketches of the per-student concentration averages recorded so far on the day."""
+        if classes is None:
+            classes = cls.progress_relations().order_by().values_list("teacher_id", "class_name").distinct()
+        classes = list(classes)
+        pipe = TeacherDashboardService.get_client().pipeline(transaction=False)
+        for teacher_id, class_name in classes:
+            pipe.hgetall(DashboardKeys.concentration_by_student(teacher_id, class_name, day))
+
+        sketches = []
+        for values in pipe.execute():
+            sums: Dict[str, float] = {}
+            counts: Dict[str, float] = {}
+            for field, value in values.items():
+                student_hex, name = field.decode().rsplit(":", 1)
+                (counts if name == "count" else sums)[student_hex] = float(value)
+            sketch = KLLSketch()
+            sketch.extend(sums.get(student_hex, 0.0) / count for student_hex, count in counts.items() if count)
+            sketches.append(sketch)
+        return sketches
+
+    @classmethod
+    def distribution(
+        cls, metric: str, start: date, end: date, classes: Optional[Iterable[ClassKey]] = None
+    ) -> KLLSketch:
+        """Merged sketch of the metric over [start, end] for the given classes (all classes when None)."""
+        today = timezone.localdate()
+        live = metric in LIVE_METRICS and start <= today <= end
+        rows = ClassMetricSketch.objects.filter(metric=metric, date__gte=start, date__lte=end)
+        if live:
+            rows = rows.filter(date__lt=today)
+        if classes is not None:
+            classes = set(classes)
+            if not classes:
+                return KLLSketch()
+            rows = rows.filter(
+                teacher_id__in={teacher_id for teacher_id, _ in classes},
+                class_name__in={class_name for _, class_name in classes},
+            )
+        sketches = [
+            KLLSketch.from_bytes(sketch)
+            for teacher_id, class_name, sketch in rows.values_list("teacher_id", "class_name", "sketch")
+            if classes is None or (teacher_id, class_name) in classes
+        ]
+        if live:
+            sketches.extend(cls.live_sketches(today, classes))
+        return KLLSketch.merged(sketches)
+
+    @staticmethod
+    def summary(sketch: KLLSketch) -> Dict[str, Any]:
+        return {
+            "count": sketch.count,
+            "min": sketch.min_value,
+            "max": sketch.max_value,
+            "quantiles": {
+                f"p{round(fraction * 100)}": value
+                for fraction, value in zip(QUANTILES, sketch.quantiles(QUANTILES))
+            },
+            "rank_error": round(rank_error_bound(sketch.k), 4),
+        }
+
+    @staticmethod
+    def student_value(metric: str, student_id: Any, start: date, end: date) -> Optional[float]:
+        """The student's value comparable with the class distribution over [start, end]."""
+        if metric == "completion_rate":
+            return ClassPercentileService.completion_rates({student_id}, end).get(student_id)
+
+        if metric == "study_minutes":
+            # Daily average, days without study count as 0 like in the class sketches
+            total = DailyUserAnalytics.objects.filter(
+                user_id=student_id, date__gte=start, date__lte=end, is_deleted=False
+            ).aggregate(total=Sum("study_minutes"))["total"]
+            return (total or 0) / ((end - start).days + 1)
+
+        # Mean of the daily averages, over the days with samples like in the class sketches
+        today = timezone.localdate()
+        history = DailyUserAnalytics.objects.filter(
+            user_id=student_id,
+            date__gte=start,
+            date__lte=min(end, today - timedelta(days=1)),
+            concentration_average__isnull=False,
+            is_deleted=False,
+        ).aggregate(total=Sum("concentration_average"), days=Count("id"))
+        total, days = history["total"] or 0.0, history["days"]
+        if start <= today <= end:
+            since = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+            average = ConcentrationLevel.objects.filter(user_id=student_id, timestamp__gte=since).aggregate(
+                average=Avg("level")
+            )["average"]
+            if average is not None:
+                total, days = total + average, days + 1
+        return total / days if days else None
+
+    @classmethod
+    def class_distribution(
+        cls, teacher_id: Any, class_name: str, metric: str, days: int = 7, student_id: Any = None
+    ) -> Dict[str, Any]:
+        """
+        Distribution of a class over the last days, with the student's percentile if given.
+        Live metrics end today, the others yesterday.
+        """
+        end = timezone.localdate()
+        if metric not in LIVE_METRICS:
+            end -= timedelta(days=1)
+        start = end - timedelta(days=days - 1)
+        sketch = cls.distribution(metric, start, end, [(teacher_id, class_name)])
+        result = {"metric": metric, "class_name": class_name, "start": start, "end": end, **cls.summary(sketch)}
+        if student_id is not None:
+            value = cls.student_value(metric, student_id, start, end)
+            result["student"] = {
+                "value": round(value, 2) if value is not None else None,
+                "percentile": round(sketch.rank(value) * 100, 1) if value is not None and sketch.count else None,
+            }
+        return result
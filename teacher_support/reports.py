@@ -0,0 +1,320 @@
+"""
+Weekly teacher reports.
+"""
+
+import csv
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import orjson
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+from accounts.models import StudentTeacherRelation
+from analytics.models import DailyUserAnalytics, EmotionPatternStatistics
+from analytics.patterns import EmotionPatternService
+from core.models import StatusChoices
+from emotions.models import UserEmotionHourlyCount
+from tickets.models import Ticket
+from .models import StudentWeeklyAggregate, WeeklyReport
+import logging
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = (
+    "kind",
+    "class_name",
+    "student_id",
+    "student_name",
+    "students",
+    "active_students",
+    "study_minutes",
+    "session_count",
+    "active_days",
+    "concentration_average",
+    "tickets_completed",
+    "top_emotion",
+    "best_emotion",
+    "valence_concentration_correlation",
+)
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer rows."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class WeeklyReportService:
+    """
+    Weekly reports: per-student summaries and class rollups for every teacher.
+
+    Student aggregates are computed once per student and week from the daily analytics,
+    the hourly emotion counts, completed tickets and the emotion pattern statistics, and
+    stored in StudentWeeklyAggregate, so teachers sharing a student read the same row. A teacher's report only reads those
+    rows and is stored as compressed JSON lines; exports decompress it incrementally and
+    stream it as JSON lines or CSV without building the whole document in memory.
+    """
+
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    @staticmethod
+    def get_setting(name: str, default: Any) -> Any:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @staticmethod
+    def last_week_start(today: Optional[date] = None) -> date:
+        """Monday of the last complete week."""
+        today = today or timezone.localdate()
+        return today - timedelta(days=today.weekday() + 7)
+
+    @staticmethod
+    def active_relations():
+        return StudentTeacherRelation.objects.filter(is_active=True, is_deleted=False)
+
+    @classmethod
+    def compute_student_aggregates(cls, week_start: date, student_ids: Iterable[Any]) -> int:
+        """
+        Compute and upsert the weekly aggregates of students with a constant number of grouped queries.
+        student_ids may be strings (task arguments); they are normalized to UUIDs, the keys of the grouped rows.
+        """
+        student_ids = [uuid.UUID(str(student_id)) for student_id in student_ids]
+        week_end = week_start + timedelta(days=7)
+        start = timezone.make_aware(datetime.combine(week_start, datetime.min.time()))
+        end = start + timedelta(days=7)
+
+        daily = {
+            row["user_id"]: row
+            for row in DailyUserAnalytics.objects.filter(
+                user_id__in=student_ids, date__gte=week_start, date__lt=week_end, is_deleted=False
+            )
+            .order_by()
+            .values("user_id")
+            .annotate(
+                minutes=Sum("study_minutes"),
+                sessions=Sum("session_count"),
+                samples=Sum("concentration_samples"),
+                days=Count("id"),
+            )
+        }
+        # Weighted concentration average over the week
+        concentration_sums: Dict[Any, float] = defaultdict(float)
+        for user_id, average, samples in DailyUserAnalytics.objects.filter(
+            user_id__in=student_ids,
+            date__gte=week_start,
+            date__lt=week_end,
+            concentration_samples__gt=0,
+            is_deleted=False,
+        ).values_list("user_id", "concentration_average", "concentration_samples"):
+            concentration_sums[user_id] += average * samples
+
+        emotions: Dict[Any, Dict[str, int]] = defaultdict(dict)
+        for row in (
+            UserEmotionHourlyCount.objects.filter(user_id__in=student_ids, hour__gte=start, hour__lt=end)
+            .order_by()
+            .values("user_id", "emotion")
+            .annotate(total=Sum("count"))
+        ):
+            if row["total"]:
+                emotions[row["user_id"]][row["emotion"]] = row["total"]
+
+        tickets = dict(
+            Ticket.objects.filter(
+                assignee_id__in=student_ids,
+                status=StatusChoices.COMPLETED,
+                updated_at__gte=start,
+                updated_at__lt=end,
+                is_deleted=False,
+            )
+            .order_by()
+            .values("assignee_id")
+            .annotate(total=Count("id"))
+            .values_list("assignee_id", "total")
+        )
+        patterns = {
+            statistics.user_id: EmotionPatternService.summary(statistics)
+            for statistics in EmotionPatternStatistics.objects.filter(user_id__in=student_ids)
+        }
+
+        aggregates = []
+        for student_id in student_ids:
+            row = daily.get(student_id, {})
+            samples = row.get("samples") or 0
+            aggregates.append(
+                StudentWeeklyAggregate(
+                    user_id=student_id,
+                    week_start=week_start,
+                    study_minutes=row.get("minutes") or 0,
+                    session_count=row.get("sessions") or 0,
+                    active_days=row.get("days", 0),
+                    concentration_average=round(concentration_sums[student_id] / samples, 2) if samples else None,
+                    concentration_samples=samples,
+                    tickets_completed=tickets.get(student_id, 0),
+                    emotion_counts=emotions.get(student_id, {}),
+                    emotion_patterns=patterns.get(student_id, {}),
+                )
+            )
+
+        StudentWeeklyAggregate.objects.bulk_create(
+            aggregates,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["user", "week_start"],
+            update_fields=[
+                "study_minutes",
+                "session_count",
+                "active_days",
+                "concentration_average",
+                "concentration_samples",
+                "tickets_completed",
+                "emotion_counts",
+                "emotion_patterns",
+                "updated_at",
+            ],
+        )
+        return len(aggregates)
+
+    @classmethod
+    def generate_report(cls, teacher_id: Any, week_start: date) -> WeeklyReport:
+        """Build a teacher's report from the shared student aggregates and store it compressed."""
+        relations = (
+            cls.active_relations()
+            .filter(teacher_id=teacher_id)
+            .values_list(
+                "student_id", "student__username", "class_name", "can_view_progress", "can_view_emotions"
+            )
+        )
+        # Several subjects in the same class merge their permissions
+        classes: Dict[str, Dict[Any, Dict[str, Any]]] = defaultdict(dict)
+        for student_id, username, class_name, can_view_progress, can_view_emotions in relations:
+            student = classes[class_name].setdefault(
+                student_id, {"name": username, "progress": False, "emotions": False}
+            )
+            student["progress"] |= can_view_progress
+            student["emotions"] |= can_view_emotions
+
+        student_ids = {student_id for students in classes.values() for student_id in students}
+        aggregates = {
+            aggregate.user_id: aggregate
+            for aggregate in StudentWeeklyAggregate.objects.filter(user_id__in=student_ids, week_start=week_start)
+        }
+        missing = student_ids - aggregates.keys()
+        if missing:
+            # Report requested outside the weekly run
+            cls.compute_student_aggregates(week_start, missing)
+            aggregates.update(
+                (aggregate.user_id, aggregate)
+                for aggregate in StudentWeeklyAggregate.objects.filter(user_id__in=missing, week_start=week_start)
+            )
+
+        lines = []
+        for class_name in sorted(classes):
+            students = classes[class_name]
+            rows = [
+                cls.student_row(class_name, student_id, student, aggregates.get(student_id))
+                for student_id, student in sorted(students.items(), key=lambda item: item[1]["name"])
+            ]
+            lines.extend(rows)
+            lines.append(cls.class_row(class_name, rows))
+
+        payload = b"".join(orjson.dumps(line) + b"\n" for line in lines)
+        report, _ = WeeklyReport.objects.update_or_create(
+            teacher_id=teacher_id,
+            week_start=week_start,
+            defaults={
+                "student_count": len(student_ids),
+                "class_count": len(classes),
+                "artifact": zlib.compress(payload, 6),
+                "artifact_size": len(payload),
+            },
+        )
+        return report
+
+    @staticmethod
+    def student_row(
+        class_name: str, student_id: Any, student: Dict[str, Any], aggregate: Optional[StudentWeeklyAggregate]
+    ) -> Dict[str, Any]:
+        """Per-student line, limited to what the teacher may see."""
+        row = {"kind": "student", "class_name": class_name, "student_id": str(student_id), "student_name": student["name"]}
+        if aggregate is None:
+            return row
+        if student["progress"]:
+            row.update(
+                study_minutes=aggregate.study_minutes,
+                session_count=aggregate.session_count,
+                active_days=aggregate.active_days,
+                concentration_average=aggregate.concentration_average,
+                concentration_samples=aggregate.concentration_samples,
+                tickets_completed=aggregate.tickets_completed,
+            )
+        if student["emotions"] and aggregate.emotion_counts:
+            row["emotion_counts"] = aggregate.emotion_counts
+            row["top_emotion"] = max(aggregate.emotion_counts, key=aggregate.emotion_counts.get)
+        if student["emotions"] and aggregate.emotion_patterns.get("samples"):
+            row["emotion_patterns"] = aggregate.emotion_patterns
+            row["best_emotion"] = aggregate.emotion_patterns["best_emotion"]
+            row["valence_concentration_correlation"] = aggregate.emotion_patterns["correlations"].get(
+                "valence_concentration"
+            )
+        return row
+
+    @staticmethod
+    def class_row(class_name: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Class rollup of the student lines."""
+        progress = [row for row in rows if "study_minutes" in row]
+        samples = sum(row["concentration_samples"] for row in progress)
+        emotion_counts: Dict[str, int] = defaultdict(int)
+        for row in rows:
+            for emotion, count in row.get("emotion_counts", {}).items():
+                emotion_counts[emotion] += count
+
+        return {
+            "kind": "class",
+            "class_name": class_name,
+            "students": len(rows),
+            "active_students": sum(1 for row in progress if row["active_days"]),
+            "study_minutes": sum(row["study_minutes"] for row in progress),
+            "session_count": sum(row["session_count"] for row in progress),
+            "concentration_average": round(
+                sum((row["concentration_average"] or 0) * row["concentration_samples"] for row in progress) / samples, 2
+            )
+            if samples
+            else None,
+            "tickets_completed": sum(row["tickets_completed"] for row in progress),
+            "emotion_counts": dict(emotion_counts),
+            "top_emotion": max(emotion_counts, key=emotion_counts.get) if emotion_counts else None,
+        }
+
+    @classmethod
+    def iter_jsonl(cls, report: WeeklyReport) -> Iterator[bytes]:
+        """Decompress the artifact incrementally, yielding whole JSON lines."""
+        artifact = bytes(report.artifact)
+        decompressor = zlib.decompressobj()
+        buffer = b""
+        for offset in range(0, len(artifact), cls.STREAM_CHUNK_SIZE):
+            buffer += decompressor.decompress(artifact[offset : offset + cls.STREAM_CHUNK_SIZE])
+            complete, _, buffer = buffer.rpartition(b"\n")
+            if complete:
+                yield complete + b"\n"
+        buffer += decompressor.flush()
+        if buffer:
+            yield buffer
+
+    @classmethod
+    def iter_rows(cls, report: WeeklyReport) -> Iterator[Dict[str, Any]]:
+        for chunk in cls.iter_jsonl(report):
+            for line in chunk.splitlines():
+                yield orjson.loads(line)
+
+    @classmethod
+    def iter_csv(cls, report: WeeklyReport) -> Iterator[str]:
+        """CSV rows, one string per row."""
+        writer = csv.DictWriter(Echo(), fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        # BOM so that spreadsheet applications detect UTF-8
+        yield "\ufeff" + writer.writeheader()
+        for row in cls.iter_rows(report):
+            yield writer.writerow(row)
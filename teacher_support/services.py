@@ -0,0 +1,399 @@
+"""
+Teacher support services.
+"""
+
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from django_redis import get_redis_connection
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "intellectual_partner:dashboard"
+DAILY_TTL = 2 * 24 * 60 * 60
+
+# Permission flags stored per teacher/class link
+CAN_VIEW_PROGRESS = "p"
+CAN_VIEW_EMOTIONS = "e"
+# Links hash field marking that a student's links were loaded (kept for students without teachers)
+LINKS_LOADED = "_loaded"
+
+
+def get_inactive_days() -> int:
+    return settings.INTELLECTUAL_PARTNER_SETTINGS.get("TEACHER_DASHBOARD_INACTIVE_DAYS", 3)
+
+
+class DashboardKeys:
+    """Redis keys of the materialized teacher dashboard."""
+
+    @staticmethod
+    def links(student_id: Any) -> str:
+        """Hash: "<teacher_hex>|<class_name>" -> permission flags for every teacher of a student, and LINKS_LOADED."""
+        return f"{KEY_PREFIX}:links:{uuid.UUID(str(student_id)).hex}"
+
+    @staticmethod
+    def classes(teacher_id: Any) -> str:
+        """Set of class names of a teacher."""
+        return f"{KEY_PREFIX}:{uuid.UUID(str(teacher_id)).hex}:classes"
+
+    @staticmethod
+    def roster(teacher_id: Any, class_name: str) -> str:
+        """Set of students of a class."""
+        return f"{KEY_PREFIX}:{uuid.UUID(str(teacher_id)).hex}:{class_name}:roster"
+
+    @staticmethod
+    def active(teacher_id: Any, class_name: str) -> str:
+        """Set of students with a running study session."""
+        return f"{KEY_PREFIX}:{uuid.UUID(str(teacher_id)).hex}:{class_name}:active"
+
+    @staticmethod
+    def last_active(teacher_id: Any, class_name: str) -> str:
+        """Sorted set: student -> last activity (unix time), 0 if never active."""
+        return f"{KEY_PREFIX}:{uuid.UUID(str(teacher_id)).hex}:{class_name}:last_active"
+
+    @staticmethod
+    def daily(teacher_id: Any, class_name: str, date: Any) -> str:
+        """Hash of today's counters: concentration_sum, concentration_count, emotion:<emotion>."""
+        return f"{KEY_PREFIX}:{uuid.UUID(str(teacher_id)).hex}:{class_name}:daily:{date.isoformat()}"
+
+    @staticmethod
+    def concentration_by_student(teacher_id: Any, class_name: str, date: Any) -> str:
+        """Hash of today's per-student concentration: "<student_hex>:sum", "<student_hex>:count"."""
+        return f"{KEY_PREFIX}:{uuid.UUID(str(teacher_id)).hex}:{class_name}:concentration:{date.isoformat()}"
+
+    @staticmethod
+    def status(teacher_id: Any, class_name: str) -> str:
+        """Hash of per-student status: "<student_hex>:<field>" -> value."""
+        return f"{KEY_PREFIX}:{uuid.UUID(str(teacher_id)).hex}:{class_name}:status"
+
+
+class TeacherDashboardService:
+    """
+    Materialized per-teacher/class dashboard state.
+
+    Student events update the Redis state of every class the student belongs to with a
+    constant number of commands per link, in one pipelined round trip, and publish the
+    resulting values to ws/teacher/dashboard/<teacher_id>/. Links are written when relations
+    change (teacher_support.signals); a student whose links are missing from Redis (evicted,
+    flushed, or relations written without signals) has the state of their teachers rebuilt on
+    their next event, so events are never dropped silently. Deltas carry absolute values
+    (new totals), so replaying one that is already reflected in a snapshot is harmless.
+    Concentration and activity require can_view_progress, emotions require can_view_emotions:
+    a teacher's aggregates only ever include data the teacher is allowed to see.
+    """
+
+    @staticmethod
+    def get_client():
+        return get_redis_connection("default")
+
+    @staticmethod
+    def group_name(teacher_id: Any) -> str:
+        return f"teacher_dashboard_{uuid.UUID(str(teacher_id)).hex}"
+
+    @classmethod
+    def get_links(cls, client: Any, student_id: Any) -> List[Tuple[str, str, str]]:
+        """(teacher_hex, class_name, flags) for every teacher of a student."""
+        fields = client.hgetall(DashboardKeys.links(student_id))
+        if not fields:
+            cls.load_links(client, student_id)
+            fields = client.hgetall(DashboardKeys.links(student_id))
+
+        links = []
+        for field, flags in fields.items():
+            field = field.decode()
+            if field == LINKS_LOADED:
+                continue
+            teacher_hex, class_name = field.split("|", 1)
+            links.append((teacher_hex, class_name, flags.decode()))
+        return links
+
+    @classmethod
+    def load_links(cls, client: Any, student_id: Any) -> None:
+        """Rebuild the teachers of a student whose links are missing, then mark the links as loaded."""
+        from accounts.models import StudentTeacherRelation
+
+        teacher_ids = set(
+            StudentTeacherRelation.objects.filter(student_id=student_id, is_active=True, is_deleted=False)
+            .values_list("teacher_id", flat=True)
+        )
+        for teacher_id in teacher_ids:
+            cls.rebuild_teacher(teacher_id)
+        # Students without teachers do not query the relations again on every event
+        client.hsetnx(DashboardKeys.links(student_id), LINKS_LOADED, "")
+
+    @classmethod
+    def rebuild_teacher(cls, teacher_id: Any) -> None:
+        """
+        Rebuild the state of a teacher from StudentTeacherRelation.
+        O(class size); only runs when relations change or the state is missing.
+        """
+        from accounts.models import StudentTeacherRelation
+        from core.models import ConcentrationLevel
+
+        relations = StudentTeacherRelation.objects.filter(teacher_id=teacher_id, is_active=True, is_deleted=False)
+        classes: Dict[str, Dict[Any, str]] = defaultdict(dict)
+        for student_id, class_name, can_view_progress, can_view_emotions in relations.values_list(
+            "student_id", "class_name", "can_view_progress", "can_view_emotions"
+        ):
+            # Several subjects in the same class merge their permissions
+            flags = set(classes[class_name].get(student_id, ""))
+            if can_view_progress:
+                flags.add(CAN_VIEW_PROGRESS)
+            if can_view_emotions:
+                flags.add(CAN_VIEW_EMOTIONS)
+            classes[class_name][student_id] = "".join(sorted(flags))
+
+        student_ids = {student_id for students in classes.values() for student_id in students}
+        last_active = dict(
+            ConcentrationLevel.objects.filter(user_id__in=student_ids)
+            .values("user_id")
+            .annotate(last=Max("timestamp"))
+            .values_list("user_id", "last")
+        )
+
+        client = cls.get_client()
+        teacher_hex = uuid.UUID(str(teacher_id)).hex
+        old_classes = [name.decode() for name in client.smembers(DashboardKeys.classes(teacher_id))]
+
+        old_rosters = {
+            class_name: [student.decode() for student in client.smembers(DashboardKeys.roster(teacher_id, class_name))]
+            for class_name in old_classes
+        }
+        visible = {
+            (class_name, uuid.UUID(str(student_id)).hex)
+            for class_name, students in classes.items()
+            for student_id, flags in students.items()
+            if CAN_VIEW_PROGRESS in flags
+        }
+
+        pipe = client.pipeline(transaction=True)
+        for class_name, roster in old_rosters.items():
+            for student_hex in roster:
+                pipe.hdel(DashboardKeys.links(student_hex), f"{teacher_hex}|{class_name}")
+                # Removed students, or students no longer visible, drop out of the session count
+                if (class_name, student_hex) not in visible:
+                    pipe.srem(DashboardKeys.active(teacher_id, class_name), student_hex)
+            pipe.delete(
+                DashboardKeys.roster(teacher_id, class_name),
+                DashboardKeys.last_active(teacher_id, class_name),
+                DashboardKeys.status(teacher_id, class_name),
+            )
+        pipe.delete(DashboardKeys.classes(teacher_id))
+
+        for class_name, students in classes.items():
+            pipe.sadd(DashboardKeys.classes(teacher_id), class_name)
+            for student_id, flags in students.items():
+                student_hex = uuid.UUID(str(student_id)).hex
+                pipe.hset(DashboardKeys.links(student_id), f"{teacher_hex}|{class_name}", flags)
+                pipe.sadd(DashboardKeys.roster(teacher_id, class_name), student_hex)
+                if CAN_VIEW_PROGRESS in flags:
+                    last = last_active.get(student_id)
+                    pipe.zadd(
+                        DashboardKeys.last_active(teacher_id, class_name),
+                        {student_hex: last.timestamp() if last else 0},
+                    )
+        pipe.execute()
+        logger.info(f"Rebuilt dashboard state for teacher {teacher_id} ({len(student_ids)} students)")
+
+    @classmethod
+    def snapshot(cls, teacher_id: Any) -> Dict[str, Any]:
+        """Full dashboard state of a teacher, sent on connect."""
+        client = cls.get_client()
+        if not client.exists(DashboardKeys.classes(teacher_id)):
+            cls.rebuild_teacher(teacher_id)
+        class_names = sorted(name.decode() for name in client.smembers(DashboardKeys.classes(teacher_id)))
+
+        today = timezone.localdate()
+        cutoff = time.time() - get_inactive_days() * 86400
+        pipe = client.pipeline(transaction=False)
+        for class_name in class_names:
+            pipe.scard(DashboardKeys.roster(teacher_id, class_name))
+            pipe.scard(DashboardKeys.active(teacher_id, class_name))
+            pipe.zcount(DashboardKeys.last_active(teacher_id, class_name), "-inf", cutoff)
+            pipe.hgetall(DashboardKeys.daily(teacher_id, class_name, today))
+            pipe.hgetall(DashboardKeys.status(teacher_id, class_name))
+        results = pipe.execute()
+
+        classes = {}
+        for index, class_name in enumerate(class_names):
+            students, active_sessions, inactive, daily, status = results[index * 5 : index * 5 + 5]
+            daily = {key.decode(): float(value) for key, value in daily.items()}
+            classes[class_name] = {
+                "students": students,
+                "active_sessions": active_sessions,
+                "inactive_students": inactive,
+                "average_concentration_today": cls.average(
+                    daily.get("concentration_sum"), daily.get("concentration_count")
+                ),
+                "emotions_today": {
+                    key.split(":", 1)[1]: int(value) for key, value in daily.items() if key.startswith("emotion:")
+                },
+                "student_status": cls.parse_status(status),
+            }
+        return {"classes": classes}
+
+    @staticmethod
+    def average(total: Optional[float], count: Optional[float]) -> Optional[float]:
+        return round(float(total) / float(count), 2) if count else None
+
+    @staticmethod
+    def parse_status(status: Dict[bytes, bytes]) -> Dict[str, Dict[str, Any]]:
+        students: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        for field, value in status.items():
+            student_hex, name = field.decode().split(":", 1)
+            students[student_hex][name] = orjson.loads(value)
+        return dict(students)
+
+    @classmethod
+    def apply_event(
+        cls,
+        student_id: Any,
+        permission: str,
+        update: Any,
+    ) -> None:
+        """
+        Apply one student event to every class the student belongs to.
+
+        ``update(pipe, teacher_hex, class_name)`` queues the commands of one link and returns
+        a function turning that link's pipeline results into (changed aggregates, student status).
+        """
+        client = cls.get_client()
+        links = [link for link in cls.get_links(client, student_id) if permission in link[2]]
+        if not links:
+            return
+
+        pipe = client.pipeline(transaction=False)
+        readers = []
+        for teacher_hex, class_name, _ in links:
+            start = len(pipe.command_stack)
+            reader = update(pipe, teacher_hex, class_name)
+            readers.append((teacher_hex, class_name, start, len(pipe.command_stack), reader))
+        results = pipe.execute()
+
+        student_hex = uuid.UUID(str(student_id)).hex
+        deltas = []
+        for teacher_hex, class_name, start, end, reader in readers:
+            changed, status = reader(results[start:end])
+            deltas.append(
+                (
+                    teacher_hex,
+                    {
+                        "type": "dashboard.delta",
+                        "class_name": class_name,
+                        "changed": changed,
+                        "student_status": {student_hex: status},
+                    },
+                )
+            )
+        cls.publish(deltas)
+
+    @classmethod
+    def record_concentration(cls, student_id: Any, level: int, at: Optional[datetime] = None) -> None:
+        at = at or timezone.now()
+        student_hex = uuid.UUID(str(student_id)).hex
+        status = {"last_concentration": level, "last_active_at": at.isoformat()}
+        cutoff = time.time() - get_inactive_days() * 86400
+
+        def update(pipe, teacher_hex, class_name):
+            daily = DashboardKeys.daily(teacher_hex, class_name, timezone.localdate(at))
+            pipe.hincrbyfloat(daily, "concentration_sum", level)
+            pipe.hincrby(daily, "concentration_count", 1)
+            pipe.expire(daily, DAILY_TTL)
+            pipe.zadd(DashboardKeys.last_active(teacher_hex, class_name), {student_hex: at.timestamp()})
+            pipe.zcount(DashboardKeys.last_active(teacher_hex, class_name), "-inf", cutoff)
+            # Intraday per-student averages of the class percentiles (teacher_support.percentiles)
+            by_student = DashboardKeys.concentration_by_student(teacher_hex, class_name, timezone.localdate(at))
+            pipe.hincrbyfloat(by_student, f"{student_hex}:sum", level)
+            pipe.hincrby(by_student, f"{student_hex}:count", 1)
+            pipe.expire(by_student, DAILY_TTL)
+            cls.queue_status(pipe, teacher_hex, class_name, student_hex, status)
+
+            def read(results):
+                total, count, _, _, inactive = results[:5]
+                return {
+                    "average_concentration_today": cls.average(total, count),
+                    "inactive_students": inactive,
+                }, status
+
+            return read
+
+        cls.apply_event(student_id, CAN_VIEW_PROGRESS, update)
+
+    @classmethod
+    def record_session(cls, student_id: Any, active: bool, at: Optional[datetime] = None) -> None:
+        """A study session of the student started (active=True) or ended."""
+        at = at or timezone.now()
+        student_hex = uuid.UUID(str(student_id)).hex
+        status = {"in_session": active, "last_active_at": at.isoformat()}
+        cutoff = time.time() - get_inactive_days() * 86400
+
+        def update(pipe, teacher_hex, class_name):
+            active_key = DashboardKeys.active(teacher_hex, class_name)
+            if active:
+                pipe.sadd(active_key, student_hex)
+            else:
+                pipe.srem(active_key, student_hex)
+            pipe.scard(active_key)
+            pipe.zadd(DashboardKeys.last_active(teacher_hex, class_name), {student_hex: at.timestamp()})
+            pipe.zcount(DashboardKeys.last_active(teacher_hex, class_name), "-inf", cutoff)
+            cls.queue_status(pipe, teacher_hex, class_name, student_hex, status)
+
+            def read(results):
+                _, active_sessions, _, inactive = results[:4]
+                return {"active_sessions": active_sessions, "inactive_students": inactive}, status
+
+            return read
+
+        cls.apply_event(student_id, CAN_VIEW_PROGRESS, update)
+
+    @classmethod
+    def record_emotion(cls, student_id: Any, emotion: str, at: Optional[datetime] = None) -> None:
+        at = at or timezone.now()
+        student_hex = uuid.UUID(str(student_id)).hex
+        status = {"last_emotion": emotion}
+
+        def update(pipe, teacher_hex, class_name):
+            daily = DashboardKeys.daily(teacher_hex, class_name, timezone.localdate(at))
+            pipe.hincrby(daily, f"emotion:{emotion}", 1)
+            pipe.expire(daily, DAILY_TTL)
+            cls.queue_status(pipe, teacher_hex, class_name, student_hex, status)
+
+            def read(results):
+                # Partial: clients merge emotions_today key by key
+                return {"emotions_today": {emotion: results[0]}}, status
+
+            return read
+
+        cls.apply_event(student_id, CAN_VIEW_EMOTIONS, update)
+
+    @staticmethod
+    def queue_status(pipe: Any, teacher_hex: str, class_name: str, student_hex: str, status: Dict[str, Any]) -> None:
+        pipe.hset(
+            DashboardKeys.status(teacher_hex, class_name),
+            mapping={f"{student_hex}:{name}": orjson.dumps(value) for name, value in status.items()},
+        )
+
+    @classmethod
+    def publish(cls, deltas: List[Tuple[str, Dict[str, Any]]]) -> None:
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+
+        async def send():
+            for teacher_hex, delta in deltas:
+                await channel_layer.group_send(cls.group_name(teacher_hex), delta)
+
+        try:
+            async_to_sync(send)()
+        except Exception as e:
+            logger.warning(f"Failed to publish dashboard deltas: {e}")
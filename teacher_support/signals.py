@@ -0,0 +1,54 @@
+"""
+Teacher support signals.
+Keeps the materialized teacher dashboard (teacher_support.services) up to date.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from accounts.models import StudentTeacherRelation
+from core.models import ConcentrationLevel
+from core.signals import study_session_ended, study_session_started
+from emotions.models import EmotionLog
+from .services import TeacherDashboardService
+
+
+def is_enabled():
+    return settings.INTELLECTUAL_PARTNER_SETTINGS.get("ENABLE_TEACHER_SUPPORT", True)
+
+
+@receiver(post_save, sender=StudentTeacherRelation)
+@receiver(post_delete, sender=StudentTeacherRelation)
+def rebuild_teacher_dashboard(sender, instance, **kwargs):
+    """Relations and permissions changed: rebuild the teacher's classes."""
+    if is_enabled():
+        transaction.on_commit(lambda: TeacherDashboardService.rebuild_teacher(instance.teacher_id))
+
+
+@receiver(post_save, sender=ConcentrationLevel)
+def update_dashboard_concentration(sender, instance, created, **kwargs):
+    if created and is_enabled():
+        transaction.on_commit(
+            lambda: TeacherDashboardService.record_concentration(instance.user_id, instance.level, instance.timestamp)
+        )
+
+
+@receiver(post_save, sender=EmotionLog)
+def update_dashboard_emotion(sender, instance, created, **kwargs):
+    if created and is_enabled():
+        transaction.on_commit(
+            lambda: TeacherDashboardService.record_emotion(instance.user_id, instance.emotion, instance.created_at)
+        )
+
+
+@receiver(study_session_started)
+def update_dashboard_session_started(sender, user_id, session_id, **kwargs):
+    if is_enabled():
+        TeacherDashboardService.record_session(user_id, active=True)
+
+
+@receiver(study_session_ended)
+def update_dashboard_session_ended(sender, user_id, session_id, **kwargs):
+    if is_enabled():
+        TeacherDashboardService.record_session(user_id, active=False)
@@ -0,0 +1,67 @@
+"""
+Celery tasks for teacher support.
+"""
+
+from datetime import date, timedelta
+
+from celery import chord, group, shared_task
+from django.utils import timezone
+from .percentiles import ClassPercentileService
+from .reports import WeeklyReportService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_weekly_reports(week_start=None):
+    """
+    Weekly reports of the last complete week (weekly beat job).
+    Student aggregates are computed once in parallel chunks, then one task per teacher builds its report.
+    """
+    week_start = week_start or WeeklyReportService.last_week_start().isoformat()
+    chunk_size = WeeklyReportService.get_setting("WEEKLY_REPORT_STUDENT_CHUNK_SIZE", 500)
+    student_ids = [
+        str(student_id)
+        for student_id in WeeklyReportService.active_relations()
+        .order_by("student_id")
+        .values_list("student_id", flat=True)
+        .distinct()
+    ]
+    if not student_ids:
+        return {"week_start": week_start, "students": 0}
+
+    chord(
+        compute_student_weekly_aggregates.s(week_start, student_ids[start : start + chunk_size])
+        for start in range(0, len(student_ids), chunk_size)
+    )(dispatch_teacher_weekly_reports.si(week_start))
+    return {"week_start": week_start, "students": len(student_ids)}
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def compute_student_weekly_aggregates(week_start, student_ids):
+    return WeeklyReportService.compute_student_aggregates(date.fromisoformat(week_start), student_ids)
+
+
+@shared_task
+def dispatch_teacher_weekly_reports(week_start):
+    teacher_ids = (
+        WeeklyReportService.active_relations().order_by("teacher_id").values_list("teacher_id", flat=True).distinct()
+    )
+    reports = group(generate_teacher_weekly_report.s(str(teacher_id), week_start) for teacher_id in teacher_ids)
+    reports.apply_async()
+    logger.info(f"Dispatched {len(reports.tasks)} weekly reports for {week_start}")
+    return len(reports.tasks)
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def generate_teacher_weekly_report(teacher_id, week_start):
+    report = WeeklyReportService.generate_report(teacher_id, date.fromisoformat(week_start))
+    return {"report_id": str(report.id), "students": report.student_count, "bytes": len(report.artifact)}
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def build_class_percentile_sketches(day=None):
+    """Class distributions of the daily metrics (daily beat job, yesterday by default, after the daily analytics)."""
+    day = day or (timezone.localdate() - timedelta(days=1)).isoformat()
+    return ClassPercentileService.build_daily(date.fromisoformat(day))
@@ -1,3 +1,200 @@
+import uuid
+from datetime import datetime, timedelta
+
+from celery import current_app
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import StudentTeacherRelation
+from analytics.models import DailyUserAnalytics, EmotionPatternStatistics
+from core.models import ConcentrationLevel, StatusChoices
+from emotions.models import UserEmotionHourlyCount
+from tickets.models import Ticket
+
+from .models import StudentWeeklyAggregate, WeeklyReport
+from .percentiles import ClassPercentileService
+from .reports import WeeklyReportService
+from .services import DashboardKeys, TeacherDashboardService
+from .tasks import generate_weekly_reports
+
+User = get_user_model()
+
+
+class WeeklyReportTaskTests(TestCase):
+    """The scheduled chord passes student ids as strings."""
+
+    def setUp(self):
+        always_eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, "task_always_eager", always_eager)
+
+        self.week_start = WeeklyReportService.last_week_start()
+        monday = timezone.make_aware(datetime.combine(self.week_start, datetime.min.time()))
+        self.teacher = User.objects.create(username="teacher", email="teacher@example.com", is_teacher=True)
+        self.student = User.objects.create(username="student", email="student@example.com", is_student=True)
+        StudentTeacherRelation.objects.create(
+            teacher=self.teacher, student=self.student, class_name="1-A", can_view_progress=True, can_view_emotions=True
+        )
+        DailyUserAnalytics.objects.create(
+            user=self.student,
+            date=self.week_start,
+            study_minutes=90,
+            session_count=2,
+            concentration_average=7.0,
+            concentration_samples=4,
+        )
+        ticket = Ticket.objects.create(
+            title="課題", creator=self.teacher, assignee=self.student, status=StatusChoices.COMPLETED
+        )
+        Ticket.objects.filter(pk=ticket.pk).update(updated_at=monday + timedelta(hours=10))
+        UserEmotionHourlyCount.objects.create(
+            user=self.student, hour=monday + timedelta(hours=9), emotion="happy", count=3
+        )
+
+    def test_scheduled_run_aggregates_string_ids(self):
+        generate_weekly_reports.delay(self.week_start.isoformat())
+
+        aggregate = StudentWeeklyAggregate.objects.get(user=self.student, week_start=self.week_start)
+        self.assertEqual(aggregate.study_minutes, 90)
+        self.assertEqual(aggregate.session_count, 2)
+        self.assertEqual(aggregate.concentration_average, 7.0)
+        self.assertEqual(aggregate.tickets_completed, 1)
+        self.assertEqual(aggregate.emotion_counts, {"happy": 3})
+
+        report = WeeklyReport.objects.get(teacher=self.teacher, week_start=self.week_start)
+        student_row, class_row = list(WeeklyReportService.iter_rows(report))
+        self.assertEqual(student_row["study_minutes"], 90)
+        self.assertEqual(student_row["top_emotion"], "happy")
+        self.assertEqual(class_row["active_students"], 1)
+        self.assertEqual(class_row["tickets_completed"], 1)
+
+    def test_compute_accepts_string_and_uuid_ids(self):
+        WeeklyReportService.compute_student_aggregates(self.week_start, [str(self.student.id)])
+        by_string = StudentWeeklyAggregate.objects.get(user=self.student).study_minutes
+        WeeklyReportService.compute_student_aggregates(self.week_start, [self.student.id])
+        self.assertEqual(by_string, StudentWeeklyAggregate.objects.get(user=self.student).study_minutes)
+        self.assertEqual(by_string, 90)
+
+    def test_report_includes_emotion_patterns(self):
+        EmotionPatternStatistics.objects.create(
+            user=self.student,
+            sample_count=12,
+            means=[0.5, 6.0, 0.25],
+            comoments=[[9.0, 6.0, 0.0], [6.0, 16.0, 1.0], [0.0, 1.0, 2.0]],
+            emotion_stats={"happy": [12, 84.0, 3.0]},
+        )
+        generate_weekly_reports.delay(self.week_start.isoformat())
+
+        aggregate = StudentWeeklyAggregate.objects.get(user=self.student, week_start=self.week_start)
+        self.assertEqual(aggregate.emotion_patterns["samples"], 12)
+        report = WeeklyReport.objects.get(teacher=self.teacher, week_start=self.week_start)
+        student_row = next(WeeklyReportService.iter_rows(report))
+        self.assertEqual(student_row["best_emotion"], "happy")
+        self.assertEqual(student_row["valence_concentration_correlation"], 0.5)
+
+
+class ClassPercentileServiceTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(username="teacher", email="teacher@example.com", is_teacher=True)
+        self.students = [
+            User.objects.create(username=f"student{index}", email=f"student{index}@example.com") for index in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            for student in self.students:
+                StudentTeacherRelation.objects.create(
+                    teacher=self.teacher, student=student, class_name="1-A", can_view_progress=True
+                )
+
+    def record(self, student, *levels):
+        with self.captureOnCommitCallbacks(execute=True):
+            for level in levels:
+                ConcentrationLevel.objects.create(user=student, level=level, session_id=uuid.uuid4())
+
+    def test_todays_concentration_is_live(self):
+        self.record(self.students[0], 2, 4, 6)
+        self.record(self.students[1], 8)
+
+        result = ClassPercentileService.class_distribution(
+            self.teacher.id, "1-A", "concentration", days=1, student_id=self.students[0].id
+        )
+        self.assertEqual(result["end"], timezone.localdate())
+        # One item per student: the averages 4 and 8
+        self.assertEqual(result["count"], 2)
+        self.assertEqual((result["min"], result["max"]), (4.0, 8.0))
+        self.assertEqual(result["student"]["value"], 4.0)
+        self.assertEqual(result["student"]["percentile"], 50.0)
+
+    def test_live_day_merges_with_built_days(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        DailyUserAnalytics.objects.create(
+            user=self.students[2], date=yesterday, concentration_average=6.0, concentration_samples=2
+        )
+        ClassPercentileService.build_daily(yesterday)
+        self.record(self.students[2], 10)
+
+        result = ClassPercentileService.class_distribution(
+            self.teacher.id, "1-A", "concentration", days=2, student_id=self.students[2].id
+        )
+        self.assertEqual(result["count"], 2)
+        self.assertEqual(result["student"]["value"], 8.0)
+
+    def test_completion_rate_as_of_day(self):
+        today = timezone.localdate()
+        now = timezone.now()
+        student = self.students[0]
+        early, late = (
+            Ticket.objects.create(title=title, creator=self.teacher, assignee=student, status=StatusChoices.COMPLETED)
+            for title in ("早い", "遅い")
+        )
+        Ticket.objects.filter(pk=early.pk).update(
+            created_at=now - timedelta(days=5), updated_at=now - timedelta(days=4)
+        )
+        Ticket.objects.filter(pk=late.pk).update(created_at=now - timedelta(days=5), updated_at=now)
+
+        rates = ClassPercentileService.completion_rates
+        self.assertEqual(rates({student.id}, today - timedelta(days=6)), {})
+        self.assertEqual(rates({student.id}, today - timedelta(days=3)), {student.id: 0.5})
+        self.assertEqual(rates({student.id}, today), {student.id: 1.0})
+
+
+class TeacherDashboardServiceTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(username="teacher", email="teacher@example.com", is_teacher=True)
+        self.student = User.objects.create(username="student", email="student@example.com", is_student=True)
+        self.redis = TeacherDashboardService.get_client()
+
+    def relate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentTeacherRelation.objects.create(
+                teacher=self.teacher, student=self.student, class_name="1-A", can_view_progress=True
+            )
+
+    def concentration_today(self):
+        daily = self.redis.hgetall(DashboardKeys.daily(self.teacher.id, "1-A", timezone.localdate()))
+        return TeacherDashboardService.average(daily.get(b"concentration_sum"), daily.get(b"concentration_count"))
+
+    def test_relation_creation_fills_links(self):
+        self.relate()
+        links = TeacherDashboardService.get_links(self.redis, self.student.id)
+        self.assertEqual(links, [(self.teacher.pk.hex, "1-A", "p")])
+
+    def test_missing_links_are_rebuilt_on_the_next_event(self):
+        self.relate()
+        # Evicted, or relations written without signals
+        self.redis.delete(DashboardKeys.links(self.student.id), DashboardKeys.classes(self.teacher.id))
+
+        TeacherDashboardService.record_concentration(self.student.id, 6)
+        self.assertEqual(self.concentration_today(), 6.0)
+        self.assertTrue(self.redis.exists(DashboardKeys.classes(self.teacher.id)))
+
+    def test_students_without_teachers_query_once(self):
+        with self.assertNumQueries(1):
+            TeacherDashboardService.record_concentration(self.student.id, 6)
+        with self.assertNumQueries(0):
+            TeacherDashboardService.record_concentration(self.student.id, 7)
 
-# Create your tests here.
+        # A new relation still takes effect
+        self.relate()
+        TeacherDashboardService.record_concentration(self.student.id, 8)
+        self.assertEqual(self.concentration_today(), 8.0)
@@ -1,3 +1,71 @@
+"""
+Tickets models for the intellectual partner application.
+"""
+
 from django.db import models
+from django.contrib.auth import get_user_model
+from django.core.validators import MinValueValidator, MaxValueValidator
+from core.models import BaseModel, UserRelatedModel, StatusChoices
+
+User = get_user_model()
+
+
+class Ticket(BaseModel):
+    """
+    Unit of study work assigned to a learner.
+    """
+
+    title = models.CharField(max_length=200, verbose_name="タイトル")
+    content = models.TextField(blank=True, verbose_name="内容")
+    estimated_time = models.IntegerField(
+        default=25, validators=[MinValueValidator(1)], verbose_name="見積時間(分)"
+    )
+    deadline = models.DateTimeField(null=True, blank=True, verbose_name="期限")
+    status = models.CharField(
+        max_length=20, choices=StatusChoices.choices, default=StatusChoices.NOT_STARTED, verbose_name="ステータス"
+    )
+    creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name="created_tickets", verbose_name="作成者")
+    assignee = models.ForeignKey(User, on_delete=models.CASCADE, related_name="assigned_tickets", verbose_name="担当者")
+    difficulty_level = models.IntegerField(
+        choices=[(i, i) for i in range(1, 6)], default=3, verbose_name="難易度"
+    )
+    optimal_emotions = models.JSONField(default=list, blank=True, verbose_name="最適な感情状態")
+    success_patterns = models.JSONField(default=dict, blank=True, verbose_name="成功パターン")
+    # Set with queryset.update() (auto_now is untouched): flagged again only after a new update goes stale
+    last_flagged_at = models.DateTimeField(null=True, blank=True, verbose_name="放置検出日時")
+
+    class Meta:
+        verbose_name = "チケット"
+        verbose_name_plural = "チケット"
+        ordering = ["-created_at"]
+        indexes = [
+            # Abandoned ticket detection (tickets.services.AbandonedTicketDetector)
+            models.Index(fields=["status", "updated_at"], name="ticket_status_updated_idx"),
+            models.Index(fields=["assignee", "status"], name="ticket_assignee_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.get_status_display()})"
+
+
+class RecoveryPlan(UserRelatedModel):
+    """
+    Recovery suggestion created by the adaptive recovery system.
+    """
+
+    ticket = models.ForeignKey(
+        Ticket, on_delete=models.CASCADE, null=True, blank=True, related_name="recovery_plans", verbose_name="チケット"
+    )
+    trigger_condition = models.CharField(max_length=100, verbose_name="トリガー条件")  # "7day_inactive"
+    plan_type = models.CharField(max_length=50, verbose_name="プラン種別")  # "ticket_breakdown"
+    suggestions = models.JSONField(default=dict, verbose_name="提案内容")
+    is_accepted = models.BooleanField(default=False, verbose_name="採用済み")
+    effectiveness_score = models.FloatField(null=True, blank=True, verbose_name="効果スコア")
+
+    class Meta:
+        verbose_name = "リカバリープラン"
+        verbose_name_plural = "リカバリープラン"
+        ordering = ["-created_at"]
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.user_id} - {self.plan_type} ({self.trigger_condition})"
@@ -0,0 +1,157 @@
+"""
+Ticket services.
+"""
+
+import math
+import time
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from core.constants import DEFAULT_SESSION_DURATION
+from core.models import StatusChoices
+from core.scheduling import UserSlotSpreader
+from notifications.models import Notification
+from notifications.services import NotificationFanoutService
+from .models import RecoveryPlan, Ticket
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AbandonedTicketDetector:
+    """
+    Flags tickets untouched for ABANDONED_TICKET_DAYS days and suggests a breakdown.
+
+    Set-based: candidate ids are streamed from the (status, updated_at) index with
+    iterator(chunk_size=...), and each chunk is claimed, marked, given recovery plans and
+    notifications with a constant number of queries. Idempotent through last_flagged_at:
+    a ticket is flagged again only if it was updated after its last flag and went stale again.
+    A run stops after ABANDONED_TICKET_TIME_BUDGET seconds and reports that work remains,
+    so it always finishes within the Celery time limit; the next run continues.
+    Notifications are held until each assignee's slot within ABANDONED_TICKET_DELIVERY_WINDOW
+    (UserSlotSpreader), so the daily run does not reach every user at the same second.
+    """
+
+    TRIGGER_CONDITION = "7day_inactive"
+    PLAN_TYPE = "ticket_breakdown"
+    OPEN_STATUSES = (StatusChoices.NOT_STARTED, StatusChoices.IN_PROGRESS)
+
+    @staticmethod
+    def get_setting(name: str, default: Any) -> Any:
+        return settings.INTELLECTUAL_PARTNER_SETTINGS.get(name, default)
+
+    @classmethod
+    def candidates(cls, cutoff):
+        """Stale, open tickets not flagged since their last update."""
+        return Ticket.objects.filter(
+            status__in=cls.OPEN_STATUSES,
+            updated_at__lt=cutoff,
+            is_deleted=False,
+        ).filter(Q(last_flagged_at__isnull=True) | Q(last_flagged_at__lt=F("updated_at")))
+
+    @classmethod
+    def run(cls, now=None) -> Dict[str, Any]:
+        now = now or timezone.now()
+        cutoff = now - timedelta(days=cls.get_setting("ABANDONED_TICKET_DAYS", 7))
+        chunk_size = cls.get_setting("ABANDONED_TICKET_CHUNK_SIZE", 2000)
+        time_budget = cls.get_setting("ABANDONED_TICKET_TIME_BUDGET", 480)
+
+        started = time.monotonic()
+        flagged = 0
+        completed = True
+        ids = cls.candidates(cutoff).order_by().values_list("id", flat=True).iterator(chunk_size=chunk_size)
+
+        while True:
+            chunk = list(islice(ids, chunk_size))
+            if not chunk:
+                break
+            flagged += cls.flag_chunk(chunk, cutoff, now)
+            if time.monotonic() - started > time_budget:
+                completed = False
+                break
+
+        logger.info(f"Flagged {flagged} abandoned tickets in {time.monotonic() - started:.1f}s (completed={completed})")
+        return {"flagged": flagged, "completed": completed}
+
+    @classmethod
+    def flag_chunk(cls, ids: List[Any], cutoff, now) -> int:
+        with transaction.atomic():
+            # Re-check under lock: concurrent runs and fresh updates are skipped
+            tickets = list(
+                cls.candidates(cutoff)
+                .filter(id__in=ids)
+                .select_for_update(skip_locked=True)
+                .only("id", "title", "estimated_time", "assignee_id")
+            )
+            if not tickets:
+                return 0
+
+            Ticket.objects.filter(id__in=[ticket.id for ticket in tickets]).update(last_flagged_at=now)
+            RecoveryPlan.objects.bulk_create(
+                [
+                    RecoveryPlan(
+                        user_id=ticket.assignee_id,
+                        ticket_id=ticket.id,
+                        trigger_condition=cls.TRIGGER_CONDITION,
+                        plan_type=cls.PLAN_TYPE,
+                        suggestions=cls.breakdown_suggestions(ticket),
+                    )
+                    for ticket in tickets
+                ],
+                batch_size=len(tickets),
+            )
+            NotificationFanoutService.create_batch(cls.build_notifications(tickets, now))
+        return len(tickets)
+
+    @staticmethod
+    def breakdown_suggestions(ticket: Ticket) -> Dict[str, Any]:
+        """Split the ticket into session-sized steps."""
+        estimated = max(ticket.estimated_time or DEFAULT_SESSION_DURATION, 1)
+        parts = max(2, math.ceil(estimated / DEFAULT_SESSION_DURATION))
+        minutes = max(1, math.ceil(estimated / parts))
+        return {
+            "ticket_id": str(ticket.id),
+            "message": f"「{ticket.title}」を{parts}つの小さなステップに分けてみましょう。",
+            "steps": [
+                {"title": f"{ticket.title} ({index}/{parts})", "estimated_time": minutes}
+                for index in range(1, parts + 1)
+            ],
+        }
+
+    @classmethod
+    def delivery_spreader(cls) -> UserSlotSpreader:
+        window = cls.get_setting("ABANDONED_TICKET_DELIVERY_WINDOW", 3600)
+        # Pending notifications are flushed every minute: one slot per minute
+        return UserSlotSpreader(window=window, slots=window // 60, salt=cls.TRIGGER_CONDITION)
+
+    @classmethod
+    def build_notifications(cls, tickets: List[Ticket], now=None) -> List[Notification]:
+        """One notification per assignee and chunk, held until the assignee's delivery slot."""
+        now = now or timezone.now()
+        days = cls.get_setting("ABANDONED_TICKET_DAYS", 7)
+        spreader = cls.delivery_spreader()
+        by_user: Dict[Any, List[Ticket]] = defaultdict(list)
+        for ticket in tickets:
+            by_user[ticket.assignee_id].append(ticket)
+
+        notifications = []
+        for user_id, user_tickets in by_user.items():
+            first = user_tickets[0].title
+            others = f"ほか{len(user_tickets) - 1}件" if len(user_tickets) > 1 else ""
+            notifications.append(
+                Notification(
+                    user_id=user_id,
+                    title="チケットを細分化してみませんか？",
+                    message=f"「{first}」{others}が{days}日間更新されていません。小さなステップに分ける提案を用意しました。",
+                    type="recovery",
+                    data={"ticket_ids": [str(ticket.id) for ticket in user_tickets]},
+                    delivery_claimed_until=now + timedelta(seconds=spreader.offset(user_id)),
+                )
+            )
+        return notifications
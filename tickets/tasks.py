@@ -0,0 +1,19 @@
+"""
+Celery tasks for tickets.
+"""
+
+from celery import shared_task
+from .services import AbandonedTicketDetector
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def detect_abandoned_tickets():
+    """Flag tickets untouched for 7 days and suggest a breakdown (daily beat job)."""
+    result = AbandonedTicketDetector.run()
+    if not result["completed"]:
+        # Time budget exhausted: continue in a fresh task, already flagged tickets are skipped
+        detect_abandoned_tickets.delay()
+    return result
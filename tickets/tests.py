@@ -1,3 +1,104 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from notifications.models import Notification
+from notifications.services import NotificationFanoutService
+
+from .models import RecoveryPlan, Ticket
+from .services import AbandonedTicketDetector
+
+User = get_user_model()
+
+
+class AbandonedTicketDetectorTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.users = [
+            User.objects.create(username=f"user{index}", email=f"user{index}@example.com") for index in range(20)
+        ]
+        for user in self.users:
+            for title in ("レポート", "問題集"):
+                ticket = Ticket.objects.create(title=title, creator=user, assignee=user, estimated_time=60)
+                Ticket.objects.filter(pk=ticket.pk).update(updated_at=self.now - timedelta(days=8))
+
+    def test_flags_once_per_stale_update(self):
+        self.assertEqual(AbandonedTicketDetector.run(self.now), {"flagged": 40, "completed": True})
+        self.assertEqual(RecoveryPlan.objects.count(), 40)
+        self.assertEqual(AbandonedTicketDetector.run(self.now)["flagged"], 0)
+        # One notification per assignee
+        self.assertEqual(Notification.objects.filter(type="recovery").count(), 20)
+
+    def test_notifications_are_spread_over_the_delivery_window(self):
+        AbandonedTicketDetector.run(self.now)
+        held = {n.user_id: n.delivery_claimed_until for n in Notification.objects.filter(type="recovery")}
+        spreader = AbandonedTicketDetector.delivery_spreader()
+
+        for user_id, until in held.items():
+            self.assertEqual(until, self.now + timedelta(seconds=spreader.offset(user_id)))
+            self.assertLess(until, self.now + timedelta(hours=1))
+        self.assertGreater(len(set(held.values())), 10)
+
+    def test_held_notifications_are_delivered_in_their_slot(self):
+        AbandonedTicketDetector.run(self.now)
+        due = min(Notification.objects.values_list("delivery_claimed_until", flat=True))
+
+        with mock.patch("notifications.services.get_channel_layer", return_value=mock.AsyncMock()):
+            with mock.patch("notifications.services.timezone.now", return_value=due + timedelta(seconds=1)):
+                sent = NotificationFanoutService.flush_pending()
+
+        delivered = Notification.objects.filter(delivered_at__isnull=False)
+        self.assertEqual(sent, delivered.count())
+        self.assertEqual(set(delivered.values_list("delivery_claimed_until", flat=True)), {None})
+        self.assertTrue(Notification.objects.filter(delivered_at__isnull=True).exists())
+
+
+def with_settings(**values):
+    return override_settings(INTELLECTUAL_PARTNER_SETTINGS={**settings.INTELLECTUAL_PARTNER_SETTINGS, **values})
+
+
+class AbandonedTicketRunTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.user = User.objects.create(username="learner", email="learner@example.com")
+
+    def create_ticket(self, days_idle, **fields):
+        ticket = Ticket.objects.create(title="課題", creator=self.user, assignee=self.user, **fields)
+        Ticket.objects.filter(pk=ticket.pk).update(updated_at=self.now - timedelta(days=days_idle))
+        return ticket
+
+    def test_only_stale_open_tickets_are_flagged(self):
+        stale = self.create_ticket(8)
+        self.create_ticket(3)
+        self.create_ticket(8, status="completed")
+        self.create_ticket(8, is_deleted=True)
+
+        self.assertEqual(AbandonedTicketDetector.run(self.now)["flagged"], 1)
+        self.assertEqual(list(RecoveryPlan.objects.values_list("ticket_id", flat=True)), [stale.id])
+
+    def test_exhausted_budget_resumes_where_it_stopped(self):
+        for _ in range(5):
+            self.create_ticket(8)
+        with with_settings(ABANDONED_TICKET_CHUNK_SIZE=2, ABANDONED_TICKET_TIME_BUDGET=-1):
+            self.assertEqual(AbandonedTicketDetector.run(self.now), {"flagged": 2, "completed": False})
+            self.assertEqual(AbandonedTicketDetector.run(self.now), {"flagged": 2, "completed": False})
+            self.assertEqual(AbandonedTicketDetector.run(self.now), {"flagged": 1, "completed": False})
+            self.assertEqual(AbandonedTicketDetector.run(self.now), {"flagged": 0, "completed": True})
+        self.assertEqual(RecoveryPlan.objects.count(), 5)
+
+    def test_updated_tickets_are_flagged_again_once_stale(self):
+        ticket = self.create_ticket(8)
+        AbandonedTicketDetector.run(self.now - timedelta(days=1))
+        Ticket.objects.filter(pk=ticket.pk).update(updated_at=self.now - timedelta(days=1, hours=-1))
+        self.assertEqual(AbandonedTicketDetector.run(self.now)["flagged"], 0)
+        self.assertEqual(AbandonedTicketDetector.run(self.now + timedelta(days=7))["flagged"], 1)
+
+    def test_breakdown_fits_sessions(self):
+        ticket = self.create_ticket(8, estimated_time=100)
+        suggestions = AbandonedTicketDetector.breakdown_suggestions(ticket)
+        self.assertEqual(len(suggestions["steps"]), 4)
+        self.assertEqual({step["estimated_time"] for step in suggestions["steps"]}, {25})